@@ -2,13 +2,12 @@ from PyQt5.QtWidgets import QApplication
 from PyQt5.QtQml import QQmlApplicationEngine
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QVariant, QThread
 from PyQt5.QtGui import QIcon
-from models import models
+from models import models, jacobian, engine, telemetry, cache, readers, plots
+from models.ragged import RaggedSpectra
 import pandas as pd
 import numpy as np
 import copy
 import os, random
-from scipy.optimize import least_squares, leastsq, minimize, differential_evolution
-import plotly
 import plotly.graph_objs as go
 from functools import partial
 
@@ -16,147 +15,52 @@ np.random.seed(211)
 random.seed(211)
 
 class RunFitting(QThread):
+    # last record of the fit trace (models/telemetry.py), at most every PROGRESS_INTERVAL seconds
+    progress = pyqtSignal(QVariant)
+    PROGRESS_INTERVAL = 0.5
+
     def __init__(self, isFit, guess, ls_params, dr_method=False, fixed_params=None, minimize_method='L-BFGS-B',
-                 md_type=1, name_dict=None, niters=1e+6):
+                 md_type=1, name_dict=None, niters=1e+6, jac_func=None, batch_func=None, par_names=None,
+                 diev_bounds=None, diev_workers=1, diev_polish=True, cache=None, model_name=None, ragged=None,
+                 plot_export=None, n_starts=1, start_workers=1):
         """
 
         :param isFit:
         :param guess: list of values will be fit (free parameters)
         :param ls_params: dictionary, dict of parameters (fixed, free)
         :param dr_method: use dr method or not
+        :param jac_func: analytic derivative of calc_func (see models/jacobian.py), None for finite differences
+        :param batch_func: batched calc_func, used to evaluate a whole differential evolution population at once
+        :param par_names: column order of batch_func
+        :param diev_bounds: dict, parameter name -> (min, max) for differential evolution,
+                            default one decade around the guess
+        :param diev_workers: processes for differential evolution, -1 for all cores, 1 to vectorize with batch_func
+        :param diev_polish: refine the differential evolution result with least_squares
+        :param cache: models.cache.FitCache of previous fits, used with model_name
+        :param model_name: model name, key of models.MODELS
+        :param ragged: RaggedSpectra of a series (md_type 2), offsets and id of each spectrum in f_data / z_data
+        :param plot_export: plots.PlotExport writing the page, kept between fits to reuse unchanged panels
+        :param n_starts: local fits from n_starts starts around the guess, the best one kept (see
+                         engine.Fitter.fit_multistart)
+        :param start_workers: processes running the local fits of a multi-start, -1 for all cores
         """
         QThread.__init__(self)
+        self.fitter = engine.Fitter(isFit, guess, ls_params, dr_method=dr_method, fixed_params=fixed_params,
+                                    minimize_method=minimize_method, md_type=md_type, name_dict=name_dict,
+                                    niters=niters, jac_func=jac_func, batch_func=batch_func, par_names=par_names,
+                                    diev_bounds=diev_bounds, diev_workers=diev_workers, diev_polish=diev_polish,
+                                    progress_callback=self.progress.emit, progress_interval=self.PROGRESS_INTERVAL,
+                                    cache=cache, model_name=model_name, n_starts=n_starts,
+                                    start_workers=start_workers)
         self.params_dict, self.recv_method, self.zp_data, self.fp_data, self.z_data, self.f_data, self.recv_wgt_index, self.calc_func, self.tp_data, self.t_data, self.volp_data, self.vol_data = ls_params
         self.result = None
         self.zf = None
         self.isFit = isFit
-        self.fitReport = None
-        self.Dr = dr_method
-        self.epsilon = np.finfo('float64').eps
-        if self.Dr:
-            self.init_val = np.ones(len(guess))
-            self.guess = guess
-        else:
-            self.init_val = guess
-            self.guess = None
-        self.p_cov = None
-        self.perror = None
-        self.perror_percent = None
-        self.params_ret = None
-        self.nfev = None
-        self.mesg = None
-        self.minimize_method = minimize_method
-        self.guess_names = fixed_params
-        self.chisqr = -1
-        self.reduced_chisqr = -1
-        self.success = False
         self.model_type = md_type
         self.name_dict = name_dict
-        self.niters = int(niters)
-        self.nfev = -1
-
-    def fit_leastsq(self):
-        """
-        Leastsq fitting SciPy
-        lm
-        :return:
-        """
-        pv, cv, infodict, mesg, ier = leastsq(models.cost_vector, self.init_val,
-                                              args=(self.zp_data, self.fp_data, self.recv_wgt_index, self.calc_func,
-                                                    self.tp_data, self.volp_data, self.guess, self.guess_names,
-                                                    self.params_dict),
-                                              maxfev=self.niters,
-                                              ftol=self.epsilon, gtol=self.epsilon, xtol=self.epsilon, full_output=True)
-
-        self.params_ret = pv
-        self.nfev = infodict['nfev']
-        self.mesg = mesg
-        if cv is not None:
-            self.p_cov = cv * models.cost_scalar(self.params_ret, self.zp_data, self.fp_data,
-                                                 self.recv_wgt_index, self.calc_func, self.tp_data,
-                                                 self.volp_data, self.guess, self.guess_names,
-                                                 self.params_dict) / (self.zp_data.size - self.init_val.size)
-                                                                                                                                            
-        self.p_cov = cv
-
-        if ier in [1, 2, 3, 4]:
-            self.success = True
-        else:
-            self.success = False
-
-    def fit_leastsquares(self):
-        """
-        Leastsquares
-        trf
-        :return:
-        """
-        r_lsq = least_squares(models.cost_vector, self.init_val,
-                              args=(self.zp_data, self.fp_data, self.recv_wgt_index, self.calc_func, self.tp_data,
-                                    self.volp_data, self.guess, self.guess_names, self.params_dict),
-                              max_nfev=self.niters,
-                              ftol=self.epsilon, gtol=self.epsilon, xtol=self.epsilon, verbose=1)
-
-        print("The number of function calls: ", r_lsq.nfev)
-        self.mesg = r_lsq.message
-        self.success = r_lsq.success
-        self.nfev = r_lsq.nfev
-        self.params_ret = r_lsq.x
-        _, s, vh = np.linalg.svd(r_lsq.jac, full_matrices=False)
-        threshold = self.epsilon * np.max(r_lsq.jac.shape) * s[0]
-        s = s[s > threshold]
-        vh = vh[:s.size]
-        p_cov = np.dot(vh.T / s ** 2, vh)
-        
-                                    
-        
-        self.p_cov = p_cov * models.cost_scalar(self.params_ret, self.zp_data, self.fp_data,
-                                                self.recv_wgt_index, self.calc_func, self.tp_data,
-                                                self.volp_data, self.guess, self.guess_names,
-                                                self.params_dict) / (2*self.zp_data.size - self.init_val.size)
-                                                                                                                                           
-                                                                                              
-        
-
-    def fit_minimize(self):
-        """
-        Minimize
-        :return:
-        """
-        r_bfgs = minimize(models.cost_scalar, self.init_val,
-                          args=(self.zp_data, self.fp_data, self.recv_wgt_index, self.calc_func, self.tp_data,
-                                self.volp_data, self.guess, self.guess_names, self.params_dict),
-                          method=self.minimize_method, tol=self.epsilon,
-                          options={'maxcor': 100, 'maxfun': self.niters, 'maxiter': self.niters, 'ftol': self.epsilon,
-                                   'gtol': self.epsilon})
-
-        self.params_ret = r_bfgs.x
-        hess_inv = r_bfgs.hess_inv.todense()
-        self.p_cov = 2.0 * hess_inv * models.cost_scalar(self.params_ret, self.zp_data, self.fp_data,
-                                                         self.recv_wgt_index, self.calc_func, self.tp_data,
-                                                         self.volp_data, self.guess, self.guess_names,
-                                                         self.params_dict) / (2*self.zp_data.size - self.init_val.size)
-        self.success = r_bfgs.success
-        self.nfev = r_bfgs.nfev
-        self.mesg = r_bfgs.message
-
-    def fit_diev(self):
-        """
-        Differential evolution fitting
-        :return:
-        """
-        if self.Dr:
-            bnds = tuple((0.1, 10.0) for i in range(self.init_val.size))
-        else:
-            bnds = tuple((0.1, 10.0) for i in range(self.init_val.size))
-
-        r_diev = differential_evolution(models.cost_scalar, bnds, args=(
-            self.zp_data, self.fp_data, self.recv_wgt_index, self.calc_func, self.tp_data, self.volp_data, self.guess,
-            self.guess_names, self.params_dict), maxiter=self.niters, tol=0.0001)
-
-        self.params_ret = r_diev.x
-        self.nfev = r_diev.nfev
-        self.mesg = r_diev.message
-        self.success = r_diev.success
+        self.ragged = ragged
+        self.plot_export = plot_export if plot_export is not None else plots.PlotExport()
+        self.plotStrings = None
 
     def run(self):
         """
@@ -164,73 +68,28 @@ class RunFitting(QThread):
         :return:
         """
         print("Running")
-        epsilon = np.finfo('float64').eps
-        resd = -1e20
-        if self.isFit == 1:
-            if self.recv_method == 'leastsq':
-                self.fit_leastsq()
-
-            elif self.recv_method == 'least_squares':
-                self.fit_leastsquares()
-
-            elif self.recv_method == 'minimize':
-                self.fit_minimize()
-
-            elif self.recv_method == 'differential_evolution':
-                self.fit_diev()
-
-            if self.p_cov is not None:
-                self.perror = np.sqrt(np.diag(self.p_cov))
-                self.perror_percent = 100 * self.perror / self.params_ret
-            else:
-                self.perror = ['N/A'] * len(self.params_ret)
-                self.perror_percent = ['N/A'] * len(self.params_ret)
-
-            if self.Dr:
-                self.params_ret = np.multiply(self.params_ret, self.guess)
-                if self.p_cov is not None:
-                    self.perror = np.multiply(self.perror, self.guess)
-
-            for idx, gs_name in enumerate(self.guess_names):
-                self.params_dict[gs_name] = self.params_ret[idx]
-
-            self.zf = self.calc_func(self.params_dict, self.f_data, self.t_data, self.vol_data)
-            self.zf[np.isinf(self.zf)] = 0
-            print("CHECKED: ", np.count_nonzero(self.params_ret <= 0))
-
-                                              
-            
-            self.chisqr = models.cost_scalar(self.params_ret, self.zp_data, self.fp_data,
-                                             self.recv_wgt_index, self.calc_func, self.tp_data,
-                                             self.volp_data, self.guess, self.guess_names,
-                                             self.params_dict)
-                                                                                          
-            self.reduced_chisqr = self.chisqr / (2*self.zp_data.size - self.init_val.size)
-            resd = self.chisqr * (2*self.zp_data.size - self.init_val.size)
-
-        elif self.isFit == 2:
-            print("Simulation")
-            self.zf = self.calc_func(self.params_dict, self.f_data, T=self.t_data, Voltage=self.vol_data)
-            resd = 'NaN'
-            self.chisqr = 'NaN'
-            self.reduced_chisqr = 'NaN'
-            self.plot_data()
-
-        self.result = {'param_ret': self.params_dict, 'perror': self.perror, 'perror_percent': self.perror_percent,
-                       'chisqr': self.chisqr, 'red_chisqr': self.reduced_chisqr, 'success': self.success,
-                       'message': self.mesg,
-                       'residual': resd, 'nfev': self.nfev}
-        self.plot_data()
-
+        self.result = self.fitter.run_fit()
+        self.zf = self.fitter.zf
+        # the plots are drawn afterwards by RenderPlots, the results are shown without waiting for them
         self.finished.emit()
 
-    def plot_data(self):
+    def cancel(self):
+        """
+        Stop the fit at the next cost evaluation, keeping the best parameters so far (see engine.Fitter.cancel)
+        """
+        self.fitter.cancel()
+
+    def plot_data(self, cancelled=None):
         """
         Plot data
-        :return:
+        :param cancelled: function, True to stop before the next panel (the page is not written)
+        :return: path to the page, None if cancelled
         """
-        html_graphs = open("impedance_plot.html", "w")
-        html_graphs.write("<html><head></head><body>" + "\n")
+        if cancelled is None:
+            cancelled = lambda: False
+        export = self.plot_export
+        export.begin()
+        page_names = []
 
         if np.sum(np.abs(np.real(self.z_data))) == 0:
             visible_only = 'legendonly'
@@ -252,132 +111,125 @@ class RunFitting(QThread):
             rawColor = '#FF0000'
             markerColor = '#0000FF'
             simMarkerColor = '#1fa33c'
-            
-            iFit = go.Scatter(x=np.real(self.zf), y=np.imag(self.zf), mode=fit_sim_mode, name=lg_name,
-                              line=dict(color=fitColor), marker=dict(color=simMarkerColor, size=5))
-            iRaw = go.Scatter(x=np.real(self.z_data), y=np.imag(self.z_data), mode='lines+markers', name='Raw',
-                              line=dict(color=rawColor), marker=dict(color=markerColor, size=5), visible=visible_only, showlegend=r_legend)
-
-            iAdmitFit, iCapacFit, iCapacFit_abs, iAdmitRaw, iCapacRaw, iCapacRaw_abs = self.calc_admittance_capacitance(visible_only)
 
             graph_names = ["Impedance", "Capacitance", "Admittance", "Linear Capacitance"]#, "Log abs Capacitance"]
-            graph_data = [[iFit, iRaw], [iCapacFit, iCapacRaw], [iAdmitFit, iAdmitRaw], [iCapacFit, iCapacRaw], [iCapacFit_abs, iCapacRaw_abs]]
-            yaxis_names = ['Z"', "E'", "Y'", "E'", "abs(E')"]
-            xaxis_names = ["Z'", "Frequency (Hz)", "Frequency (Hz)", "Frequency (Hz)", "Frequency (Hz)"]
-            for idx in range(len(graph_names)):
-                cur_data = graph_data[idx]
-                if idx == 0:
-                    cur_layout = go.Layout(title=graph_names[idx],
-                                           yaxis=dict(autorange='reversed', title=yaxis_names[idx], showline=True),
-                                           xaxis=dict(title=xaxis_names[idx], showline=True))
-                elif idx == 3:
-                    cur_layout = go.Layout(title=graph_names[idx],
-                                           yaxis=dict(title=yaxis_names[idx], type='linear', showline=True),
-                                           xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
-                elif idx == 4:
-                    cur_layout = go.Layout(title=graph_names[idx],
-                                           yaxis=dict(title=yaxis_names[idx], type='log', showline=True),
-                                           xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
-                else:
-                    cur_layout = go.Layout(title=graph_names[idx],
-                                           yaxis=dict(title=yaxis_names[idx], type='log', showline=True),
-                                           xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
-
-                fig = go.Figure(data=cur_data, layout=cur_layout)
-                plotly.offline.plot(fig, filename='Chart_' + graph_names[idx] + '.html', auto_open=False,
-                                    include_mathjax='cdn',
-                                    config={'scrollZoom': True, 'editable': False, 'edits': {'legendPosition': True},
-                                            'showLink': False})
-                html_graphs.write("  <object data=\"" + 'Chart_' + graph_names[
-                    idx] + '.html' + "\" width=\"500\" height=\"500\" ></object>" + "\n")
+            page_names += ['Chart_' + name for name in graph_names]
+            data_key = export.data_key(self.f_data, self.z_data, self.fp_data, self.zp_data, self.zf, lg_name,
+                                       visible_only, r_legend)
+            # all panels show the fit and the data, serialized again only if one of them changed
+            if not export.is_current(page_names, data_key):
+                iFit = go.Scatter(x=np.real(self.zf), y=np.imag(self.zf), mode=fit_sim_mode, name=lg_name,
+                                  line=dict(color=fitColor), marker=dict(color=simMarkerColor, size=5))
+                iRaw = go.Scatter(x=np.real(self.z_data), y=np.imag(self.z_data), mode='lines+markers', name='Raw',
+                                  line=dict(color=rawColor), marker=dict(color=markerColor, size=5), visible=visible_only, showlegend=r_legend)
+
+                iAdmitFit, iCapacFit, iCapacFit_abs, iAdmitRaw, iCapacRaw, iCapacRaw_abs = self.calc_admittance_capacitance(visible_only)
+
+                graph_data = [[iFit, iRaw], [iCapacFit, iCapacRaw], [iAdmitFit, iAdmitRaw], [iCapacFit, iCapacRaw], [iCapacFit_abs, iCapacRaw_abs]]
+                yaxis_names = ['Z"', "E'", "Y'", "E'", "abs(E')"]
+                xaxis_names = ["Z'", "Frequency (Hz)", "Frequency (Hz)", "Frequency (Hz)", "Frequency (Hz)"]
+                for idx in range(len(graph_names)):
+                    if cancelled():
+                        return None
+                    cur_data = graph_data[idx]
+                    if idx == 0:
+                        cur_layout = go.Layout(title=graph_names[idx],
+                                               yaxis=dict(autorange='reversed', title=yaxis_names[idx], showline=True),
+                                               xaxis=dict(title=xaxis_names[idx], showline=True))
+                    elif idx == 3:
+                        cur_layout = go.Layout(title=graph_names[idx],
+                                               yaxis=dict(title=yaxis_names[idx], type='linear', showline=True),
+                                               xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
+                    elif idx == 4:
+                        cur_layout = go.Layout(title=graph_names[idx],
+                                               yaxis=dict(title=yaxis_names[idx], type='log', showline=True),
+                                               xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
+                    else:
+                        cur_layout = go.Layout(title=graph_names[idx],
+                                               yaxis=dict(title=yaxis_names[idx], type='log', showline=True),
+                                               xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
+
+                    export.set_panel(page_names[idx], data_key, go.Figure(data=cur_data, layout=cur_layout))
 
         elif self.model_type == 2:
-            # Impedance
-            iFit = []
-            iRaw = []
-            fit_admit = []
-            fit_capac = []
-            fit_fim = []
-
-            raw_admit = []
-            raw_capac = []
-            raw_fim = []
-
-            keys = [int(x[:-4]) for x in self.name_dict.keys()]
-            keys.sort()
-
-            keys = ['{}.dat'.format(x) for x in keys]
-            for key in keys:
-                value = self.name_dict[key]
-                cur_idx = self.t_data == value
-                cur_f = self.f_data[cur_idx]
-                cur_zf = self.zf[cur_idx]
-                cur_zraw = self.z_data[cur_idx]
-
-                cur_fit = go.Scatter(x=np.real(cur_zf), y=np.imag(cur_zf), mode=fit_sim_mode, name=key)
-                cur_fit_admit = go.Scatter(x=cur_f, y=self.get_admittance(cur_zf), mode='lines+markers', name=key)
-                cur_fit_capac = go.Scatter(x=cur_f, y=self.get_capacitance(cur_f, cur_zf), mode='lines+markers',
-                                           name=key)
-
-                cur_raw = go.Scatter(x=np.real(cur_zraw), y=np.imag(cur_zraw), mode='lines+markers', name=key, visible=visible_only)
-                cur_raw_admit = go.Scatter(x=cur_f, y=self.get_admittance(cur_zraw), mode='lines+markers', name=key, visible=visible_only)
-                cur_raw_capac = go.Scatter(x=cur_f, y=self.get_capacitance(cur_f, cur_zraw), mode='lines+markers',
-                                           name=key, visible=visible_only)
-
-                iFit.append(cur_fit)
-                fit_fim.append(go.Scatter(x=cur_f, y=-np.imag(cur_zf), mode='lines+markers', name=key))
-                fit_admit.append(cur_fit_admit)
-                fit_capac.append(cur_fit_capac)
-
-                iRaw.append(cur_raw)
-                raw_fim.append(go.Scatter(x=cur_f, y=-np.imag(cur_zraw), mode='lines+markers', name=key, visible=visible_only))
-                raw_admit.append(cur_raw_admit)
-                raw_capac.append(cur_raw_capac)
+            # spectra in numeric order of their file names (e.g. 2.dat before 10.dat), each one a slice
+            ids = self.ragged.ids
+            order = list(range(len(self.ragged)))
+            if all(x[:-4].isdigit() for x in ids):
+                order.sort(key=lambda idx: int(ids[idx][:-4]))
 
             graph_names = ['Capacitance', 'Admittance', '', 'Impedance']
             yaxis_names = ["E'", "Y'", 'Z"', 'Z"']
             xaxis_names = ["Frequency", "Frequency", "Frequency", "Z'"]
-            graph_data = [(fit_capac, raw_capac), (fit_admit, raw_admit), (fit_fim, raw_fim), (iFit, iRaw)]
-            for idx in range(len(graph_names)):
-                cur_fit, cur_raw = graph_data[idx]
-                if idx == len(graph_names) - 1:
-                    cur_layout = go.Layout(title=graph_names[idx],
-                                           yaxis=dict(autorange='reversed', title=yaxis_names[idx], showline=True),
-                                           xaxis=dict(title=xaxis_names[idx], showline=True))
-                elif idx == len(graph_names) - 2:
-                    cur_layout = go.Layout(title=graph_names[idx],
-                                           yaxis=dict(autorange='reversed', type='log', title=yaxis_names[idx],
-                                                      showline=True),
-                                           xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
-                else:
-                    cur_layout = go.Layout(title=graph_names[idx],
-                                           yaxis=dict(title=yaxis_names[idx], type='log', showline=True),
-                                           xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
-
-                fig1 = go.Figure(data=cur_fit, layout=cur_layout.update(title="Fit " + graph_names[idx]))
-                plotly.offline.plot(fig1, filename='Chart_' + graph_names[idx] + '_Fit.html', auto_open=False,
-                                    include_mathjax='cdn',
-                                    config={'scrollZoom': True, 'editable': False, 'edits': {'legendPosition': True},
-                                            'showLink': False})
-                html_graphs.write("  <object data=\"" + 'Chart_' + graph_names[
-                    idx] + '_Fit.html' + "\" width=\"500\" height=\"500\" ></object>" + "\n")
-
-                fig2 = go.Figure(data=cur_raw, layout=cur_layout.update(title="Raw " + graph_names[idx]))
-                plotly.offline.plot(fig2, filename='Chart_' + graph_names[idx] + '_Raw.html', auto_open=False,
-                                    include_mathjax='cdn',
-                                    config={'scrollZoom': True, 'editable': False, 'edits': {'legendPosition': True},
-                                            'showLink': False})
-                html_graphs.write("  <object data=\"" + 'Chart_' + graph_names[
-                    idx] + '_Raw.html' + "\" width=\"500\" height=\"500\" ></object>" + "\n")
-
-            freqs = np.unique(self.fp_data)
-            for fq in freqs:
-                fq_index = np.abs(self.f_data - fq) < 1e-10
-
-            # print(freqs)
-
-        html_graphs.write("</body></html>")
-        self.plotStrings = "impedance_plot.html"
+            for name in graph_names:
+                page_names += ['Chart_' + name + '_Fit', 'Chart_' + name + '_Raw']
+
+            # large series: WebGL traces decimated to about LARGE_PLOT_POINTS per panel, full resolution on demand
+            large = self.f_data.size > plots.LARGE_PLOT_POINTS
+            n_keep = max(plots.LARGE_PLOT_POINTS // max(len(order), 1), plots.MIN_SPECTRUM_POINTS)
+            log_axes = [True, True, True, False]
+
+            # fit and data panels are separate, the data ones are kept while the same data is fitted again
+            fit_key = export.data_key(self.f_data, self.zf, self.ragged.offsets, ids, fit_sim_mode)
+            raw_key = export.data_key(self.f_data, self.z_data, self.ragged.offsets, ids, visible_only)
+            for kind, data_key, z_values, mode, visible in (('Fit', fit_key, self.zf, fit_sim_mode, None),
+                                                            ('Raw', raw_key, self.z_data, 'lines+markers', visible_only)):
+                if export.is_current([name for name in page_names if name.endswith('_' + kind)], data_key):
+                    continue
+                # traces of capacitance, admittance, -Z'' and impedance, full resolution and shown
+                graph_data = [[], [], [], []]
+                shown_data = [[], [], [], []]
+                for idx in order:
+                    if cancelled():
+                        return None
+                    key = ids[idx]
+                    cur_f = self.ragged.values(self.f_data, idx)
+                    cur_z = self.ragged.values(z_values, idx)
+
+                    graph_xy = [(cur_f, self.get_capacitance(cur_f, cur_z)), (cur_f, self.get_admittance(cur_z)),
+                                (cur_f, -np.imag(cur_z)), (np.real(cur_z), np.imag(cur_z))]
+                    for graph, (x, y) in enumerate(graph_xy):
+                        cur_mode = mode if graph == len(graph_xy) - 1 else 'lines+markers'
+                        if not large:
+                            graph_data[graph].append(go.Scatter(x=x, y=y, mode=cur_mode, name=key, visible=visible))
+                            continue
+                        # plain dicts, validating hundreds of traces takes longer than drawing them
+                        trace = {'type': 'scattergl', 'x': x, 'y': y, 'mode': cur_mode, 'name': key}
+                        if visible is not None:
+                            trace['visible'] = visible
+                        keep = plots.decimate(x, y, n_keep, log_x=log_axes[graph], log_y=log_axes[graph])
+                        graph_data[graph].append(trace)
+                        shown_data[graph].append(dict(trace, x=x[keep], y=y[keep]))
+
+                for idx in range(len(graph_names)):
+                    if idx == len(graph_names) - 1:
+                        cur_layout = go.Layout(title=graph_names[idx],
+                                               yaxis=dict(autorange='reversed', title=yaxis_names[idx], showline=True),
+                                               xaxis=dict(title=xaxis_names[idx], showline=True))
+                    elif idx == len(graph_names) - 2:
+                        cur_layout = go.Layout(title=graph_names[idx],
+                                               yaxis=dict(autorange='reversed', type='log', title=yaxis_names[idx],
+                                                          showline=True),
+                                               xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
+                    else:
+                        cur_layout = go.Layout(title=graph_names[idx],
+                                               yaxis=dict(title=yaxis_names[idx], type='log', showline=True),
+                                               xaxis=dict(title=xaxis_names[idx], type='log', showline=True))
+
+                    cur_layout.update(title=kind + " " + graph_names[idx])
+                    if large:
+                        export.set_panel('Chart_' + graph_names[idx] + '_' + kind, data_key,
+                                         {'data': shown_data[idx], 'layout': cur_layout},
+                                         full_figure={'data': graph_data[idx], 'layout': cur_layout})
+                    else:
+                        export.set_panel('Chart_' + graph_names[idx] + '_' + kind, data_key,
+                                         go.Figure(data=graph_data[idx], layout=cur_layout))
+
+        if cancelled():
+            return None
+        self.plotStrings = export.write(page_names)
+        print(export.summary())
+        return self.plotStrings
 
     @staticmethod
     def get_admittance(zdata):
@@ -456,6 +308,30 @@ class RunFitting(QThread):
         return iAdmitFit, iCapacFit, iCapacFit_abs, iAdmitRaw, iCapacRaw, iCapacRaw_abs
 
 
+class RenderPlots(QThread):
+    """
+    Plot page of a finished fit (RunFitting.plot_data), drawn in the background once the results are shown
+    """
+
+    def __init__(self, runObject):
+        """
+        :param runObject: finished RunFitting
+        """
+        QThread.__init__(self)
+        self.runObject = runObject
+        self.cancelled = False
+        self.plotStrings = None
+
+    def cancel(self):
+        """
+        Stop before the next panel, e.g. when a newer fit finished
+        """
+        self.cancelled = True
+
+    def run(self):
+        self.plotStrings = self.runObject.plot_data(cancelled=lambda: self.cancelled)
+
+
 class FittingImpedance(QObject):
     def __init__(self, rootObj=None):
         QObject.__init__(self)
@@ -470,6 +346,9 @@ class FittingImpedance(QObject):
         self.wgt_method = ['unit', 'dataProportional', 'calcProportional', 'dataModulus', 'calcModulus']
         self.method_dict = ['leastsq', 'least_squares', 'minimize', 'differential_evolution']
         self.calc_func = None
+        self.jac_func = None
+        self.batch_func = None
+        self.par_names = None
         self.params = None
         self.recv_wgt_index = None
         self.runFittingSimulation = 0
@@ -478,6 +357,7 @@ class FittingImpedance(QObject):
         self.fitreport = None
         self.md_type = 1
         self.name_dict = None
+        self.ragged = None
 
         self.tp_data, self.t_data, self.volp_data, self.vol_data = [None, None, None, None]
         self.zf = None
@@ -486,6 +366,26 @@ class FittingImpedance(QObject):
         self.default_niters = 100000                       
         self.niters = self.default_niters
         self.rm_positive = False
+        self.diev_bounds = None
+        self.diev_workers = 1
+        # multi-start of the local methods: number of starts, processes
+        self.n_starts = 1
+        self.start_workers = -1
+        self.plot_export = plots.PlotExport()
+        self.renderObject = None
+        self.render_pending = None
+        # fit results cache, off unless enabled (enable_fit_cache, --cache on the command line)
+        self.fit_cache = None
+
+    def enable_fit_cache(self, cache_dir=cache.DEFAULT_CACHE_DIR):
+        """
+        Reuse fit results stored in cache_dir (see models/cache.py)
+        """
+        try:
+            self.fit_cache = cache.FitCache(cache_dir)
+        except OSError:
+            print("Fit cache disabled, cannot create", cache_dir)
+            self.fit_cache = None
 
     def reset_properties(self):
         """
@@ -500,6 +400,9 @@ class FittingImpedance(QObject):
         self.recv_data = ""
         self.recv_names = ""
         self.calc_func = None
+        self.jac_func = None
+        self.batch_func = None
+        self.par_names = None
         self.params = None
         self.recv_wgt_index = None
         self.runFittingSimulation = 0
@@ -508,6 +411,7 @@ class FittingImpedance(QObject):
         self.fitreport = None
         self.md_type = 1
         self.name_dict = None
+        self.ragged = None
         self.terminated = False
 
         self.tp_data, self.t_data, self.volp_data, self.vol_data = [None, None, None, None]
@@ -591,30 +495,13 @@ class FittingImpedance(QObject):
         # Read data
         print('Recved MDL: ', recv_mdl)
 
-        if recv_mdl == "Barsoukov-Pham-Lee_1D":                             
+        if recv_mdl in models.MODELS:
             self.f_data, self.z_data, self.fp_data, self.zp_data = self.dx30_read_data(recv_data, isFit, freq_range)
-            self.calc_func = partial(models.Barsoukov_Pham_Lee, c_case=5)
+            self.calc_func = models.MODELS[recv_mdl]['func']
+            self.jac_func = jacobian.MODEL_JACOBIANS.get(recv_mdl)
+            self.batch_func = models.MODELS[recv_mdl]['batch']
+            self.par_names = models.MODELS[recv_mdl]['params']
 
-        elif recv_mdl == "Barsoukov-Pham-Lee_2D":
-            self.f_data, self.z_data, self.fp_data, self.zp_data = self.dx30_read_data(recv_data, isFit, freq_range)
-            self.calc_func = partial(models.Barsoukov_Pham_Lee, c_case=6)
-
-        elif recv_mdl == "Barsoukov-Pham-Lee_3D":
-            self.f_data, self.z_data, self.fp_data, self.zp_data = self.dx30_read_data(recv_data, isFit, freq_range)
-            self.calc_func = partial(models.Barsoukov_Pham_Lee, c_case=7)
-            
-        if recv_mdl == "Barsoukov-Pham-Lee_1D_Full cell":                             
-            self.f_data, self.z_data, self.fp_data, self.zp_data = self.dx30_read_data(recv_data, isFit, freq_range)
-            self.calc_func = partial(models.Barsoukov_Pham_Lee_1D_Full_cell)
-
-        elif recv_mdl == "Barsoukov-Pham-Lee_2D_Full cell":
-            self.f_data, self.z_data, self.fp_data, self.zp_data = self.dx30_read_data(recv_data, isFit, freq_range)
-            self.calc_func = partial(models.Barsoukov_Pham_Lee_2D_Full_cell)
-
-        elif recv_mdl == "Barsoukov-Pham-Lee_3D_Full cell":
-            self.f_data, self.z_data, self.fp_data, self.zp_data = self.dx30_read_data(recv_data, isFit, freq_range)
-            self.calc_func = partial(models.Barsoukov_Pham_Lee_3D_Full_cell)
-            
         else:
             print("Undefined MDL!")
                                    
@@ -626,9 +513,14 @@ class FittingImpedance(QObject):
                                      self.f_data,
                                      self.recv_wgt_index, self.calc_func, self.tp_data, self.t_data, self.volp_data,
                                      self.vol_data], dr_method=self.dr_method, fixed_params=self.guess_names,
-                                    md_type=self.md_type, name_dict=self.name_dict, niters=self.niters)
+                                    md_type=self.md_type, name_dict=self.name_dict, ragged=self.ragged, niters=self.niters,
+                                    jac_func=self.jac_func, batch_func=self.batch_func, par_names=self.par_names,
+                                    diev_bounds=self.diev_bounds, diev_workers=self.diev_workers,
+                                    cache=self.fit_cache, model_name=self.recv_mdl, plot_export=self.plot_export,
+                                    n_starts=self.n_starts, start_workers=self.start_workers)
 
         self.runObject.finished.connect(self.done)
+        self.runObject.progress.connect(self.fit_progress)
         self.runObject.start()
 
         print("Emited signal")
@@ -640,14 +532,24 @@ class FittingImpedance(QObject):
         :return:
         """
         self.terminated = True
-        self.runObject.terminate()
+        self.runObject.cancel()
+
+    def fit_progress(self, record):
+        """
+        Show the convergence while fitting
+        :param record: last record of the fit trace
+        """
+        str_log = "Fitting ({0}): {1} function evaluations, {2:.1f} s\nChi-square: {3:.6e}\n" \
+                  "Reduced chi-square: {4:.6e}".format(record['stage'], record['nfev'], record['time'],
+                                                       record['cost'], record['red_chisqr'])
+        self.fitLog.emit(str_log)
 
     def done(self):
         """
         Done
         :return:
         """
-        if self.terminated:
+        if self.runObject.result is None:
             self.fitStatus.emit(-1)
             return
         if self.runFittingSimulation == 2:
@@ -661,11 +563,7 @@ class FittingImpedance(QObject):
                                      np.real(self.zf).tolist(), np.imag(self.zf).tolist())
 
             self.chiSquare.emit('NaN', 'NaN', 'NaN')
-            tmp = self.runObject.plotStrings
-
-            tmp = tmp.replace("file://", "file:///")
-            tmp = tmp.replace("\\", "/")
-            self.plotStringSignal.emit(tmp)
+            self.render(self.runObject)
 
             self.fitLog.emit("Simulation completed")
             
@@ -680,16 +578,25 @@ class FittingImpedance(QObject):
             wgt_str = self.recv_wgt
             fit_met = self.recv_method
             str_log = "Method: {0}.\nWeighting: {1}.\nNumber of iteration: {2}\n{3}: {4}".format(fit_met, wgt_str, n_fev, success_str, mesg)
+            if self.result.get('cache') == 'hit':
+                str_log += "\nResult of a previous identical fit (cache)"
+            elif self.result.get('cache') == 'warm':
+                str_log += "\nStarted from a previous fit of the same data (cache)"
+            if self.result.get('multistart') is not None:
+                multistart = self.result['multistart']
+                str_log += "\nMulti-start: {0} starts, {1} distinct minima, {2:.1f} s ({3:.1f} s saved)".format(
+                    multistart['starts'], multistart['minima'], multistart['wall_time'], multistart['time_saved'])
+            if self.result.get('circuit') is not None:
+                str_log += "\n" + self.result['circuit']
             self.fitLog.emit(str_log)
 
-            if self.result['success']:
+            # a stopped fit still shows its best parameters so far (status 2)
+            if self.result['success'] or self.result.get('cancelled'):
                 self.zf = copy.deepcopy(self.runObject.zf)
 
-                tmp = self.runObject.plotStrings
-
                 print(self.result['message'])
 
-                self.fitStatus.emit(1)
+                self.fitStatus.emit(1 if self.result['success'] else 2)
 
                 self.parsed_params, self.fit_errors, self.fit_errors_percent = self.parse_params_ret()
 
@@ -700,14 +607,42 @@ class FittingImpedance(QObject):
                 self.chiSquare.emit('{:10.5e}'.format(self.result['chisqr']),
                                     '{:10.5e}'.format(self.result['red_chisqr']),
                                     '{:10.5e}'.format(self.result['residual']))
-
-                tmp = tmp.replace("file://", "file:///")
-                tmp = tmp.replace("\\", "/")
-                self.plotStringSignal.emit(tmp)
-                print(os.getcwd(), tmp)
+                self.render(self.runObject)
             else:
                 self.fitStatus.emit(0)
 
+    def render(self, runObject):
+        """
+        Draw the plots of a finished fit in the background. A page still waiting is replaced,
+        a page being drawn is cancelled: only the plots of the newest fit are shown
+        :param runObject: finished RunFitting
+        """
+        self.render_pending = runObject
+        if self.renderObject is not None and self.renderObject.isRunning():
+            self.renderObject.cancel()
+            return
+        self.start_render()
+
+    def start_render(self):
+        runObject, self.render_pending = self.render_pending, None
+        if runObject is None:
+            return
+        self.renderObject = RenderPlots(runObject)
+        self.renderObject.finished.connect(self.rendered)
+        self.renderObject.start()
+
+    def rendered(self):
+        """
+        Show the page drawn by RenderPlots, unless a newer fit is waiting for its own
+        """
+        tmp = self.renderObject.plotStrings
+        if tmp is not None and self.render_pending is None:
+            tmp = tmp.replace("file://", "file:///")
+            tmp = tmp.replace("\\", "/")
+            self.plotStringSignal.emit(tmp)
+            print(os.getcwd(), tmp)
+        self.start_render()
+
     @pyqtSlot(QVariant)
     def loadParameters(self, load_path):
         """
@@ -768,6 +703,10 @@ class FittingImpedance(QObject):
         cols_values = np.array(cols_values).reshape(1, -1)
         pd.DataFrame(cols_values, columns=cols).to_csv(write_name, index=None, sep=',')
 
+        # convergence of the fit, next to the parameters
+        if self.result.get('trace'):
+            telemetry.save_trace(self.result['trace'], saved_path + '_trace.csv')
+
     @pyqtSlot(QVariant)
     def saveFitResults(self, saved_path):
         """
@@ -780,10 +719,10 @@ class FittingImpedance(QObject):
             write_data = np.vstack((self.f_data, np.real(self.zf), np.imag(self.zf))).T
             pd.DataFrame(write_data).to_csv(write_name, header=False, index=None, sep='\t')
         else:
-            for key, value in self.name_dict.items():
-                cur_idx = self.t_data == value
-                cur_f = self.f_data[cur_idx]
-                cur_zf = self.zf[cur_idx]
+            for idx, key in enumerate(self.ragged.ids):
+                value = self.ragged.conditions[idx]
+                cur_f = self.ragged.values(self.f_data, idx)
+                cur_zf = self.ragged.values(self.zf, idx)
 
                 txt_name = saved_path + '/' + key
                 write_data = np.vstack((cur_f, np.real(cur_zf), np.imag(cur_zf))).T
@@ -844,17 +783,18 @@ class FittingImpedance(QObject):
         """
         print(freq_range, type(freq_range[0]), type(freq_range[1]), type(freq_range[2]))
         try:
-            df = pd.read_csv(dataPath, sep="\t", header=None).values
-            f_data = df[:, 0]
-            z_data = df[:, 1] + 1j * df[:, 2]
-        except:
+            # parsed once per file version, see readers.read_file
+            entry = readers.read_file(dataPath)
+            f_data = entry['f']
+            z_data = entry['z']
+        except (OSError, ValueError, IndexError):
             f_data = []
             z_data = None
 
         if isFit == 1 or int(freq_range[2]) == 0:
             # Keep data with imag < 0
             if self.rm_positive:
-                kp_data = (df[:, 2] < 0)
+                kp_data = (np.imag(z_data) < 0)
                 fp_data = f_data[kp_data]
                 zp_data = z_data[kp_data]
             else:
@@ -887,14 +827,13 @@ class FittingImpedance(QObject):
         :param dataPath:
         :return:
         """
-        df = pd.read_csv(dataPath, sep="\t", header=None, skiprows=7).values
-        # print(df)
-        f_data = df[:, 0]
-        z_data = df[:, 1] + 1j * df[:, 2]
+        entry = readers.read_file(dataPath, 'dat')
+        f_data = entry['f']
+        z_data = entry['z']
 
         # Keep data with imag < 0
         if self.rm_positive:
-            kp_data = (df[:, 2] < 0)
+            kp_data = (np.imag(z_data) < 0)
             fp_data = f_data[kp_data]
             zp_data = z_data[kp_data]
         else:
@@ -909,77 +848,7 @@ class FittingImpedance(QObject):
         :param raw_data_path: path to LLZ raw data
         :return:
         """
-        list_raw = sorted(ls_data_path.split(";"))
-
-        list_raw_data = [x.replace("//", "/") for x in list_raw if x.endswith(".dat")]
-
-        list_name_data = np.array([x.split('/')[-1] for x in list_raw_data])
-        list_raw_data = [x for x in list_raw_data]
-
-        F_read = []
-        Z = []
-        ls_00 = []
-        ls_temperature = []
-        n_cnt = 0
-        name_dict = {}
-
-        # Check if a temperature appear multiple time
-        ck_temps = []
-        is_append = True
-        for fd in list_raw_data:
-            with open(fd) as fo:
-                fo = open(fd)
-                lines = fo.readlines()
-                cur_F = []
-                cur_Z = []
-                cur_temp = -1
-                for ix in range(len(lines)):
-
-                    line = lines[ix]
-
-                    if ix == 0:
-                        ls_00.append(float(line))
-
-                    elif ix == 1:
-                        cur_temp = float(line)
-                        if cur_temp in ck_temps:
-                            is_append = False
-                            break
-                        else:
-                            is_append = True
-                            ck_temps.append(cur_temp)
-
-                    elif ix > 6 and line != '':
-                        line = line.replace('\\n', '')
-                        xs = [float(vl) for vl in line.split('\t')]
-
-                        cur_F.append(xs[0])
-                        cur_Z.append(xs[1] + 1j * xs[2])
-
-                        n_cnt += 1
-                if is_append:
-                    F_read = F_read + [cur_F]
-                    Z = Z + [cur_Z]
-                    ls_temperature = ls_temperature + [cur_temp] * len(cur_F)
-
-                    name_dict[fd.split('/')[-1]] = cur_temp
-
-        F_read = np.array(F_read, dtype=np.float64).reshape(1, -1).flatten()
-        Z = np.array(Z).reshape(1, -1).flatten()
-        ls_temperature = np.array(ls_temperature, dtype=np.float64).flatten()
-
-        if self.rm_positive:
-            kpZ = np.imag(Z) < 0
-            F_fit = F_read[kpZ].flatten()
-            Z_fit = Z[kpZ].flatten()
-            T_fit = ls_temperature[kpZ.flatten()]
-        else:
-            F_fit = F_read.copy().flatten()
-            Z_fit = Z.copy().flatten()
-            T_fit = ls_temperature.copy().flatten()
-
-        print(name_dict)
-        return F_read.flatten(), Z, ls_temperature.flatten(), F_fit, Z_fit, T_fit, name_dict
+        return self.series_read_data(ls_data_path)
 
     def otmlsm10_read_data(self, ls_data_path):
         """
@@ -987,80 +856,51 @@ class FittingImpedance(QObject):
         :param ls_data_path:
         :return:
         """
-        list_raw = sorted(ls_data_path.split(";"))
+        return self.series_read_data(ls_data_path)
 
+    def series_read_data(self, ls_data_path):
+        """
+        Load a temperature series of .dat files (temperature on the second line), see readers.read_series
+        Spectra sharing a temperature are kept, each one is told apart by its offsets and file name
+        :param ls_data_path: data files separated by ";"
+        :return: F, Z, T of all points, the same for fitting (Z'' < 0 if rm_positive), dict file name -> temperature
+        The offsets of the spectra in F, Z are kept in self.ragged (RaggedSpectra)
+        """
+        list_raw = ls_data_path.split(";")
         list_raw_data = [x.replace("//", "/") for x in list_raw if x.endswith(".dat")]
 
-        list_name_data = np.array([x.split('/')[-1] for x in list_raw_data])
-        list_raw_data = [x for x in list_raw_data]
-
-        F_read = []
-        Z = []
-        ls_00 = []
-        ls_temperature = []
-        n_cnt = 0
+        spectra = readers.read_series(list_raw_data, unique_temperature=False)
         name_dict = {}
+        for entry in spectra:
+            name_dict[entry['name']] = entry['temperature']
 
-        # Check if a temperature appear multiple time
-        ck_temps = []
-        is_append = True
-        for fd in list_raw_data:
-            with open(fd) as fo:
-                fo = open(fd)
-                lines = fo.readlines()
-                cur_F = []
-                cur_Z = []
-                cur_temp = -1
-                for ix in range(len(lines)):
-
-                    line = lines[ix]
-
-                    if ix == 1:
-                        cur_temp = float(line)
-                        if cur_temp in ck_temps:
-                            is_append = False
-                            break
-                        else:
-                            is_append = True
-                            ck_temps.append(cur_temp)
-
-                    elif ix > 6 and line != '':
-                        line = line.replace('\\n', '')
-                        xs = [float(vl) for vl in line.split('\\t')]
-
-                        cur_F.append(xs[0])
-                        cur_Z.append(xs[1] + 1j * xs[2])
-
-                        n_cnt += 1
-
-                if is_append:
-                    F_read = F_read + [cur_F]
-                    Z = Z + [cur_Z]
-                    ls_temperature = ls_temperature + [cur_temp] * len(cur_F)
-
-                    name_dict[fd.split('/')[-1]] = cur_temp
-
-        F_read = np.array(F_read, dtype=np.float64).reshape(1, -1)
-        Z = np.array(Z).reshape(1, -1)
-        ls_temperature = np.array(ls_temperature, dtype=np.float64)
+        self.ragged = RaggedSpectra.from_spectra([(entry['f'], entry['z']) for entry in spectra],
+                                                 ids=[entry['name'] for entry in spectra],
+                                                 conditions=[entry['temperature'] for entry in spectra])
+        F_read = self.ragged.f
+        Z = self.ragged.z
+        ls_temperature = self.ragged.point_conditions()
 
         if self.rm_positive:
             kpZ = np.imag(Z) < 0
-            F_fit = F_read[kpZ].flatten()
-            Z_fit = Z[kpZ].flatten()
-            T_fit = ls_temperature[kpZ.flatten()]
+            F_fit = F_read[kpZ]
+            Z_fit = Z[kpZ]
+            T_fit = ls_temperature[kpZ]
         else:
-            F_fit = F_read.copy().flatten()
-            Z_fit = Z.copy().flatten()
-            T_fit = ls_temperature.copy().flatten()
+            F_fit = F_read.copy()
+            Z_fit = Z.copy()
+            T_fit = ls_temperature.copy()
 
         print(name_dict)
-        return F_read.flatten(), Z, ls_temperature.flatten(), F_fit, Z_fit, T_fit, name_dict
-        pass
+        return F_read, Z, ls_temperature, F_fit, Z_fit, T_fit, name_dict
 
 
 if __name__ == "__main__":
     import sys
+    import multiprocessing
+
+    # differential evolution workers in the frozen executable
+    multiprocessing.freeze_support()
 
     # os.makedirs('./results', exist_ok=True)
 
@@ -1072,18 +912,25 @@ if __name__ == "__main__":
     app.setWindowIcon(QIcon("icon.ico"))
 
     # Create QML engine
-    engine = QQmlApplicationEngine()
+    qml_engine = QQmlApplicationEngine()
 
     # Create a fitting impedance object
     impedance = FittingImpedance()
+    # --cache [directory]: reuse fit results, as the --cache option of PyPhyEIS_cli.py
+    if '--cache' in sys.argv:
+        cache_args = sys.argv[sys.argv.index('--cache') + 1:]
+        if cache_args and not cache_args[0].startswith('-'):
+            impedance.enable_fit_cache(cache_args[0])
+        else:
+            impedance.enable_fit_cache()
     # And register it in the context of QML
-    engine.rootContext().setContextProperty("impedance", impedance)
+    qml_engine.rootContext().setContextProperty("impedance", impedance)
 
-    # Load the qml file into the engine
-    engine.load("PyPhyEIS.qml")
+    # Load the qml file into the QML engine
+    qml_engine.load("PyPhyEIS.qml")
 
-    rootObj = engine.rootObjects()[0]
+    rootObj = qml_engine.rootObjects()[0]
     impedance.setRootObj(rootObj)
 
-    engine.quit.connect(app.quit)
+    qml_engine.quit.connect(app.quit)
     sys.exit(app.exec_())
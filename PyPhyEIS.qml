@@ -156,8 +156,8 @@ ApplicationWindow {
             runsimbtn.enabled = true
             runfitbtn.enabled = true
             freqrangebtn.enabled = true
-            if (fit_status == 1) {
-                fitStatus.text = "Success"
+            if (fit_status == 1 || fit_status == 2) {
+                fitStatus.text = fit_status == 1 ? "Success" : "Stopped " + add_text + ", best so far"
                 saveParameters.enabled = true
                 saveFitResults.enabled = true
             } else {
@@ -0,0 +1,410 @@
+"""
+Batch fitting from the command line, without the GUI
+
+Example:
+    python PyPhyEIS_cli.py "data/*.txt" --model Barsoukov-Pham-Lee_1D --params template.csv \
+        --weighting dataProportional --method least_squares --output results.csv
+
+Multi-start: each spectrum fitted from 8 starts sampled within two decades around the template, best minimum kept:
+    python PyPhyEIS_cli.py "data/*.txt" --starts 8 --start-spread 2 --model Barsoukov-Pham-Lee_1D \
+        --params template.csv --output results.csv
+
+Temperature series (.dat files, temperature on the second line), each spectrum starting from the previous optimum:
+    python PyPhyEIS_cli.py "llz/*.dat" --series --model Barsoukov-Pham-Lee_1D --params template.csv \
+        --output series.csv
+
+Global fit, r_m q_w c_d_liq common to all spectra, the other free parameters fitted for each spectrum:
+    python PyPhyEIS_cli.py "data/*.txt" --shared r_m q_w c_d_liq --model Barsoukov-Pham-Lee_1D \
+        --params template.csv --output global.csv
+Ctrl-C stops it with the best parameters so far; with --checkpoint global.npz it is saved every minute and
+the same command resumes from it.
+
+Temperature series fitted at once, r_ct and r_d Arrhenius (r_ct_ea, r_d_ea: activation energies in eV):
+    python PyPhyEIS_cli.py "llz/*.dat" --law r_ct=arrhenius r_d=arrhenius --celsius --model Barsoukov-Pham-Lee_1D \
+        --params template.csv --free r_ct r_ct_ea r_d r_d_ea c_dl --output laws.csv
+
+Spectrum store (models/store.py), built once, then fitted without parsing text files:
+    python PyPhyEIS_cli.py "cycling/*.dat" --build-store cycling.store
+    python PyPhyEIS_cli.py cycling.store --temperature 20 30 --model Barsoukov-Pham-Lee_1D --params template.csv
+"""
+import os
+import re
+import sys
+import glob
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from models import models, engine, readers, cache, global_fit, laws, store
+
+
+def find_spectra(inputs, temperature=None):
+    """
+    Expand directories (every .txt and .dat file inside), spectrum stores and glob patterns
+    :param inputs: list of directories, stores, files or glob patterns
+    :param temperature: (min, max) temperature of the spectra taken from stores
+    :return: sorted list of data files and store spectra (see readers.read_source)
+    """
+    data_files = []
+    for item in inputs:
+        if store.is_store(item):
+            data_files.extend(readers.store_sources(item, readers.open_store(item).select(temperature=temperature)))
+        elif os.path.isdir(item):
+            data_files.extend(glob.glob(os.path.join(item, '*.txt')))
+            data_files.extend(glob.glob(os.path.join(item, '*.dat')))
+        else:
+            data_files.extend(glob.glob(item))
+    return sorted(set(data_files))
+
+
+def read_condition(data_path, pattern=None):
+    """
+    Condition of a spectrum in a series
+    :param data_path: data file or store spectrum
+    :param pattern: regular expression matched on the file name, its first group (or whole match) is the condition;
+                    default: temperature of a .dat file or of the store, else the first number in the file name
+    :return: spectrum (f_data, z_data), condition
+    """
+    if data_path.endswith('.dat'):
+        entry = readers.read_file(data_path, 'dat')
+    else:
+        entry = readers.read_source(data_path)
+    name = entry['name']
+    f_data, z_data, condition = entry['f'], entry['z'], entry['temperature']
+
+    if pattern is not None or condition is None:
+        match = re.search(pattern if pattern is not None else r'[-+]?\d+(?:\.\d+)?', name)
+        if match is None:
+            raise ValueError("No condition in the file name {}".format(name))
+        condition = float(match.group(1) if match.groups() else match.group(0))
+    return (f_data, z_data), condition
+
+
+def fit_file(job):
+    """
+    Fit one spectrum, run in a worker process
+    :param job: dict with data_path, model, params, free, weighting, method, niters, rm_positive, cache_dir,
+                n_starts, start_spread, start_workers
+    :return: dict with data_path, result (engine.FitResult, None on error), fit_time, error
+    """
+    t_start = time.time()
+    row = {'data_path': job['data_path'], 'result': None, 'fit_time': 0.0, 'error': None}
+    try:
+        f_data, z_data, _, _ = readers.read_spectrum(job['data_path'])
+        fit_cache = cache.FitCache(job['cache_dir'], job['cache_max_bytes']) if job['cache_dir'] is not None else None
+        row['result'] = engine.fit(job['model'], f_data, z_data, job['params'], job['free'],
+                                   weighting=job['weighting'], method=job['method'], niters=job['niters'],
+                                   rm_positive=job['rm_positive'], cache=fit_cache, n_starts=job['n_starts'],
+                                   start_spread=job['start_spread'], start_workers=job['start_workers'])
+    except Exception as e:
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+    row['fit_time'] = time.time() - t_start
+    return row
+
+
+def format_row(row, par_names):
+    """
+    One line of the results table, same columns as FittingImpedance.saveParameters
+    :param row: output of fit_file
+    :param par_names: parameter names, in the order of the template
+    :return: list of column names, list of values
+    """
+    cols = ["Data name", "chi-square", "sum of square"]
+    result = row['result']
+    if result is None:
+        cols_values = [row['data_path'], '', '']
+    else:
+        cols_values = [row['data_path'], result.chisqr, result.residual]
+
+    for name in par_names:
+        cols += [name.upper(), name.upper() + '_error', name.upper() + '_error %']
+        value, error, error_percent = '', '', ''
+        if result is not None:
+            value = '{:12.6e}'.format(float(result.params.get(name, np.nan)))
+            if name in result.free and not np.isnan(result.errors[name]):
+                error = '{:12.6e}'.format(result.errors[name])
+                error_percent = '{:12.6e}'.format(result.errors_percent[name])
+        cols_values += [value, error, error_percent]
+
+    cols += ["success", "nfev", "fit time (s)", "message"]
+    if result is None:
+        cols_values += [False, '', '{:.3f}'.format(row['fit_time']), row['error']]
+    else:
+        cols_values += [result.success, result.nfev, '{:.3f}'.format(row['fit_time']), result.message]
+    return cols, cols_values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit many impedance spectra with one model and parameter template")
+    parser.add_argument('data', nargs='+', help="data files, directories or glob patterns (tab separated f, Z', Z'')")
+    parser.add_argument('--model', choices=list(models.MODELS.keys()))
+    parser.add_argument('--params', help="parameter template saved by the GUI (Save parameters)")
+    parser.add_argument('--free', nargs='*', default=None,
+                        help="names of the free parameters, default: those with an error value in the template")
+    parser.add_argument('--weighting', default='unit', choices=engine.WEIGHTINGS)
+    parser.add_argument('--method', default='least_squares', choices=engine.METHODS)
+    parser.add_argument('--niters', type=int, default=100000)
+    parser.add_argument('--rm-positive', action='store_true', help="fit only the points with Z'' < 0")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument('--starts', type=int, default=1,
+                        help="local fits of each spectrum from different starts around the template, best one kept")
+    parser.add_argument('--start-spread', type=float, default=1.0,
+                        help="decades around the template the starts are sampled in")
+    parser.add_argument('--output', default='results.csv')
+    parser.add_argument('--traces', default=None, help="directory where the convergence trace of each fit is saved")
+    parser.add_argument('--cache', default=None, nargs='?', const=cache.DEFAULT_CACHE_DIR,
+                        help="reuse fit results stored in this directory (default {})".format(cache.DEFAULT_CACHE_DIR))
+    parser.add_argument('--cache-size', type=float, default=cache.DEFAULT_MAX_BYTES / 1024 ** 2,
+                        help="maximum size of the cache in MB")
+    parser.add_argument('--series', action='store_true',
+                        help="fit the spectra in the order of their condition, each one starting from the optimum "
+                             "of the previous one, and write one parameter-vs-condition table")
+    parser.add_argument('--condition', default=None,
+                        help="regular expression giving the condition from the file name, default: temperature "
+                             "of .dat files, else the first number in the file name")
+    parser.add_argument('--chains', type=int, default=1, help="independent chains of the series, run in parallel")
+    parser.add_argument('--divergence', type=float, default=10.0,
+                        help="restart a fit from the template when its reduced chi-square is more than this times "
+                             "the one of the previous spectrum")
+    parser.add_argument('--shared', nargs='*', default=None,
+                        help="global fit of all spectra at once: parameters common to all spectra, the other free "
+                             "parameters are fitted for each spectrum (least_squares)")
+    parser.add_argument('--checkpoint', default=None, metavar='FILE',
+                        help="global fit: save the best parameters to FILE (npz) during the fit, and resume from it")
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0, help="seconds between two checkpoints")
+    parser.add_argument('--law', nargs='*', default=None, metavar='NAME=LAW',
+                        help="fit all spectra at once with parameter laws of the condition of each spectrum, "
+                             "laws: {}".format(', '.join(sorted(laws.LAWS))))
+    parser.add_argument('--t-ref', type=float, default=298.15, help="reference temperature of the laws (K)")
+    parser.add_argument('--v-ref', type=float, default=0.0, help="reference voltage of the laws (V)")
+    parser.add_argument('--celsius', action='store_true', help="conditions are temperatures in degrees Celsius")
+    parser.add_argument('--build-store', default=None, metavar='DIR',
+                        help="append the data files to the spectrum store DIR (created if missing) and exit")
+    parser.add_argument('--temperature', nargs=2, type=float, default=None, metavar=('MIN', 'MAX'),
+                        help="fit only the spectra of the stores in this temperature range")
+    parser.add_argument('--backend', default=None, choices=models.BACKENDS,
+                        help="implementation of the models, numba: fused kernels of the whole circuit (needs Numba)")
+    args = parser.parse_args(argv)
+
+    if args.backend is not None:
+        try:
+            models.set_backend(args.backend)
+        except ValueError as error:
+            print(error)
+            return 1
+        # worker processes import the models again
+        os.environ['PYPHYEIS_BACKEND'] = args.backend
+
+    data_files = find_spectra(args.data, args.temperature)
+    if not data_files:
+        print("No data file found")
+        return 1
+    if args.build_store is not None:
+        t_start = time.time()
+        spectra = store.SpectrumStore(args.build_store, mode='a')
+        spectra.append_files([data_path for data_path in data_files if os.path.isfile(data_path)])
+        print("{} spectra in {} ({:.2f} s)".format(len(spectra), args.build_store, time.time() - t_start))
+        return 0
+    if args.model is None or args.params is None:
+        parser.error("--model and --params are required to fit")
+
+    par_names, par_values, par_frees = readers.read_parameters(args.params)
+    missing = [name for name in models.MODELS[args.model]['params'] if name not in par_names]
+    if missing:
+        print("Parameters missing in {}: {}".format(args.params, ', '.join(missing)))
+        return 1
+    if args.free is not None:
+        free = [name.lower() for name in args.free]
+    else:
+        free = [name for name, is_free in zip(par_names, par_frees) if is_free]
+
+    if args.law is not None:
+        return fit_laws(args, data_files, par_names, par_values, free)
+    if args.shared is not None:
+        return fit_global(args, data_files, par_names, par_values, free)
+    if args.series:
+        return fit_series(args, data_files, par_names, par_values, free)
+
+    jobs = [{'data_path': data_path, 'model': args.model, 'params': dict(zip(par_names, par_values)), 'free': free,
+             'weighting': args.weighting, 'method': args.method, 'niters': args.niters,
+             'rm_positive': args.rm_positive, 'cache_dir': args.cache,
+             'cache_max_bytes': int(args.cache_size * 1024 ** 2), 'n_starts': args.starts,
+             'start_spread': args.start_spread, 'start_workers': max(1, args.workers // len(data_files))}
+            for data_path in data_files]
+
+    print("Fitting {} spectra with {}, {}, {} weighting on {} processes".format(
+        len(jobs), args.model, args.method, args.weighting, args.workers))
+    if args.traces is not None and not os.path.isdir(args.traces):
+        os.makedirs(args.traces)
+
+    t_start = time.time()
+    rows = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(fit_file, job) for job in jobs]
+        for k, future in enumerate(as_completed(futures)):
+            row = future.result()
+            rows[row['data_path']] = row
+            if row['result'] is None:
+                status = "Error ({})".format(row['error'])
+            else:
+                status = "Success" if row['result'].success else "Failed"
+                status += ", chi-square: {:.6e}".format(row['result'].chisqr)
+                if row['result'].cache == 'hit':
+                    status += " (cached)"
+                elif row['result'].cache == 'warm':
+                    status += " (warm start)"
+                if row['result'].multistart is not None:
+                    status += ", {} minima from {} starts".format(row['result'].multistart['minima'],
+                                                                   row['result'].multistart['starts'])
+                if args.traces is not None:
+                    trace_name = os.path.splitext(os.path.basename(row['data_path']))[0] + '_trace.csv'
+                    row['result'].save_trace(os.path.join(args.traces, trace_name))
+            print("[{}/{}] {}: {}, {:.2f} s".format(k + 1, len(jobs), os.path.basename(row['data_path']), status,
+                                                  row['fit_time']))
+
+    table = []
+    cols = None
+    for data_path in data_files:
+        cols, cols_values = format_row(rows[data_path], par_names)
+        table.append(cols_values)
+    pd.DataFrame(table, columns=cols).to_csv(args.output, index=None, sep=',')
+
+    n_failed = len([row for row in rows.values() if row['result'] is None or not row['result'].success])
+    if args.cache is not None:
+        cache_states = [row['result'].cache for row in rows.values() if row['result'] is not None]
+        print("Cache: {} hits, {} warm starts, {} misses".format(cache_states.count('hit'),
+                                                                  cache_states.count('warm'),
+                                                                  cache_states.count('miss')))
+    print("Done: {} fits, {} failed, {:.2f} s. Results written to {}".format(len(jobs), n_failed,
+                                                                          time.time() - t_start, args.output))
+    return 0
+
+
+def fit_series(args, data_files, par_names, par_values, free):
+    """
+    --series: one chained fit of all spectra, see engine.fit_series
+    """
+    spectra = []
+    conditions = []
+    for data_path in data_files:
+        spectrum, condition = read_condition(data_path, args.condition)
+        spectra.append(spectrum)
+        conditions.append(condition)
+
+    print("Fitting a series of {} spectra with {}, {}, {} weighting, {} chains".format(
+        len(spectra), args.model, args.method, args.weighting, args.chains))
+    fit_cache = cache.FitCache(args.cache, int(args.cache_size * 1024 ** 2)) if args.cache is not None else None
+    series = engine.fit_series(args.model, spectra, conditions, dict(zip(par_names, par_values)), free,
+                               names=data_files, chains=args.chains, workers=args.workers,
+                               divergence_ratio=args.divergence, weighting=args.weighting, method=args.method,
+                               niters=args.niters, rm_positive=args.rm_positive, cache=fit_cache)
+
+    for name, condition, result, start in zip(series.names, series.conditions, series.results, series.starts):
+        print("{}: {}, {}, chi-square: {:.6e}, {} start".format(condition, os.path.basename(name),
+                                                                 "Success" if result.success else "Failed",
+                                                                 result.chisqr, start))
+        if args.traces is not None:
+            if not os.path.isdir(args.traces):
+                os.makedirs(args.traces)
+            trace_name = os.path.splitext(os.path.basename(name))[0] + '_trace.csv'
+            result.save_trace(os.path.join(args.traces, trace_name))
+
+    cols, rows = series.table()
+    pd.DataFrame(rows, columns=cols).to_csv(args.output, index=None, sep=',')
+    print("Done: {} fits, {} restarts, {:.2f} s. Results written to {}".format(
+        len(rows), series.starts.count('restart'), series.fit_time, args.output))
+    return 0
+
+
+def fit_laws(args, data_files, par_names, par_values, free):
+    """
+    --law: one fit of all spectra stacked, with parameter laws of their condition, see models/laws.py
+    """
+    law_dict = {}
+    for item in args.law:
+        name, _, law = item.partition('=')
+        law_dict[name.lower()] = law
+    law_model = laws.LawModel(args.model, law_dict, t_ref=args.t_ref, v_ref=args.v_ref, celsius=args.celsius)
+    variables = set(laws.LAWS[law]['variable'] for law in law_dict.values())
+    if len(variables) != 1:
+        print("The laws must all depend on the temperature or all on the voltage")
+        return 1
+
+    spectra = []
+    conditions = []
+    for data_path in data_files:
+        spectrum, condition = read_condition(data_path, args.condition)
+        spectra.append(spectrum)
+        conditions.append(condition)
+    f_data, z_data, c_data = laws.stack_spectra(spectra, conditions)
+    variable = {variables.pop(): c_data}
+
+    print("Fitting {} spectra at once with {}, laws: {}, free: {}".format(
+        len(spectra), args.model, ', '.join(args.law), ' '.join(free)))
+    result = engine.fit(args.model, f_data, z_data, dict(zip(par_names, par_values)), free,
+                        weighting=args.weighting, method=args.method, niters=args.niters,
+                        rm_positive=args.rm_positive, laws=law_model, **variable)
+    if args.traces is not None:
+        if not os.path.isdir(args.traces):
+            os.makedirs(args.traces)
+        result.save_trace(os.path.join(args.traces, 'laws_trace.csv'))
+
+    cols = ["Data name", "chi-square", "sum of square"]
+    cols_values = [';'.join(data_files), result.chisqr, result.residual]
+    for name in law_model.par_names:
+        cols += [name.upper(), name.upper() + '_error', name.upper() + '_error %']
+        if name in result.free:
+            cols_values += [result.params[name], result.errors[name], result.errors_percent[name]]
+        else:
+            cols_values += [result.params[name], '', '']
+    cols += ["success", "nfev", "fit time (s)", "message"]
+    cols_values += [result.success, result.nfev, '{:.3f}'.format(result.fit_time), result.message]
+    pd.DataFrame([cols_values], columns=cols).to_csv(args.output, index=None, sep=',')
+    print("Done: {}, chi-square: {:.6e}, {:.2f} s. Results written to {}".format(
+        "Success" if result.success else "Failed", result.chisqr, result.fit_time, args.output))
+    return 0
+
+
+def fit_global(args, data_files, par_names, par_values, free):
+    """
+    --shared: one global fit of all spectra, see global_fit.fit_global
+    """
+    shared = [name.lower() for name in args.shared]
+    local = [name for name in free if name not in shared]
+    spectra = []
+    for data_path in data_files:
+        f_data, z_data, _, _ = readers.read_spectrum(data_path)
+        spectra.append((f_data, z_data))
+
+    print("Global fit of {} spectra with {}, {} weighting, shared: {}, per spectrum: {}".format(
+        len(spectra), args.model, args.weighting, ' '.join(shared), ' '.join(local)))
+    # Ctrl-C stops the fit at the next evaluation, the best parameters so far are written
+    cancel = threading.Event()
+    previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: cancel.set())
+    try:
+        result = global_fit.fit_global(args.model, spectra, dict(zip(par_names, par_values)), shared, local,
+                                       names=data_files, weighting=args.weighting, niters=args.niters,
+                                       rm_positive=args.rm_positive, cancel=cancel, checkpoint=args.checkpoint,
+                                       checkpoint_interval=args.checkpoint_interval)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    if args.traces is not None:
+        if not os.path.isdir(args.traces):
+            os.makedirs(args.traces)
+        result.save_trace(os.path.join(args.traces, 'global_trace.csv'))
+
+    cols, rows = result.table()
+    pd.DataFrame(rows, columns=cols).to_csv(args.output, index=None, sep=',')
+    status = "Cancelled" if result.cancelled else "Success" if result.success else "Failed"
+    print("Done: {}, chi-square: {:.6e}, {} function calls, {:.2f} s. Results written to {}".format(
+        status, result.chisqr, result.nfev, result.fit_time, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
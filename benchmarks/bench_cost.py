@@ -0,0 +1,64 @@
+"""
+Time per evaluation of models.cost_vector with the parameters given as a dict (copied and rebuilt at each call)
+and as a models.ParameterLayout (guess written into a fixed array).
+"overhead" is measured with a model that returns a precomputed spectrum, so only the cost function itself counts.
+
+    python -m benchmarks.bench_cost --select 10_
+"""
+import argparse
+import timeit
+from functools import partial
+import numpy as np
+from models import models
+from benchmarks import datasets
+
+
+def time_calls(funcs, number, repeat=10):
+    """
+    Best time per call of each function, the functions are run in turn so that they see the same machine load
+    """
+    times = [[] for _ in funcs]
+    for _ in range(repeat):
+        for idx, func in enumerate(funcs):
+            times[idx].append(timeit.timeit(func, number=number) / number)
+    return [min(t) for t in times]
+
+
+def bench_dataset(dataset, number):
+    mdl = models.MODELS[dataset['model']]
+    params = {name: dataset['params'][name] for name in mdl['params']}
+    free = datasets.free_parameters(params)
+    guess = np.array([params[name] for name in free])
+    layout = models.ParameterLayout(mdl['params'], params, free)
+    z_calc = mdl['func'](params, dataset['f'])
+
+    def precomputed(parvals, f, T=None, Voltage=None):
+        models.parvals_to_array(parvals, mdl['params'])
+        return z_calc
+
+    funcs = []
+    for calc_func in (precomputed, mdl['func']):
+        for cost_params in (params, layout):
+            args = (dataset['z'], dataset['f'], 1, calc_func, None, None, None, free, cost_params)
+            funcs.append(partial(models.cost_vector, guess, *args))
+    return len(free), time_calls(funcs, number)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=200, help='evaluations per timing')
+    parser.add_argument('--select', default='', help='only datasets whose name contains this string')
+    args = parser.parse_args()
+
+    print('{:<75s} {:>5s} {:>14s} {:>14s} {:>12s} {:>12s}'.format('dataset', 'nfree', 'overhead dict',
+                                                                  'overhead array', 'total dict', 'total array'))
+    for dataset in datasets.tutorial_datasets():
+        if args.select not in dataset['name']:
+            continue
+        n_free, times = bench_dataset(dataset, args.number)
+        print('{:<75s} {:>5d} {:>12.1f}us {:>12.1f}us {:>10.1f}us {:>10.1f}us'.format(
+            dataset['name'], n_free, *[1e6 * t for t in times]))
+
+
+if __name__ == '__main__':
+    main()
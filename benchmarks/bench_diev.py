@@ -0,0 +1,55 @@
+"""
+Wall-clock comparison of the differential evolution modes of the fitting engine on the tutorial datasets:
+serial (one model call per population member), vectorized (one batched call per generation)
+and multi-process (workers=-1).
+
+    python -m benchmarks.bench_diev --maxiter 30 --select Barsoukov
+"""
+import argparse
+import time
+import numpy as np
+from models.engine import Fitter
+from benchmarks import datasets
+
+
+def run_diev(dataset, free, maxiter, batch, workers):
+    calc_func, batch_func, jac_func, par_names = datasets.MODEL_FUNCS[dataset['model']]
+    params = dict(dataset['params'])
+    guess = np.array([params[name] for name in free]) * 1.5
+    run_obj = Fitter(1, guess, [params, 'differential_evolution', dataset['z'], dataset['f'], dataset['z'],
+                                dataset['f'], 1, calc_func, None, None, None, None],
+                     fixed_params=free, niters=maxiter, jac_func=jac_func,
+                     batch_func=batch_func if batch else None, par_names=par_names,
+                     diev_workers=workers, diev_polish=False)
+    np.random.seed(211)
+    t_start = time.perf_counter()
+    run_obj.fit_diev()
+    elapsed = time.perf_counter() - t_start
+    return elapsed, run_obj.nfev
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--maxiter', type=int, default=30, help='differential evolution generations')
+    parser.add_argument('--select', default='', help='only datasets whose name contains this string')
+    parser.add_argument('--no-workers', action='store_true', help='skip the multi-process mode')
+    args = parser.parse_args()
+
+    modes = [('serial', False, 1), ('vectorized', True, 1)]
+    if not args.no_workers:
+        modes.append(('workers', False, -1))
+
+    print('{:<75s} {:>5s} {} {:>8s}'.format('dataset', 'nfree', ' '.join('{:>10s}'.format(m[0]) for m in modes),
+                                            'speedup'))
+    for dataset in datasets.tutorial_datasets():
+        if args.select not in dataset['name']:
+            continue
+        free = datasets.free_parameters(dataset['params'])
+        times = [run_diev(dataset, free, args.maxiter, batch, workers)[0] for _, batch, workers in modes]
+        print('{:<75s} {:>5d} {} {:>7.1f}x'.format(dataset['name'], len(free),
+                                                   ' '.join('{:>9.3f}s'.format(t) for t in times),
+                                                   times[0] / min(times[1:])))
+
+
+if __name__ == '__main__':
+    main()
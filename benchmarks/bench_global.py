@@ -0,0 +1,77 @@
+"""
+Scaling of the global fit (models.global_fit) with the number of spectra: block sparse Jacobian with lsmr
+against the same Jacobian made dense with the exact trust region solver.
+The spectra are simulated from a tutorial dataset, the per-spectrum parameters drifting along the series.
+
+    python -m benchmarks.bench_global --sizes 5 10 20 50
+"""
+import time
+import argparse
+import numpy as np
+from models import models, global_fit
+from benchmarks import datasets
+
+
+def make_series(dataset, n_spectra, local, noise=1e-3):
+    """
+    :return: list of (freqs, Z)
+    """
+    mdl = models.MODELS[dataset['model']]
+    params = {name: dataset['params'][name] for name in mdl['params']}
+    rng = np.random.RandomState(211)
+    spectra = []
+    for idx in range(n_spectra):
+        spectrum_params = dict(params)
+        for name in local:
+            spectrum_params[name] *= np.exp(0.3 * idx / n_spectra)
+        z_calc = mdl['func'](spectrum_params, dataset['f'])
+        spectra.append((dataset['f'], z_calc * (1 + noise * rng.randn(z_calc.size))))
+    return params, spectra
+
+
+def fit_dense(problem, niters):
+    from scipy.optimize import least_squares
+
+    epsilon = np.finfo('float64').eps
+    return least_squares(problem.residuals, problem.pack(), jac=lambda x: problem.jacobian(x).toarray(),
+                         max_nfev=niters, ftol=epsilon, gtol=epsilon, xtol=epsilon, tr_solver='exact',
+                         x_scale='jac')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--select', default='9_Barsoukov Qw liq/1d', help='dataset the spectra are simulated from')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[5, 10, 20, 50], help='numbers of spectra')
+    parser.add_argument('--shared', nargs='*', default=['r_m', 'q_w', 'c_d_liq'])
+    parser.add_argument('--local', nargs='*', default=['r_ct', 'c_dl'])
+    parser.add_argument('--niters', type=int, default=200)
+    parser.add_argument('--start', type=float, default=1.2, help='start of the fits: parameters * start')
+    parser.add_argument('--skip-dense', action='store_true')
+    args = parser.parse_args()
+
+    dataset = [dataset for dataset in datasets.tutorial_datasets() if args.select in dataset['name']][0]
+    print(dataset['name'])
+    print('{:>8s} {:>6s} {:>12s} {:>6s} {:>14s} {:>12s} {:>6s} {:>14s}'.format(
+        'spectra', 'nfree', 'sparse', 'nfev', 'chi-square', 'dense', 'nfev', 'chi-square'))
+    for n_spectra in args.sizes:
+        params, spectra = make_series(dataset, n_spectra, args.local)
+        start = dict(params)
+        for name in args.shared + args.local:
+            start[name] *= args.start
+
+        result = global_fit.fit_global(dataset['model'], spectra, start, args.shared, args.local,
+                                       weighting='dataModulus', niters=args.niters)
+        line = '{:>8d} {:>6d} {:>11.3f}s {:>6d} {:>14.6e}'.format(
+            n_spectra, len(args.shared) + n_spectra * len(args.local), result.fit_time, result.nfev, result.chisqr)
+
+        if not args.skip_dense:
+            problem = global_fit.GlobalFit(dataset['model'], spectra, start, args.shared, args.local, 4)
+            t_start = time.time()
+            r_lsq = fit_dense(problem, args.niters)
+            line += ' {:>11.3f}s {:>6d} {:>14.6e}'.format(time.time() - t_start, r_lsq.nfev,
+                                                          2 * r_lsq.cost)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Import time of the fitting core in a fresh interpreter, and check that it does not load
+the GUI (PyQt5), plotting (plotly), pandas, scipy.optimize or numba (models/kernels.py, imported on first use).
+Exits with 1 if it does.
+
+    python -m benchmarks.bench_import --repeat 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+from benchmarks import datasets
+
+MODULES = ['numpy', 'models.models', 'models.jacobian', 'models.engine', 'models.global_fit',
+           'models.laws', 'models.readers', 'models.store', 'models.ragged', 'models.plots']
+HEAVY_MODULES = ['PyQt5', 'plotly', 'pandas', 'scipy.optimize', 'mpmath', 'numba']
+
+CHILD_CODE = """
+import sys, time, json
+t_start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t_start
+print(json.dumps({{'time': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def import_once(module):
+    """
+    :return: import time (s), heavy modules loaded by the import
+    """
+    out = subprocess.check_output([sys.executable, '-c', CHILD_CODE.format(module=module, heavy=HEAVY_MODULES)],
+                                  cwd=datasets.ROOT_DIR)
+    ret = json.loads(out.decode().strip().splitlines()[-1])
+    return ret['time'], ret['loaded']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module, the best time is kept')
+    args = parser.parse_args()
+
+    failed = False
+    print('{:<20s} {:>10s}  {}'.format('module', 'time', 'heavy modules loaded'))
+    for module in MODULES:
+        runs = [import_once(module) for _ in range(args.repeat)]
+        loaded = runs[0][1]
+        print('{:<20s} {:>8.1f}ms  {}'.format(module, 1000 * min(r[0] for r in runs), ', '.join(loaded) or '-'))
+        if module.startswith('models') and loaded:
+            failed = True
+
+    if failed:
+        print('FAILED: the fitting core loads heavy modules at import')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
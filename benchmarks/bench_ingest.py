@@ -0,0 +1,107 @@
+"""
+Spectrum ingest: time to load a series of files with
+- the line loop of FittingImpedance.llz_read_data before models/readers.py (float() per token, growing lists)
+- pandas.read_csv, as dx30_read_data before models/readers.py
+- readers.parse_spectrum (bulk conversion), first read
+- readers.read_file again, parsed-data cache
+
+The files are written in a temporary directory, a tutorial spectrum with the temperature in the header (.dat).
+
+    python -m benchmarks.bench_ingest --files 2000
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from models import readers
+from benchmarks import datasets
+
+
+def write_series(directory, n_files, dataset):
+    paths = []
+    for idx in range(n_files):
+        path = os.path.join(directory, 'spectrum_{:05d}.dat'.format(idx))
+        with open(path, 'w') as fo:
+            fo.write('0\n{}\n\n\n\n\n\n'.format(20.0 + 0.01 * idx))
+            for f, z in zip(dataset['f'], dataset['z']):
+                fo.write('{!r}\t{!r}\t{!r}\n'.format(float(f), float(z.real), float(z.imag)))
+        paths.append(path)
+    return paths
+
+
+def legacy_read(paths):
+    """
+    Loop of llz_read_data before models/readers.py
+    """
+    F_read = []
+    Z = []
+    for fd in paths:
+        with open(fd) as fo:
+            lines = fo.readlines()
+            cur_F = []
+            cur_Z = []
+            for ix in range(len(lines)):
+                line = lines[ix]
+                if ix == 1:
+                    float(line)
+                elif ix > 6 and line != '':
+                    xs = [float(vl) for vl in line.split('\t')]
+                    cur_F.append(xs[0])
+                    cur_Z.append(xs[1] + 1j * xs[2])
+            F_read = F_read + [cur_F]
+            Z = Z + [cur_Z]
+    return np.array(F_read).ravel(), np.array(Z).ravel()
+
+
+def pandas_read(paths):
+    import pandas as pd
+
+    spectra = []
+    for path in paths:
+        df = pd.read_csv(path, sep="\t", header=None, skiprows=7).values
+        spectra.append((df[:, 0], df[:, 1] + 1j * df[:, 2]))
+    return spectra
+
+
+def bulk_read(paths):
+    return [readers.parse_spectrum(path, 'dat') for path in paths]
+
+
+def cached_read(paths):
+    return [readers.read_file(path, 'dat') for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=2000, help='number of files')
+    parser.add_argument('--select', default='8_Barsoukov/1d', help='tutorial spectrum written in every file')
+    args = parser.parse_args()
+
+    dataset = [dataset for dataset in datasets.tutorial_datasets() if args.select in dataset['name']][0]
+    directory = tempfile.mkdtemp(prefix='pyphyeis_ingest_')
+    try:
+        paths = write_series(directory, args.files, dataset)
+        readers.PARSED_CACHE_SIZE = max(readers.PARSED_CACHE_SIZE, args.files)
+        print('{} files of {} points'.format(args.files, len(dataset['f'])))
+
+        cached_read(paths)
+        for label, func in [('line loop (legacy)', legacy_read), ('pandas.read_csv', pandas_read),
+                            ('bulk parser', bulk_read), ('parsed-data cache', cached_read)]:
+            t_start = time.perf_counter()
+            func(paths)
+            elapsed = time.perf_counter() - t_start
+            print('{:<22s} {:>9.3f}s {:>9.1f}us/file'.format(label, elapsed, 1e6 * elapsed / args.files))
+
+        # the bulk parser reads the same values as the line loop
+        f_legacy, z_legacy = legacy_read(paths[:10])
+        f_bulk = np.concatenate([entry['f'] for entry in bulk_read(paths[:10])])
+        z_bulk = np.concatenate([entry['z'] for entry in bulk_read(paths[:10])])
+        assert np.array_equal(f_legacy, f_bulk) and np.array_equal(z_legacy, z_bulk)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Fused model kernels (models/kernels.py) against the NumPy models: largest relative difference on the tutorial
+parameters and on parameter sets spread around them, for one spectrum, a batch of parameter sets and a column of
+frequencies (one per parameter set), then the time per evaluation of both backends.
+
+Without Numba the kernels run as plain Python: the differences are checked, the times are not meaningful.
+
+    python -m benchmarks.bench_kernels --sets 16
+"""
+import argparse
+import numpy as np
+from models import models, kernels
+from benchmarks import datasets
+from benchmarks.bench_cost import time_calls
+
+# spherical diffusion at low frequencies: the NumPy models lose digits in x - tanh(x), the kernels take its series
+RTOL = 1e-9
+DIMS = {'Barsoukov-Pham-Lee_1D': 1, 'Barsoukov-Pham-Lee_2D': 2, 'Barsoukov-Pham-Lee_3D': 3,
+        'Barsoukov-Pham-Lee_1D_Full cell': 1, 'Barsoukov-Pham-Lee_2D_Full cell': 2,
+        'Barsoukov-Pham-Lee_3D_Full cell': 3}
+
+
+def parameter_sets(params, par_names, n_sets, spread=1.0, seed=211):
+    """
+    The parameters, then n_sets - 1 sets with every positive parameter within spread decades around its value
+    :return: (n_sets, n_params) array
+    """
+    base = np.array([params[name] for name in par_names], dtype=np.float64)
+    rng = np.random.RandomState(seed)
+    pars = np.tile(base, (n_sets, 1))
+    positive = base > 0
+    pars[1:, positive] *= np.power(10.0, spread * (rng.rand(n_sets - 1, np.count_nonzero(positive)) - 0.5))
+    return pars
+
+
+def relative_difference(z_kernel, z_numpy):
+    return np.max(np.abs(z_kernel - z_numpy) / np.maximum(np.abs(z_numpy), 1e-300))
+
+
+def kernel_batch(model, pars, f):
+    omegas = 2 * np.pi * np.asarray(f)
+    if models.MODELS[model]['params'] is models.FULL_CELL_PARAMS:
+        return kernels.full_cell(pars, omegas, DIMS[model])
+    # half cell models add the stray LR (fixed at 1e-20) to half_cell_batch
+    return models.frequency_context(f).z_stray + kernels.half_cell(pars, omegas, DIMS[model])
+
+
+def check_model(model, params, f, n_sets):
+    """
+    :return: largest relative difference for one spectrum, a batch, a column of frequencies
+    """
+    mdl = models.MODELS[model]
+    pars = parameter_sets(params, mdl['params'], n_sets)
+    f_column = np.resize(f, n_sets)[:, np.newaxis]
+    previous = models.set_backend('numpy')
+    try:
+        z_single = mdl['func'](params, f)
+        z_batch = mdl['batch'](pars, f)
+        z_column = mdl['batch'](pars, f_column)
+    finally:
+        models.set_backend(previous)
+    return (relative_difference(kernel_batch(model, pars[:1], f)[0], z_single),
+            relative_difference(kernel_batch(model, pars, f), z_batch),
+            relative_difference(kernel_batch(model, pars, f_column), z_column))
+
+
+def time_backends(model, params, f, n_sets, number):
+    mdl = models.MODELS[model]
+    pars = parameter_sets(params, mdl['params'], n_sets)
+    times = []
+    for backend in ('numpy', 'numba'):
+        previous = models.set_backend(backend)
+        try:
+            mdl['batch'](pars, f)
+            times += time_calls([lambda: mdl['func'](params, f), lambda: mdl['batch'](pars, f)], number, repeat=5)
+        finally:
+            models.set_backend(previous)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sets', type=int, default=16, help='parameter sets of the batches')
+    parser.add_argument('--number', type=int, default=100, help='evaluations per timing')
+    parser.add_argument('--select', default='', help='only datasets whose name contains this string')
+    args = parser.parse_args()
+
+    print('Numba {}'.format(kernels.numba.__version__ if kernels.AVAILABLE else 'not installed, Python kernels'))
+    print('{:<75s} {:>11s} {:>11s} {:>11s}'.format('dataset', 'spectrum', 'batch', 'column'))
+    failed = []
+    for dataset in datasets.tutorial_datasets():
+        if args.select not in dataset['name']:
+            continue
+        differences = check_model(dataset['model'], dataset['params'], dataset['f'], args.sets)
+        print('{:<75s} {}'.format(dataset['name'], ' '.join('{:>11.2e}'.format(d) for d in differences)))
+        if max(differences) > RTOL:
+            failed.append(dataset['name'])
+
+        if kernels.AVAILABLE:
+            times = time_backends(dataset['model'], dataset['params'], dataset['f'], args.sets, args.number)
+            print('    numpy {:>9.1f}us {:>9.1f}us   numba {:>9.1f}us {:>9.1f}us'.format(*[1e6 * t for t in times]))
+    if failed:
+        raise SystemExit('Relative difference above {:.0e}: {}'.format(RTOL, ', '.join(failed)))
+    print('Kernels match the NumPy models within {:.0e}'.format(RTOL))
+
+
+if __name__ == '__main__':
+    main()
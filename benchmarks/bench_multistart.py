@@ -0,0 +1,51 @@
+"""
+Multi-start local fitting (Fitter.fit_multistart) on the tutorial datasets: distinct minima found from the starts
+and wall-clock time with one process against start_workers processes.
+
+    python -m benchmarks.bench_multistart --starts 8 --select 8_Barsoukov
+"""
+import argparse
+import numpy as np
+from models.engine import Fitter
+from benchmarks import datasets
+
+
+def run_multistart(dataset, free, method, starts, spread, workers):
+    calc_func, batch_func, jac_func, par_names = datasets.MODEL_FUNCS[dataset['model']]
+    params = dict(dataset['params'])
+    guess = np.array([params[name] for name in free]) * 1.5
+    run_obj = Fitter(1, guess, [params, method, dataset['z'], dataset['f'], dataset['z'], dataset['f'], 1,
+                                calc_func, None, None, None, None],
+                     dr_method=True, fixed_params=free, jac_func=jac_func, batch_func=batch_func,
+                     par_names=par_names, n_starts=starts, start_spread=spread, start_workers=workers)
+    return run_obj.run_fit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--starts', type=int, default=8, help='number of starts')
+    parser.add_argument('--spread', type=float, default=1.0, help='decades around the guess sampled')
+    parser.add_argument('--method', default='least_squares', help='local method')
+    parser.add_argument('--workers', type=int, default=-1, help='processes, -1 for all cores')
+    parser.add_argument('--select', default='8_Barsoukov', help='only datasets whose name contains this string')
+    args = parser.parse_args()
+
+    print('{:<60s} {:>7s} {:>13s} {:>10s} {:>10s} {:>10s}'.format('dataset', 'minima', 'best chisqr', 'serial',
+                                                                  'workers', 'saved'))
+    for dataset in datasets.tutorial_datasets():
+        if args.select not in dataset['name']:
+            continue
+        free = datasets.free_parameters(dataset['params'])
+        result = run_multistart(dataset, free, args.method, args.starts, args.spread, args.workers)
+        multistart = result['multistart']
+        print('{:<60s} {:>7d} {:>13.6e} {:>9.3f}s {:>9.3f}s {:>9.3f}s'.format(
+            dataset['name'][-60:], multistart['minima'], result['chisqr'], multistart['serial_time'],
+            multistart['wall_time'], multistart['time_saved']))
+        for rank, minimum in enumerate(result['minima']):
+            print('    {:>2d}. chisqr {:.6e}, {} start(s), success {}{}'.format(
+                rank + 1, minimum['chisqr'], minimum['count'], minimum['success'],
+                ', degenerate' if minimum['degenerate'] else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Plot export of a fit (RunFitting.plot_data, md_type 1): time and bytes written by
+- plotly.offline.plot, one HTML file with plotly.js per chart, as before models/plots.py
+- plots.PlotExport, one page with the figures as JSON and plotly.js written once
+- plots.PlotExport again with the same data (panels reused)
+
+The files are written in a temporary directory.
+
+    python -m benchmarks.bench_plots --select 8_Barsoukov/1d
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from models import plots
+from benchmarks import datasets
+
+GRAPH_NAMES = ["Impedance", "Capacitance", "Admittance", "Linear Capacitance"]
+
+
+def figures(dataset):
+    import numpy as np
+    import plotly.graph_objs as go
+
+    f_data = dataset['f']
+    z_data = dataset['z']
+    admittance = np.real(z_data) / np.abs(z_data) ** 2
+    capacitance = -np.imag(z_data) / np.abs(z_data) ** 2 / 2 / np.pi / f_data
+    traces = [(np.real(z_data), np.imag(z_data)), (f_data, capacitance), (f_data, admittance),
+              (f_data, capacitance)]
+    return [go.Figure(data=[go.Scatter(x=x, y=y, mode='lines+markers', name='Raw')], layout=go.Layout(title=name))
+            for name, (x, y) in zip(GRAPH_NAMES, traces)]
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def legacy_export(directory, dataset):
+    import plotly
+
+    with open(os.path.join(directory, 'impedance_plot.html'), 'w') as html_graphs:
+        html_graphs.write("<html><head></head><body>\n")
+        for name, fig in zip(GRAPH_NAMES, figures(dataset)):
+            file_name = 'Chart_' + name + '.html'
+            plotly.offline.plot(fig, filename=os.path.join(directory, file_name), auto_open=False,
+                                config=plots.PLOT_CONFIG)
+            html_graphs.write("  <object data=\"{}\" width=\"500\" height=\"500\" ></object>\n".format(file_name))
+        html_graphs.write("</body></html>")
+
+
+def page_export(export, dataset):
+    export.begin()
+    key = export.data_key(dataset['f'], dataset['z'])
+    names = ['Chart_' + name for name in GRAPH_NAMES]
+    if not export.is_current(names, key):
+        for name, fig in zip(names, figures(dataset)):
+            export.set_panel(name, key, fig)
+    export.write(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--select', default='8_Barsoukov/1d', help='tutorial spectrum plotted')
+    args = parser.parse_args()
+
+    dataset = [dataset for dataset in datasets.tutorial_datasets() if args.select in dataset['name']][0]
+    legacy_dir = tempfile.mkdtemp(prefix='pyphyeis_plots_')
+    page_dir = tempfile.mkdtemp(prefix='pyphyeis_plots_')
+    try:
+        t_start = time.perf_counter()
+        legacy_export(legacy_dir, dataset)
+        t_legacy = time.perf_counter() - t_start
+        print('{:<28s} {:>9.3f}s {:>9.1f} kB'.format('one file per chart', t_legacy, directory_bytes(legacy_dir) / 1e3))
+
+        export = plots.PlotExport(page_dir)
+        for label in ['single page, first', 'single page, same data']:
+            page_export(export, dataset)
+            print('{:<28s} {:>9.3f}s {:>9.1f} kB, {} panels rebuilt'.format(
+                label, export.stats['time'], export.stats['bytes'] / 1e3, export.stats['rebuilt']))
+    finally:
+        shutil.rmtree(legacy_dir)
+        shutil.rmtree(page_dir)
+
+
+if __name__ == '__main__':
+    main()
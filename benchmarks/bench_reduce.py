@@ -0,0 +1,66 @@
+"""
+Dead-element elimination and frozen sub-circuits (models.reduce_circuit) on the tutorial datasets: elements
+removed from the circuit of each template, sub-circuits computed once, largest relative difference between the
+reduced and the full model, time per evaluation of both, and least_squares fit time and chi-square with and without
+the reduction. With --only, the parameters of one sub-circuit are fitted, the others are fixed and frozen.
+
+    python -m benchmarks.bench_reduce --select 4_
+    python -m benchmarks.bench_reduce --only cathode
+"""
+import argparse
+import numpy as np
+from models import models, engine
+from benchmarks import datasets
+from benchmarks.bench_cost import time_calls
+
+
+def bench_dataset(dataset, number, start, only=None):
+    mdl = models.MODELS[dataset['model']]
+    params = {name: dataset['params'][name] for name in mdl['params']}
+    free = datasets.free_parameters(params)
+    if only is not None:
+        free = [name for name in free if name in models.SUBCIRCUIT_PARAMS[only]]
+    ctx = models.frequency_context(dataset['f'])
+    circuit = models.reduce_circuit(dataset['model'], params, free, ctx)
+
+    z_full = mdl['func'](params, ctx)
+    z_reduced = circuit.func(params, ctx)
+    difference = np.max(np.abs(z_reduced - z_full) / np.abs(z_full))
+    t_full, t_reduced = time_calls([lambda: mdl['func'](params, ctx), lambda: circuit.func(params, ctx)], number)
+
+    start_params = dict(params)
+    for name in free:
+        start_params[name] = start * params[name]
+    fits = [engine.fit(dataset['model'], dataset['f'], dataset['z'], start_params, free, method='least_squares',
+                       reduce_circuit=reduce) for reduce in (False, True)]
+    return circuit, difference, t_full, t_reduced, fits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=100, help='evaluations per timing')
+    parser.add_argument('--start', type=float, default=1.2, help='start of the fits: tutorial parameters * start')
+    parser.add_argument('--select', default='', help='only datasets whose name contains this string')
+    parser.add_argument('--only', choices=sorted(models.SUBCIRCUIT_PARAMS),
+                        help='fit only the parameters of this sub-circuit')
+    args = parser.parse_args()
+
+    for dataset in datasets.tutorial_datasets():
+        if args.select not in dataset['name']:
+            continue
+        if args.only is not None and not any(args.only == subcircuit['name'] and
+                                             models.circuit_kind(dataset['model']) in subcircuit['circuits']
+                                             for subcircuit in models.SUBCIRCUITS):
+            continue
+        circuit, difference, t_full, t_reduced, fits = bench_dataset(dataset, args.number, args.start, args.only)
+        print(dataset['name'])
+        print('    removed: {}'.format(', '.join(circuit.elements()) or 'nothing'))
+        print('    frozen:  {}'.format(', '.join(circuit.frozen_labels()) or 'nothing'))
+        print('    model  full {:>9.1f}us  reduced {:>9.1f}us  max relative difference {:.1e}'.format(
+            1e6 * t_full, 1e6 * t_reduced, difference))
+        print('    fit    full {:>9.3f}s   reduced {:>9.3f}s   chi-square {:.6e} / {:.6e}'.format(
+            fits[0].fit_time, fits[1].fit_time, fits[0].chisqr, fits[1].chisqr))
+
+
+if __name__ == '__main__':
+    main()
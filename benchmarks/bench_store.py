@@ -0,0 +1,57 @@
+"""
+Spectrum store (models/store.py) against text files: time to build the store, then to read every spectrum
+from the text files (parser, no cache) and from the memory mapped store.
+
+    python -m benchmarks.bench_store --files 10000
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from models import readers, store
+from benchmarks import datasets
+from benchmarks.bench_ingest import write_series
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=10000, help='number of spectra')
+    parser.add_argument('--select', default='8_Barsoukov/1d', help='tutorial spectrum written in every file')
+    args = parser.parse_args()
+
+    dataset = [dataset for dataset in datasets.tutorial_datasets() if args.select in dataset['name']][0]
+    directory = tempfile.mkdtemp(prefix='pyphyeis_store_')
+    try:
+        paths = write_series(directory, args.files, dataset)
+        store_path = os.path.join(directory, 'spectra.store')
+        print('{} spectra of {} points'.format(args.files, len(dataset['f'])))
+
+        t_start = time.perf_counter()
+        store.SpectrumStore(store_path, mode='a').append_files(paths)
+        print('{:<28s} {:>9.3f}s'.format('build store', time.perf_counter() - t_start))
+
+        t_start = time.perf_counter()
+        total_text = sum(np.sum(readers.parse_spectrum(path)['z']) for path in paths)
+        t_text = time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        spectra = store.SpectrumStore(store_path)
+        total_store = sum(np.sum(spectra.spectrum(idx)[1]) for idx in range(len(spectra)))
+        t_store = time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        selected = spectra.select(temperature=(25.0, 30.0))
+        t_select = time.perf_counter() - t_start
+
+        for label, elapsed in [('read all, text files', t_text), ('read all, store', t_store)]:
+            print('{:<28s} {:>9.3f}s {:>9.1f}us/spectrum'.format(label, elapsed, 1e6 * elapsed / args.files))
+        print('{:<28s} {:>9.3f}ms, {} spectra'.format('select 25-30 C', 1e3 * t_select, len(selected)))
+        assert total_text == total_store
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark and regression suite on the tutorial datasets (tutorials/Examples)
+
+- model: time per evaluation of each Barsoukov_Pham_Lee* model, and of its analytic Jacobian
+- cost: time per evaluation of models.cost_vector under each weighting
+- fit: wall-clock time, nfev and chi-square of a full fit for each optimizer, started from the tutorial
+  parameters scaled by --start. The fits are of the whole circuit: removing its dead elements
+  (models.reduce_circuit, --reduce-circuit) changes the rounding of the model, so the chi-squares of the fits
+  ending at the rounding noise, or stopped by the iteration limit, are not comparable (see bench_reduce.py)
+
+Model outputs, cost vectors and fitted chi-squares are compared with benchmarks/golden.npz, the script exits
+with 1 if one of them changed. Timings are written as JSON (--output) to compare versions.
+
+    python -m benchmarks.bench_suite --output bench.json
+    python -m benchmarks.bench_suite --select 8_ --skip-fits
+    python -m benchmarks.bench_suite --update-golden
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import numpy as np
+import scipy
+from models import models, jacobian, engine
+from benchmarks import datasets
+from benchmarks.bench_cost import time_calls
+
+GOLDEN_PATH = os.path.join(datasets.ROOT_DIR, 'benchmarks', 'golden.npz')
+# relative tolerances of the golden check
+GOLDEN_RTOL = {'model': 1e-10, 'cost': 1e-10, 'fit': 1e-6}
+WEIGHTING_INDEX = [1, 2, 3, 4, 5]
+
+
+def environment():
+    """
+    Versions and machine the timings were measured on
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=datasets.ROOT_DIR,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def bench_models(dataset, number):
+    """
+    :return: list of records, dict of golden arrays
+    """
+    mdl = models.MODELS[dataset['model']]
+    params = {name: dataset['params'][name] for name in mdl['params']}
+    jac_func = jacobian.MODEL_JACOBIANS[dataset['model']]
+    t_model, t_jac = time_calls([lambda: mdl['func'](params, dataset['f']),
+                                 lambda: jac_func(params, dataset['f'])], number)
+    records = [{'benchmark': 'model', 'dataset': dataset['name'], 'model': dataset['model'],
+                'n_freqs': len(dataset['f']), 'time': t_model},
+               {'benchmark': 'jacobian', 'dataset': dataset['name'], 'model': dataset['model'],
+                'n_freqs': len(dataset['f']), 'time': t_jac}]
+    return records, {'model/' + dataset['name']: mdl['func'](params, dataset['f'])}
+
+
+def bench_costs(dataset, number):
+    mdl = models.MODELS[dataset['model']]
+    params = {name: dataset['params'][name] for name in mdl['params']}
+    free = datasets.free_parameters(params)
+    layout = models.ParameterLayout(mdl['params'], params, free)
+    guess = np.array([params[name] for name in free])
+
+    funcs = []
+    for weighting in WEIGHTING_INDEX:
+        args = (dataset['z'], dataset['f'], weighting, mdl['func'], None, None, None, free, layout)
+        funcs.append(lambda args=args: models.cost_vector(guess, *args))
+    times = time_calls(funcs, number)
+
+    records = []
+    golden = {}
+    for weighting, t_cost, func in zip(WEIGHTING_INDEX, times, funcs):
+        records.append({'benchmark': 'cost', 'dataset': dataset['name'], 'model': dataset['model'],
+                        'weighting': engine.WEIGHTINGS[weighting - 1], 'n_free': len(free), 'time': t_cost})
+        golden['cost/{}/{}'.format(dataset['name'], weighting)] = func()
+    return records, golden
+
+
+def bench_fits(dataset, methods, niters, diev_niters, start, weighting, reduce_circuit=False):
+    mdl = models.MODELS[dataset['model']]
+    params = {name: dataset['params'][name] for name in mdl['params']}
+    free = datasets.free_parameters(params)
+    start_params = dict(params)
+    for name in free:
+        start_params[name] = start * params[name]
+
+    records = []
+    golden = {}
+    for method in methods:
+        # differential evolution draws its population from the global numpy generator
+        np.random.seed(211)
+        method_niters = diev_niters if method == 'differential_evolution' else niters
+        result = engine.fit(dataset['model'], dataset['f'], dataset['z'], start_params, free, weighting=weighting,
+                            method=method, niters=method_niters, reduce_circuit=reduce_circuit)
+        records.append({'benchmark': 'fit', 'dataset': dataset['name'], 'model': dataset['model'], 'method': method,
+                        'weighting': weighting, 'niters': method_niters, 'n_free': len(free),
+                        'time': result.fit_time, 'nfev': int(result.nfev), 'chisqr': float(result.chisqr),
+                        'success': bool(result.success)})
+        # the fitted chi-square depends on the settings, they are part of the key
+        key = 'fit/{}/{}/{}/{}/{}'.format(dataset['name'], method, weighting, method_niters, start)
+        if reduce_circuit:
+            key += '/reduced'
+        golden[key] = np.array(result.chisqr)
+    return records, golden
+
+
+def compare_golden(outputs, golden):
+    """
+    :return: list of (key, max relative difference) above tolerance, keys missing in golden
+    """
+    changed = []
+    missing = []
+    for key, value in outputs.items():
+        if key not in golden:
+            missing.append(key)
+            continue
+        ref = golden[key]
+        scale = np.max(np.abs(ref)) if ref.size else 0.0
+        diff = np.max(np.abs(value - ref)) / scale if scale > 0 else np.max(np.abs(value - ref))
+        if not diff <= GOLDEN_RTOL[key.split('/')[0]]:
+            changed.append((key, diff))
+    return changed, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--select', default='', help='only datasets whose name contains this string')
+    parser.add_argument('--number', type=int, default=100, help='evaluations per model / cost timing')
+    parser.add_argument('--methods', nargs='*', default=engine.METHODS, choices=engine.METHODS)
+    parser.add_argument('--niters', type=int, default=200, help='iterations of each fit')
+    parser.add_argument('--diev-niters', type=int, default=10, help='generations of differential evolution')
+    parser.add_argument('--start', type=float, default=1.2, help='start of the fits: tutorial parameters * start')
+    parser.add_argument('--weighting', default='dataModulus', choices=engine.WEIGHTINGS, help='weighting of the fits')
+    parser.add_argument('--skip-fits', action='store_true')
+    parser.add_argument('--reduce-circuit', action='store_true', help='fit without the dead elements of the circuits')
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--update-golden', action='store_true', help='store the current outputs as golden')
+    args = parser.parse_args()
+
+    records = []
+    outputs = {}
+    for dataset in datasets.tutorial_datasets():
+        if args.select not in dataset['name']:
+            continue
+        benches = [bench_models(dataset, args.number), bench_costs(dataset, args.number)]
+        if not args.skip_fits:
+            benches.append(bench_fits(dataset, args.methods, args.niters, args.diev_niters, args.start,
+                                     args.weighting, args.reduce_circuit))
+        for bench_records, golden in benches:
+            records.extend(bench_records)
+            outputs.update(golden)
+
+        print(dataset['name'])
+        for record in records:
+            if record['dataset'] != dataset['name']:
+                continue
+            if record['benchmark'] == 'fit':
+                print('    {:<30s} {:>10.3f}s   nfev {:>6d}  chi-square {:.6e}  {}'.format(
+                    'fit ' + record['method'], record['time'], record['nfev'], record['chisqr'],
+                    'Success' if record['success'] else 'Failed'))
+            else:
+                print('    {:<30s} {:>10.1f}us'.format(record['benchmark'] + ' ' + record.get('weighting', ''),
+                                                      1e6 * record['time']))
+
+    status = 0
+    if args.update_golden:
+        golden = dict(np.load(GOLDEN_PATH)) if os.path.exists(GOLDEN_PATH) else {}
+        golden.update(outputs)
+        np.savez_compressed(GOLDEN_PATH, **golden)
+        print('Golden outputs written to {} ({} entries)'.format(GOLDEN_PATH, len(golden)))
+        golden_report = {'changed': [], 'missing': []}
+    else:
+        golden = dict(np.load(GOLDEN_PATH)) if os.path.exists(GOLDEN_PATH) else {}
+        changed, missing = compare_golden(outputs, golden)
+        for key, diff in changed:
+            print('CHANGED {}: max relative difference {:.3e}'.format(key, diff))
+        if missing:
+            print('{} outputs without golden value, run with --update-golden'.format(len(missing)))
+        print('Golden check: {} compared, {} changed'.format(len(outputs) - len(missing), len(changed)))
+        golden_report = {'changed': [{'key': key, 'diff': float(diff)} for key, diff in changed],
+                         'missing': missing}
+        if changed:
+            status = 1
+
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump({'environment': environment(), 'settings': vars(args), 'golden': golden_report,
+                       'results': records}, fp, indent=1)
+        print('Results written to {}'.format(args.output))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
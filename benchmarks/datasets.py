@@ -0,0 +1,68 @@
+"""
+Tutorial datasets (tutorials/Examples) used by the benchmarks
+"""
+import os
+import glob
+from models import models, jacobian, readers
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES_DIR = os.path.join(ROOT_DIR, 'tutorials', 'Examples')
+
+# Spectra whose parameter file does not follow the "<dim>d_<name>.csv" / "<name>.csv" convention
+EXTRA_DATASETS = [
+    ('10_Fitting experimental data', 'G_EIS(26).txt', 'Barsoukov Qw liq.csv', 'Barsoukov-Pham-Lee_1D_Full cell'),
+]
+
+MODEL_FUNCS = {name: (mdl['func'], mdl['batch'], jacobian.MODEL_JACOBIANS[name], mdl['params'])
+               for name, mdl in models.MODELS.items()}
+
+
+def read_spectrum(data_path):
+    """
+    Tab separated frequency, Z', Z'' file, as FittingImpedance.dx30_read_data
+    """
+    f_data, z_data, _, _ = readers.read_spectrum(data_path)
+    return f_data, z_data
+
+
+def read_parameters(csv_path):
+    """
+    Parameter file written by FittingImpedance.saveParameters
+    :return: dict of parameter values (lower case names as sent by the GUI)
+    """
+    par_names, par_values, _ = readers.read_parameters(csv_path)
+    return dict(zip(par_names, par_values))
+
+
+def free_parameters(params):
+    """
+    Parameters not removed from the circuit (not fixed at 1e-20 or 1e20)
+    """
+    return [name for name, value in params.items() if 1e-15 < abs(value) < 1e15]
+
+
+def tutorial_datasets():
+    """
+    :return: list of dicts with name, model, f, z, params
+    """
+    found = []
+    for data_path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*', '[123]d_*.txt'))):
+        folder, file_name = os.path.split(data_path)
+        dim, stem = file_name[0], file_name[3:-4]
+        for csv_name in (file_name[:-4] + '.csv', stem + '.csv'):
+            csv_path = os.path.join(folder, csv_name)
+            if os.path.exists(csv_path):
+                found.append((data_path, csv_path, 'Barsoukov-Pham-Lee_{}D'.format(dim)))
+                break
+
+    for folder, file_name, csv_name, model_name in EXTRA_DATASETS:
+        found.append((os.path.join(EXAMPLES_DIR, folder, file_name), os.path.join(EXAMPLES_DIR, folder, csv_name),
+                      model_name))
+
+    datasets = []
+    for data_path, csv_path, model_name in found:
+        f, z = read_spectrum(data_path)
+        params = read_parameters(csv_path)
+        datasets.append({'name': os.path.relpath(data_path, EXAMPLES_DIR), 'model': model_name, 'f': f, 'z': z,
+                         'params': params})
+    return datasets
@@ -0,0 +1,177 @@
+"""
+On-disk cache of fit results
+
+Entries are keyed by a hash of the data, model, parameter layout (free names, fixed values, initial values),
+weighting, method and optimizer settings, and of the code computing the fit (model_tag). Each entry is one file
+named <data key>_<free key>_<key>.pkl:
+- data key: data arrays and model, free key: names of the free parameters
+- an exact hit returns the stored result, of a fit by the same model code and backend
+- a near miss (same data, model and free parameters, anything else different, e.g. a fixed value, the weighting or
+  the version of the code) gives the fitted free parameters of the most recently used entry, to start the new fit
+  from
+The least recently used entries are removed when the directory grows above max_bytes.
+Files are written to a temporary name then renamed, so several processes can share a cache.
+"""
+import os
+import glob
+import pickle
+import hashlib
+import numpy as np
+from models import models
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.pyphyeis', 'fit_cache')
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+# format of the entries, and modules whose code changes the fitted values
+CACHE_VERSION = 1
+MODEL_MODULES = ('models.py', 'jacobian.py', 'kernels.py', 'laws.py', 'engine.py')
+_source_key = None
+
+
+def hash_items(items):
+    """
+    sha1 of a list of arrays / values
+    """
+    sha = hashlib.sha1()
+    for item in items:
+        if isinstance(item, np.ndarray):
+            sha.update(str(item.dtype).encode())
+            sha.update(str(item.shape).encode())
+            sha.update(np.ascontiguousarray(item).tobytes())
+        else:
+            sha.update(repr(item).encode())
+        sha.update(b'|')
+    return sha.hexdigest()[:20]
+
+
+def model_tag():
+    """
+    Version of the code computing the fits: entry format, sha1 of the sources of MODEL_MODULES (computed once, the
+    entry format only where the sources are not shipped) and backend of the models (models.BACKEND)
+    """
+    global _source_key
+    if _source_key is None:
+        sources = []
+        for file_name in MODEL_MODULES:
+            try:
+                with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name), 'rb') as fp:
+                    sources.append(fp.read())
+            except OSError:
+                sources.append(None)
+        _source_key = hash_items(sources)
+    return CACHE_VERSION, _source_key, models.BACKEND
+
+
+class FitCache(object):
+    """
+    Fit results stored in a directory, with hit / warm start / miss counters of this instance
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.warm_starts = 0
+        self.misses = 0
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def keys(self, model_name, f_data, z_data, fp_data, zp_data, params_dict, guess_names, guess_values, settings):
+        """
+        :param params_dict: dict of all parameter values (fixed ones are part of the key)
+        :param guess_names: free parameters
+        :param guess_values: initial values of the free parameters
+        :param settings: tuple of the other settings changing the result (weighting, method, iterations, ...)
+        :return: data key, free key, key (with model_tag)
+        """
+        data_key = hash_items([model_name, np.asarray(f_data), np.asarray(z_data), np.asarray(fp_data),
+                               np.asarray(zp_data)])
+        free_key = hash_items(list(guess_names))
+        fixed = [(name, float(params_dict[name])) for name in sorted(params_dict) if name not in guess_names]
+        key = hash_items([data_key, free_key, fixed, [float(v) for v in guess_values], settings, model_tag()])
+        return data_key, free_key, key
+
+    def entry_path(self, keys):
+        return os.path.join(self.cache_dir, '_'.join(keys) + '.pkl')
+
+    def get(self, keys):
+        """
+        :param keys: output of FitCache.keys
+        :return: ('hit', stored entry), ('warm', stored entry of a near miss) or ('miss', None)
+        """
+        path = self.entry_path(keys)
+        entry = self.load(path)
+        if entry is not None:
+            self.hits += 1
+            return 'hit', entry
+
+        near = glob.glob(os.path.join(self.cache_dir, '{}_{}_*.pkl'.format(keys[0], keys[1])))
+        for near_path in sorted(near, key=self.last_used, reverse=True):
+            entry = self.load(near_path)
+            if entry is not None:
+                self.warm_starts += 1
+                return 'warm', entry
+
+        self.misses += 1
+        return 'miss', None
+
+    def put(self, keys, entry):
+        """
+        Store a fit result
+        :param entry: picklable dict, e.g. {'result': Fitter.result, 'zf': Fitter.zf}
+        """
+        path = self.entry_path(keys)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as fp:
+            pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def load(self, path):
+        try:
+            with open(path, 'rb') as fp:
+                entry = pickle.load(fp)
+            # access time kept in the modification time, for the LRU eviction
+            os.utime(path, None)
+        except Exception:
+            # missing, removed meanwhile, or written by an incompatible version
+            return None
+        return entry
+
+    @staticmethod
+    def last_used(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        total = 0
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            entries.append((self.last_used(path), size, path))
+            total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+            os.remove(path)
+
+    def stats(self):
+        paths = glob.glob(os.path.join(self.cache_dir, '*.pkl'))
+        return {'hits': self.hits, 'warm_starts': self.warm_starts, 'misses': self.misses, 'entries': len(paths),
+                'bytes': sum(os.path.getsize(path) for path in paths)}
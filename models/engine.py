@@ -0,0 +1,991 @@
+"""
+Fitting engine, importable without PyQt5, plotly or pandas
+SciPy is only imported when a fit runs
+
+    from models import engine
+    result = engine.fit("Barsoukov-Pham-Lee_1D", f, z, params, ['r_ct', 'c_dl'], weighting='unit',
+                        method='least_squares')
+
+With n_starts > 1, a local method is run from n_starts points sampled around the guess (Latin hypercube in log10 of
+the parameters), concurrently with start_workers processes; the distinct minima are ranked by chi-square.
+
+A fit is cancelled by setting its cancel event (Fitter.cancel, or the cancel argument of fit) from another thread:
+it stops at the next cost evaluation and returns the best parameters evaluated so far, with their chi-square.
+"""
+import time
+import itertools
+import threading
+import numpy as np
+from functools import partial
+from models import models, jacobian, telemetry
+
+WEIGHTINGS = ['unit', 'dataProportional', 'calcProportional', 'dataModulus', 'calcModulus']
+METHODS = ['leastsq', 'least_squares', 'minimize', 'differential_evolution']
+# seconds between two checks of the cancel event while the local fits of a multi-start run in worker processes
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class Fitter(object):
+    """
+    Qt-free fitting / simulation of one dataset, RunFitting runs it in a QThread
+    """
+
+    def __init__(self, isFit, guess, ls_params, dr_method=False, fixed_params=None, minimize_method='L-BFGS-B',
+                 md_type=1, name_dict=None, niters=1e+6, jac_func=None, batch_func=None, par_names=None,
+                 diev_bounds=None, diev_workers=1, diev_polish=True, progress_callback=None, progress_interval=0.5,
+                 cache=None, model_name=None, cancel_event=None, n_starts=1, start_spread=1.0, start_workers=1,
+                 start_seed=211, start_rtol=1e-3, reduce_circuit=True):
+        """
+
+        :param isFit:
+        :param guess: list of values will be fit (free parameters)
+        :param ls_params: dictionary, dict of parameters (fixed, free)
+        :param dr_method: use dr method or not
+        :param jac_func: analytic derivative of calc_func (see models/jacobian.py), None for finite differences
+        :param batch_func: batched calc_func, used to evaluate a whole differential evolution population at once
+        :param par_names: column order of batch_func
+        :param diev_bounds: dict, parameter name -> (min, max) for differential evolution, default one decade
+                            around the guess, -10 to 10 times its magnitude for a signed parameter; needed for a
+                            parameter starting at 0
+        :param diev_workers: processes for differential evolution, -1 for all cores, 1 to vectorize with batch_func
+        :param diev_polish: refine the differential evolution result with least_squares
+        :param progress_callback: called with the last telemetry.FitTrace record during the fit
+        :param progress_interval: seconds between two progress_callback calls
+        :param cache: cache.FitCache, reuse a stored result or start from a near one (needs model_name)
+        :param model_name: model name, key of models.MODELS
+        :param cancel_event: threading.Event, set to cancel the fit (see cancel)
+        :param n_starts: number of local fits from different starts, the guess being the first one (see
+                         fit_multistart); not for differential evolution
+        :param start_spread: width, in decades, of the box the starts are sampled in, centered on the guess
+        :param start_workers: processes running the local fits, -1 for all cores
+        :param start_seed: seed of the sampling
+        :param start_rtol: relative tolerance under which two fits (parameters) are the same minimum, and two minima
+                           (chi-square) are degenerate
+        :param reduce_circuit: fit the model of models.MODELS (model_name) without the elements that are open or
+                               short circuits at the initial values, computing once the sub-circuits of fixed
+                               parameters (see models.reduce_circuit)
+        """
+        self.params_dict, self.recv_method, self.zp_data, self.fp_data, self.z_data, self.f_data, self.recv_wgt_index, self.calc_func, self.tp_data, self.t_data, self.volp_data, self.vol_data = ls_params
+        # frequency terms of the models (models.FrequencyContext), computed once for all evaluations
+        self.fp_context = models.frequency_context(self.fp_data) if self.fp_data is not None else None
+        self.f_context = models.frequency_context(self.f_data) if self.f_data is not None else None
+        self.result = None
+        self.zf = None
+        self.isFit = isFit
+        self.fitReport = None
+        self.Dr = dr_method
+        self.epsilon = np.finfo('float64').eps
+        if self.Dr:
+            self.init_val = np.ones(len(guess))
+            self.guess = guess
+        else:
+            self.init_val = guess
+            self.guess = None
+        self.p_cov = None
+        self.perror = None
+        self.perror_percent = None
+        self.params_ret = None
+        self.nfev = None
+        self.mesg = None
+        self.minimize_method = minimize_method
+        self.guess_names = fixed_params
+        self.chisqr = -1
+        self.reduced_chisqr = -1
+        self.success = False
+        self.model_type = md_type
+        self.name_dict = name_dict
+        self.niters = int(niters)
+        self.nfev = -1
+        self.jac_func = jac_func
+        self.batch_func = batch_func
+        self.par_names = par_names
+        self.diev_bounds = diev_bounds
+        self.diev_workers = diev_workers
+        self.diev_polish = diev_polish
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.trace = None
+        self.cache = cache
+        self.model_name = model_name
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.cancelled = False
+        self.n_starts = int(n_starts)
+        self.start_spread = start_spread
+        self.start_workers = start_workers
+        self.start_seed = start_seed
+        self.start_rtol = start_rtol
+        # circuit fitted: the model without its dead elements and with its fixed sub-circuits computed once, for a
+        # fit of a model of models.MODELS
+        self.circuit = None
+        if reduce_circuit and isFit == 1 and model_name in models.MODELS and \
+                self.calc_func is models.MODELS[model_name]['func']:
+            self.circuit = models.reduce_circuit(model_name, self.params_dict, self.guess_names, self.fp_context)
+            self.calc_func = self.circuit.func
+            if self.batch_func is not None:
+                self.batch_func = self.circuit.batch
+            if self.jac_func is not None and self.jac_func is jacobian.MODEL_JACOBIANS.get(model_name):
+                self.jac_func = self.circuit.jacobian(self.jac_func)
+            print(self.circuit.describe())
+        # parameters passed to the cost functions: array layout when the parameter order of the model is known
+        if par_names is not None:
+            self.cost_params = models.ParameterLayout(par_names, self.params_dict, self.guess_names)
+        else:
+            self.cost_params = self.params_dict
+
+    def cost_jacobian(self):
+        """
+        Jacobian callable of models.cost_vector, None if the model has no analytic derivative
+        :return:
+        """
+        if self.jac_func is None:
+            return None
+        return partial(jacobian.cost_jacobian, jac_func=self.jac_func)
+
+    def cost_gradient(self):
+        """
+        Gradient callable of models.cost_scalar, None if the model has no analytic derivative
+        :return:
+        """
+        if self.jac_func is None:
+            return None
+        return partial(jacobian.cost_gradient, jac_func=self.jac_func)
+
+    def traced(self, func, kind, log10=False, linear=None):
+        """
+        Cost function recorded in self.trace (see telemetry.TracedCost), func itself when not tracing
+        The trace holds the parameters fitted by the other stages: relative values with dr_method
+        """
+        if self.trace is None:
+            return func
+        return self.trace.wrap(func, kind, log10, scale=self.guess if log10 and self.Dr else None, linear=linear)
+
+    def circuit_description(self):
+        return self.circuit.describe() if self.circuit is not None else None
+
+    def cancel(self):
+        """
+        Stop the fit at the next cost evaluation, from another thread; run_fit returns the best parameters so far
+        """
+        self.cancel_event.set()
+
+    def keep_best(self):
+        """
+        Result of a cancelled fit: the best parameters evaluated so far (self.trace), without covariance
+        """
+        if self.trace.best_x is not None:
+            self.params_ret = np.array(self.trace.best_x)
+        else:
+            self.params_ret = np.array(self.init_val, dtype=np.float64)
+        self.p_cov = None
+        self.nfev = self.trace.nfev
+        self.success = False
+        self.cancelled = True
+        self.mesg = "Cancelled after {} function evaluations, best parameters so far".format(self.trace.nfev)
+
+    def set_stage(self, stage):
+        if self.trace is not None:
+            self.trace.stage = stage
+
+    def fit_leastsq(self):
+        """
+        Leastsq fitting SciPy
+        lm
+        :return:
+        """
+        from scipy.optimize import leastsq
+
+        self.set_stage('leastsq')
+        pv, cv, infodict, mesg, ier = leastsq(self.traced(models.cost_vector, 'vector'), self.init_val,
+                                              args=(self.zp_data, self.fp_context, self.recv_wgt_index, self.calc_func,
+                                                    self.tp_data, self.volp_data, self.guess, self.guess_names,
+                                                    self.cost_params),
+                                              Dfun=self.traced(self.cost_jacobian(), 'jacobian'),
+                                              maxfev=self.niters,
+                                              ftol=self.epsilon, gtol=self.epsilon, xtol=self.epsilon, full_output=True)
+
+        self.params_ret = pv
+        self.nfev = infodict['nfev']
+        self.mesg = mesg
+        if cv is not None:
+            self.p_cov = cv * models.cost_scalar(self.params_ret, self.zp_data, self.fp_context,
+                                                 self.recv_wgt_index, self.calc_func, self.tp_data,
+                                                 self.volp_data, self.guess, self.guess_names,
+                                                 self.cost_params) / (self.zp_data.size - self.init_val.size)
+        self.p_cov = cv
+
+        if ier in [1, 2, 3, 4]:
+            self.success = True
+        else:
+            self.success = False
+
+    def fit_leastsquares(self):
+        """
+        Leastsquares
+        trf
+        :return:
+        """
+        from scipy.optimize import least_squares
+
+        self.set_stage('least_squares')
+        r_lsq = least_squares(self.traced(models.cost_vector, 'vector'), self.init_val,
+                              args=(self.zp_data, self.fp_context, self.recv_wgt_index, self.calc_func, self.tp_data,
+                                    self.volp_data, self.guess, self.guess_names, self.cost_params),
+                              jac=self.traced(self.cost_jacobian(), 'jacobian') or '2-point',
+                              max_nfev=self.niters,
+                              ftol=self.epsilon, gtol=self.epsilon, xtol=self.epsilon, verbose=1)
+
+        print("The number of function calls: ", r_lsq.nfev)
+        self.mesg = r_lsq.message
+        self.success = r_lsq.success
+        self.nfev = r_lsq.nfev
+        self.params_ret = r_lsq.x
+        _, s, vh = np.linalg.svd(r_lsq.jac, full_matrices=False)
+        threshold = self.epsilon * np.max(r_lsq.jac.shape) * s[0]
+        s = s[s > threshold]
+        vh = vh[:s.size]
+        p_cov = np.dot(vh.T / s ** 2, vh)
+
+        self.p_cov = p_cov * models.cost_scalar(self.params_ret, self.zp_data, self.fp_context,
+                                                self.recv_wgt_index, self.calc_func, self.tp_data,
+                                                self.volp_data, self.guess, self.guess_names,
+                                                self.cost_params) / (2*self.zp_data.size - self.init_val.size)
+
+    def fit_minimize(self):
+        """
+        Minimize
+        :return:
+        """
+        from scipy.optimize import minimize
+
+        self.set_stage('minimize')
+        r_bfgs = minimize(self.traced(models.cost_scalar, 'scalar'), self.init_val,
+                          args=(self.zp_data, self.fp_context, self.recv_wgt_index, self.calc_func, self.tp_data,
+                                self.volp_data, self.guess, self.guess_names, self.cost_params),
+                          method=self.minimize_method, jac=self.traced(self.cost_gradient(), 'jacobian'),
+                          tol=self.epsilon,
+                          options={'maxcor': 100, 'maxfun': self.niters, 'maxiter': self.niters, 'ftol': self.epsilon,
+                                   'gtol': self.epsilon})
+
+        self.params_ret = r_bfgs.x
+        hess_inv = r_bfgs.hess_inv.todense()
+        self.p_cov = 2.0 * hess_inv * models.cost_scalar(self.params_ret, self.zp_data, self.fp_context,
+                                                         self.recv_wgt_index, self.calc_func, self.tp_data,
+                                                         self.volp_data, self.guess, self.guess_names,
+                                                         self.cost_params) / (2*self.zp_data.size - self.init_val.size)
+        self.success = r_bfgs.success
+        self.nfev = r_bfgs.nfev
+        self.mesg = r_bfgs.message
+
+    def diev_linear(self, guess_values):
+        """
+        Free parameters differential evolution searches in linear space: signed parameters (models.is_signed) and
+        initial values at 0, which have no log10
+        :return: boolean array
+        """
+        return np.array([models.is_signed(gs_name) or guess_values[idx] == 0
+                         for idx, gs_name in enumerate(self.guess_names)], dtype=bool)
+
+    def diev_log_bounds(self, guess_values, linear):
+        """
+        Bounds of the free parameters for differential evolution: log10 of (min, max), (min, max) themselves for the
+        linear parameters (see diev_linear).
+        Without a diev_bounds entry, 0.1 to 10 times the initial value, -10 to 10 times its magnitude for a signed
+        parameter; a parameter starting at 0 needs an entry
+        :param guess_values: initial values of the free parameters
+        :param linear: boolean mask of the linear parameters
+        :return:
+        """
+        bnds = []
+        for idx, gs_name in enumerate(self.guess_names):
+            value = guess_values[idx]
+            if self.Dr and value == 0:
+                raise ValueError("Differential evolution: {} starts at 0, it cannot be fitted relative to its initial "
+                                 "value (dr_method)".format(gs_name))
+            if self.diev_bounds is not None and gs_name in self.diev_bounds:
+                lo, hi = self.diev_bounds[gs_name]
+            elif value == 0:
+                raise ValueError("Differential evolution: {} starts at 0, give its bounds (diev_bounds)"
+                                 .format(gs_name))
+            elif linear[idx]:
+                lo, hi = -10.0 * abs(value), 10.0 * abs(value)
+            else:
+                lo, hi = 0.1 * value, 10.0 * value
+            if not linear[idx] and lo <= 0:
+                raise ValueError("Differential evolution: the bounds of {} must be positive, got ({}, {})"
+                                 .format(gs_name, lo, hi))
+            if not lo < hi:
+                raise ValueError("Differential evolution: invalid bounds of {}: ({}, {})".format(gs_name, lo, hi))
+            bnds.append((lo, hi) if linear[idx] else (np.log10(lo), np.log10(hi)))
+        return bnds
+
+    def fit_diev(self):
+        """
+        Differential evolution fitting in log10 parameter space, in linear space for the signed parameters and
+        those starting at 0 (diev_linear)
+        The population is evaluated with one batched model call per generation (batch_func),
+        or in diev_workers processes, then polished with least_squares
+        :return:
+        """
+        from scipy.optimize import differential_evolution
+
+        guess_values = np.multiply(self.init_val, self.guess) if self.Dr else np.asarray(self.init_val)
+        linear = self.diev_linear(guess_values)
+        bnds = self.diev_log_bounds(guess_values, linear)
+        linear = linear if linear.any() else None
+
+        self.set_stage('differential_evolution')
+        is_vectorized = self.batch_func is not None and self.diev_workers == 1
+        callback = None
+        if is_vectorized:
+            cost_func = self.traced(models.cost_scalar_log10_batch, 'batch', log10=True, linear=linear)
+            args = (self.zp_data, self.fp_context, self.recv_wgt_index, self.batch_func, self.tp_data, self.volp_data,
+                    None, self.guess_names, self.cost_params, self.par_names, linear)
+        else:
+            args = (self.zp_data, self.fp_context, self.recv_wgt_index, self.calc_func, self.tp_data, self.volp_data,
+                    None, self.guess_names, self.cost_params, linear)
+            if self.diev_workers == 1:
+                cost_func = self.traced(models.cost_scalar_log10, 'scalar', log10=True, linear=linear)
+            else:
+                # the workers get a copy of the cost function, trace the best member of each generation instead
+                # and stop between generations once cancelled
+                cost_func = models.cost_scalar_log10
+                if self.trace is not None:
+                    traced_cost = self.traced(models.cost_scalar_log10, 'scalar', log10=True, linear=linear)
+                    n_members = 15 * len(bnds)
+
+                    def callback(xk, convergence=None):
+                        if self.trace.cancelled:
+                            return True
+                        traced_cost(xk, *args)
+                        self.trace.nfev += n_members - 1
+
+        r_diev = differential_evolution(cost_func, bnds, args=args, maxiter=self.niters, tol=0.0001,
+                                        polish=False, vectorized=is_vectorized, workers=self.diev_workers,
+                                        updating='immediate' if self.diev_workers == 1 and not is_vectorized
+                                        else 'deferred', callback=callback)
+
+        best = models.from_log10(r_diev.x, linear)
+        self.init_val = best / self.guess if self.Dr else best
+        self.params_ret = self.init_val
+        self.nfev = r_diev.nfev
+        self.mesg = r_diev.message
+        self.success = r_diev.success
+        if self.trace is not None and self.trace.cancelled:
+            # stopped between two generations (callback): best member so far, not polished
+            self.success = False
+            self.cancelled = True
+            self.mesg = "Cancelled after {} function evaluations, best parameters so far".format(r_diev.nfev)
+            return
+
+        if self.diev_polish:
+            self.fit_leastsquares()
+            self.nfev += r_diev.nfev
+            self.mesg = "{0} Polish: {1}".format(r_diev.message, self.mesg)
+
+    def start_points(self, guess_values):
+        """
+        Latin hypercube sample of n_starts - 1 points in log10 of the parameters, start_spread decades wide and
+        centered on the guess, after the guess itself; parameters that are not positive stay at their guess
+        :return: (n_starts, n_free) array
+        """
+        guess_values = np.asarray(guess_values, dtype=np.float64)
+        starts = np.tile(guess_values, (self.n_starts, 1))
+        positive = guess_values > 0
+        n_sampled = self.n_starts - 1
+        if n_sampled > 0 and np.any(positive):
+            rng = np.random.RandomState(self.start_seed)
+            # one random permutation of the strata per parameter, a random point in each stratum
+            strata = np.argsort(rng.rand(n_sampled, np.count_nonzero(positive)), axis=0)
+            sample = (strata + rng.rand(*strata.shape)) / n_sampled
+            starts[1:, positive] = np.power(10.0, np.log10(guess_values[positive]) +
+                                            self.start_spread * (sample - 0.5))
+        return starts
+
+    def fit_multistart(self):
+        """
+        Local fits from start_points, in start_workers processes. Fits ending with parameters within start_rtol of
+        each other are one minimum; the minima are ranked by chi-square and the best one is the result
+        Once cancelled, the running fits stop at their next evaluation, in the workers too, and keep their best
+        parameters so far; the starts not begun are dropped
+        :return: result dict (see run_fit), with 'minima' and 'multistart' (number of starts and minima, wall
+                 clock time, time of the fits one after the other, time saved)
+        """
+        guess_values = self.guess if self.Dr else self.init_val
+        starts = self.start_points(guess_values)
+        ls_params = [self.params_dict, self.recv_method, self.zp_data, self.fp_data, self.z_data, self.f_data,
+                     self.recv_wgt_index, self.calc_func, self.tp_data, self.t_data, self.volp_data, self.vol_data]
+        kwargs = {'dr_method': self.Dr, 'fixed_params': self.guess_names, 'minimize_method': self.minimize_method,
+                  'md_type': self.model_type, 'niters': self.niters, 'jac_func': self.jac_func,
+                  'batch_func': self.batch_func, 'par_names': self.par_names}
+        jobs = [{'ls_params': ls_params, 'guess': start, 'kwargs': kwargs} for start in starts]
+
+        t_start = time.perf_counter()
+        finished = []
+        if self.start_workers == 1:
+            for job in jobs:
+                finished.append(fit_start(dict(job, kwargs=dict(kwargs, cancel_event=self.cancel_event,
+                                                                progress_callback=self.progress_callback,
+                                                                progress_interval=self.progress_interval))))
+                if self.cancel_event.is_set():
+                    break
+        else:
+            from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+            from multiprocessing import Manager
+
+            workers = None if self.start_workers == -1 else self.start_workers
+            # the cancel event is forwarded to the workers through a shared one
+            with Manager() as manager, ProcessPoolExecutor(max_workers=workers) as executor:
+                worker_cancel = manager.Event()
+                if self.cancel_event.is_set():
+                    worker_cancel.set()
+                pending = [executor.submit(fit_start, dict(job, kwargs=dict(kwargs, cancel_event=worker_cancel)))
+                           for job in jobs]
+                while pending:
+                    if self.cancel_event.is_set():
+                        # the running fits stop with their best parameters so far, the others are dropped
+                        worker_cancel.set()
+                        for future in pending:
+                            future.cancel()
+                    done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    finished += [future.result() for future in done if not future.cancelled()]
+        wall_time = time.perf_counter() - t_start
+        serial_time = sum(fit_time for _, _, fit_time in finished)
+
+        # chi-square of the fitted values, the same scale whatever the start (not relative to it with dr_method)
+        ranked = []
+        for result, zf, _ in finished:
+            values = np.array([result['param_ret'][name] for name in self.guess_names])
+            chisqr = models.cost_scalar(values, self.zp_data, self.fp_context, self.recv_wgt_index, self.calc_func,
+                                        self.tp_data, self.volp_data, None, self.guess_names, self.cost_params)
+            ranked.append((chisqr, values, result, zf))
+        ranked.sort(key=lambda entry: entry[0] if np.isfinite(entry[0]) else np.inf)
+
+        # the same minimum: the same parameters; distinct minima of the same chi-square are degenerate (parameters
+        # the data do not determine), kept apart
+        minima = []
+        for chisqr, values, result, zf in ranked:
+            for minimum in minima:
+                if same_parameters(values, minimum['values'], self.start_rtol):
+                    minimum['count'] += 1
+                    break
+            else:
+                minima.append({'values': values, 'chisqr': chisqr, 'result': result, 'zf': zf, 'count': 1,
+                               'degenerate': False})
+        for minimum, other in itertools.combinations(minima, 2):
+            if abs(minimum['chisqr'] - other['chisqr']) <= self.start_rtol * abs(other['chisqr']):
+                minimum['degenerate'] = other['degenerate'] = True
+
+        best = minima[0]
+        self.params_dict.update(best['result']['param_ret'])
+        self.zf = best['zf']
+        n_dof = 2*self.zp_data.size - len(self.guess_names)
+        self.chisqr = best['chisqr']
+        self.reduced_chisqr = self.chisqr / n_dof
+        self.success = best['result']['success']
+        self.cancelled = self.cancel_event.is_set()
+        multistart = {'starts': len(finished), 'minima': len(minima), 'wall_time': wall_time,
+                      'serial_time': serial_time, 'time_saved': serial_time - wall_time}
+        print("Multi-start: {0} starts, {1} distinct minima, best chi-square {2:.6e}, {3:.2f} s "
+              "({4:.2f} s one after the other)".format(len(finished), len(minima), self.chisqr, wall_time,
+                                                       serial_time))
+        return dict(best['result'], param_ret=self.params_dict, chisqr=self.chisqr, red_chisqr=self.reduced_chisqr,
+                    residual=self.chisqr * n_dof, cancelled=self.cancelled,
+                    nfev=sum(result['nfev'] for result, _, _ in finished),
+                    minima=[{'params': dict(zip(self.guess_names, minimum['values'])), 'chisqr': minimum['chisqr'],
+                             'red_chisqr': minimum['chisqr'] / n_dof, 'success': minimum['result']['success'],
+                             'count': minimum['count'], 'degenerate': minimum['degenerate']}
+                            for minimum in minima],
+                    multistart=multistart, circuit=self.circuit_description())
+
+    def cache_keys(self):
+        """
+        Keys of this fit in self.cache
+        """
+        guess_values = self.guess if self.Dr else self.init_val
+        diev_bounds = sorted(self.diev_bounds.items()) if self.diev_bounds is not None else None
+        settings = (self.recv_method, self.recv_wgt_index, self.Dr, self.minimize_method, self.niters,
+                    self.jac_func is not None, diev_bounds, self.diev_polish,
+                    [np.asarray(data) for data in (self.tp_data, self.volp_data) if data is not None],
+                    self.circuit_description())
+        if self.n_starts > 1:
+            settings += (self.n_starts, self.start_spread, self.start_seed, self.start_rtol)
+        return self.cache.keys(self.model_name, self.f_data, self.z_data, self.fp_data, self.zp_data,
+                               self.params_dict, self.guess_names, guess_values, settings)
+
+    def from_cache(self, cache_keys):
+        """
+        Look up the fit in self.cache: a hit sets self.result and self.zf, a near miss replaces the initial values
+        of the free parameters by its fitted values
+        :param cache_keys: output of cache_keys
+        :return: 'hit', 'warm' or 'miss'
+        """
+        state, entry = self.cache.get(cache_keys)
+        if state == 'hit':
+            print("Fit result from cache")
+            self.params_dict.update(entry['result']['param_ret'])
+            self.result = dict(entry['result'], param_ret=self.params_dict, cache=state)
+            self.zf = entry['zf']
+        elif state == 'warm':
+            print("Warm start from a cached fit")
+            warm_values = np.array([entry['result']['param_ret'][name] for name in self.guess_names])
+            if self.Dr:
+                self.guess = warm_values
+            else:
+                self.init_val = warm_values
+        return state
+
+    def fit_local(self):
+        """
+        Fit with recv_method from the initial values, the fitted values and their errors in params_dict, params_ret,
+        perror and perror_percent
+        """
+        self.trace = telemetry.FitTrace(2*self.zp_data.size, len(self.init_val), self.progress_callback,
+                                        self.progress_interval, self.cancel_event)
+        try:
+            if self.recv_method == 'leastsq':
+                self.fit_leastsq()
+
+            elif self.recv_method == 'least_squares':
+                self.fit_leastsquares()
+
+            elif self.recv_method == 'minimize':
+                self.fit_minimize()
+
+            elif self.recv_method == 'differential_evolution':
+                self.fit_diev()
+        except telemetry.FitCancelled:
+            self.keep_best()
+        self.trace.finish()
+
+        if self.p_cov is not None:
+            self.perror = np.sqrt(np.diag(self.p_cov))
+            self.perror_percent = 100 * self.perror / self.params_ret
+        else:
+            self.perror = ['N/A'] * len(self.params_ret)
+            self.perror_percent = ['N/A'] * len(self.params_ret)
+
+        if self.Dr:
+            self.params_ret = np.multiply(self.params_ret, self.guess)
+            if self.p_cov is not None:
+                self.perror = np.multiply(self.perror, self.guess)
+
+        for idx, gs_name in enumerate(self.guess_names):
+            self.params_dict[gs_name] = self.params_ret[idx]
+
+    def restore_full_circuit(self):
+        """
+        The elements removed from the circuit at the initial values (see models.reduce_circuit) may not be open or
+        short circuits at the fitted values (params_dict): if the model without them is no longer within DEAD_RTOL
+        of the full model, put them back to fit again
+        :return: the elements were put back
+        """
+        if self.circuit is None or not self.circuit.dead:
+            return False
+        deviation = self.circuit.deviation(self.params_dict, self.fp_context)
+        if deviation <= models.DEAD_RTOL:
+            return False
+        print("Reduced circuit off by {:.3e} at the fitted values, fitting the full circuit".format(deviation))
+        self.circuit = models.ReducedCircuit(self.circuit.model, frozen=self.circuit.frozen)
+        self.calc_func = self.circuit.func
+        if self.batch_func is not None:
+            self.batch_func = self.circuit.batch
+        print(self.circuit.describe())
+        return True
+
+    def run_fit(self):
+        """
+        Run the fitting (isFit == 1) or the simulation (isFit == 2)
+        :return: result dict
+        """
+        resd = -1e20
+        cache_state = None
+        if self.isFit == 1:
+            if self.cache is not None and self.model_name is not None:
+                cache_keys = self.cache_keys()
+                cache_state = self.from_cache(cache_keys)
+                if cache_state == 'hit':
+                    return self.result
+
+            if self.n_starts > 1 and self.recv_method != 'differential_evolution':
+                result = self.fit_multistart()
+                if not self.cancelled and self.restore_full_circuit():
+                    result = self.fit_multistart()
+                self.result = dict(result, cache=cache_state)
+                if cache_state is not None and not self.cancelled:
+                    self.cache.put(cache_keys, {'result': self.result, 'zf': self.zf})
+                return self.result
+
+            self.fit_local()
+            if not self.cancelled and self.restore_full_circuit():
+                self.fit_local()
+
+            self.zf = self.calc_func(self.params_dict, self.f_context, self.t_data, self.vol_data)
+            self.zf[np.isinf(self.zf)] = 0
+            print("CHECKED: ", np.count_nonzero(self.params_ret <= 0))
+
+            self.chisqr = models.cost_scalar(self.params_ret, self.zp_data, self.fp_context,
+                                             self.recv_wgt_index, self.calc_func, self.tp_data,
+                                             self.volp_data, self.guess, self.guess_names,
+                                             self.cost_params)
+            self.reduced_chisqr = self.chisqr / (2*self.zp_data.size - self.init_val.size)
+            resd = self.chisqr * (2*self.zp_data.size - self.init_val.size)
+
+        elif self.isFit == 2:
+            print("Simulation")
+            self.zf = self.calc_func(self.params_dict, self.f_context, T=self.t_data, Voltage=self.vol_data)
+            resd = 'NaN'
+            self.chisqr = 'NaN'
+            self.reduced_chisqr = 'NaN'
+
+        self.result = {'param_ret': self.params_dict, 'perror': self.perror, 'perror_percent': self.perror_percent,
+                       'chisqr': self.chisqr, 'red_chisqr': self.reduced_chisqr, 'success': self.success,
+                       'message': self.mesg,
+                       'residual': resd, 'nfev': self.nfev,
+                       'trace': self.trace.records if self.trace is not None else None, 'cache': cache_state,
+                       'cancelled': self.cancelled, 'circuit': self.circuit_description()}
+        # a cancelled fit is not the result of these settings
+        if cache_state is not None and not self.cancelled:
+            self.cache.put(cache_keys, {'result': self.result, 'zf': self.zf})
+        return self.result
+
+
+def same_parameters(values, other, rtol):
+    """
+    Fitted parameters within rtol of each other, in log10 (as a ratio) where both are positive, else relative
+    to their value (signed parameters, see models.is_signed)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    other = np.asarray(other, dtype=np.float64)
+    positive = (values > 0) & (other > 0)
+    log_close = np.abs(np.log10(np.where(positive, values, 1.0) / np.where(positive, other, 1.0))) <= np.log10(1 + rtol)
+    return bool(np.all(np.where(positive, log_close, np.isclose(values, other, rtol=rtol, atol=0.0))))
+
+
+def fit_start(job):
+    """
+    One local fit of Fitter.fit_multistart, may run in a worker process
+    :param job: dict with ls_params, guess (initial values of the free parameters), kwargs (of Fitter)
+    :return: result dict of Fitter.run_fit, fitted impedance, fit time
+    """
+    t_start = time.perf_counter()
+    ls_params = list(job['ls_params'])
+    ls_params[0] = dict(ls_params[0])
+    fitter = Fitter(1, np.array(job['guess']), ls_params, **job['kwargs'])
+    result = fitter.run_fit()
+    return result, fitter.zf, time.perf_counter() - t_start
+
+
+class FitResult(object):
+    """
+    Result of fit()
+    """
+
+    def __init__(self, model, method, weighting, params, free, errors, errors_percent, chisqr, red_chisqr, residual,
+                 success, message, nfev, f, z_fit, fit_time, trace=None, cache=None, cancelled=False, minima=None,
+                 multistart=None, circuit=None):
+        """
+        :param params: dict, all parameter values after the fit
+        :param free: list of free parameter names
+        :param errors: dict, free parameter name -> standard error (nan if not available)
+        :param errors_percent: dict, free parameter name -> standard error in % of the value
+        :param f: frequencies of z_fit
+        :param z_fit: impedance of the fitted model
+        :param trace: list of telemetry.FitTrace records
+        :param cache: 'hit' (stored result), 'warm' (started from a near cached fit), 'miss', None without cache
+        :param cancelled: the fit was cancelled, params are the best ones so far
+        :param minima: multi-start, distinct minima ranked by chi-square: dicts with params (free parameters),
+                       chisqr, red_chisqr, success, count (number of starts ending there), degenerate (another
+                       minimum has the same chi-square)
+        :param multistart: multi-start, dict with starts, minima, wall_time, serial_time, time_saved
+        :param circuit: description of the circuit fitted, the model without the elements removed and its
+                        sub-circuits computed once (see models.reduce_circuit)
+        """
+        self.model = model
+        self.method = method
+        self.weighting = weighting
+        self.params = params
+        self.free = free
+        self.errors = errors
+        self.errors_percent = errors_percent
+        self.chisqr = chisqr
+        self.red_chisqr = red_chisqr
+        self.residual = residual
+        self.success = success
+        self.message = message
+        self.nfev = nfev
+        self.f = f
+        self.z_fit = z_fit
+        self.fit_time = fit_time
+        self.trace = trace
+        self.cache = cache
+        self.cancelled = cancelled
+        self.minima = minima
+        self.multistart = multistart
+        self.circuit = circuit
+
+    def save_trace(self, path):
+        telemetry.save_trace(self.trace, path)
+
+    def __repr__(self):
+        return "FitResult({0}, {1}, success={2}, chisqr={3:.6e}, nfev={4})".format(self.model, self.method,
+                                                                                  self.success, self.chisqr,
+                                                                                  self.nfev)
+
+
+def fit(model, freqs, Z, params, free, weighting='unit', method='least_squares', niters=100000, rm_positive=False,
+        dr_method=False, minimize_method='L-BFGS-B', diev_bounds=None, diev_workers=1, diev_polish=True,
+        callback=None, callback_interval=0.5, cache=None, laws=None, T=None, Voltage=None, cancel=None,
+        n_starts=1, start_spread=1.0, start_workers=1, reduce_circuit=True):
+    """
+    Fit one spectrum, or stacked spectra with parameter laws
+    :param model: model name, key of models.MODELS
+    :param freqs: frequencies (Hz)
+    :param Z: complex impedance
+    :param params: dict, parameter name -> value, initial values of the free parameters
+    :param free: names of the free parameters, the others are kept fixed
+    :param weighting: one of WEIGHTINGS, or its index + 1 as used by models.get_cost_vector
+    :param method: one of METHODS
+    :param niters: maximum number of iterations / function evaluations
+    :param rm_positive: fit only the points with Im(Z) < 0
+    :param dr_method: fit the free parameters relative to their initial values
+    :param callback: progress callback, called with the last record of the fit trace (see telemetry.FitTrace)
+    :param callback_interval: seconds between two callback calls
+    :param cache: cache.FitCache
+    :param laws: dict parameter name -> law name, or laws.LawModel (see models/laws.py); the law parameters
+                 missing from params are 0, free ones start at the start value of their law (laws.LAWS)
+    :param T: temperature of each point, for temperature laws
+    :param Voltage: voltage of each point, for voltage laws
+    :param cancel: threading.Event, set from another thread to stop and keep the best parameters so far
+    :param n_starts: local fits from n_starts starts around the initial values, see Fitter.fit_multistart
+    :param start_spread: decades around the initial values the starts are sampled in
+    :param start_workers: processes running the local fits of a multi-start, -1 for all cores
+    :param reduce_circuit: fit the model without the elements that are open or short circuits at the initial values,
+                           and with its sub-circuits of fixed parameters computed once (see models.reduce_circuit),
+                           not with laws
+    :return: FitResult
+    """
+    if model not in models.MODELS:
+        raise ValueError("Undefined model: {}".format(model))
+    if method not in METHODS:
+        raise ValueError("Undefined method: {}".format(method))
+    wgt_index = weighting if isinstance(weighting, int) else WEIGHTINGS.index(weighting) + 1
+    mdl = models.MODELS[model]
+    calc_func, batch_func, par_names = mdl['func'], mdl['batch'], mdl['params']
+    jac_func = jacobian.MODEL_JACOBIANS.get(model)
+    cache_name = model
+    if laws is not None:
+        from models.laws import LawModel, default_law_values
+
+        law_model = laws if isinstance(laws, LawModel) else LawModel(model, laws)
+        # one parameter set per point: no analytic derivative nor batched population
+        calc_func, batch_func, par_names, jac_func = law_model, None, law_model.par_names, None
+        cache_name = law_model.key()
+        params = default_law_values(law_model.laws, params, free)
+
+    params_dict = {}
+    for name in par_names:
+        params_dict[name] = float(params[name])
+    free = list(free)
+    for name in free:
+        if name not in params_dict:
+            raise ValueError("Unknown parameter: {}".format(name))
+
+    f_data = np.asarray(freqs, dtype=np.float64)
+    z_data = np.asarray(Z, dtype=np.complex128)
+    t_data = np.asarray(T, dtype=np.float64) if T is not None else None
+    vol_data = np.asarray(Voltage, dtype=np.float64) if Voltage is not None else None
+    if rm_positive:
+        kp_data = np.imag(z_data) < 0
+        fp_data = f_data[kp_data]
+        zp_data = z_data[kp_data]
+        tp_data = t_data[kp_data] if t_data is not None else None
+        volp_data = vol_data[kp_data] if vol_data is not None else None
+    else:
+        fp_data = f_data
+        zp_data = z_data
+        tp_data = t_data
+        volp_data = vol_data
+
+    t_start = time.time()
+    fitter = Fitter(1, np.array([params_dict[name] for name in free]),
+                    [params_dict, method, zp_data, fp_data, z_data, f_data, wgt_index, calc_func,
+                     tp_data, t_data, volp_data, vol_data],
+                    dr_method=dr_method, fixed_params=free, minimize_method=minimize_method, niters=niters,
+                    jac_func=jac_func, batch_func=batch_func, par_names=par_names,
+                    diev_bounds=diev_bounds, diev_workers=diev_workers, diev_polish=diev_polish,
+                    progress_callback=callback, progress_interval=callback_interval, cache=cache,
+                    model_name=cache_name, cancel_event=cancel, n_starts=n_starts, start_spread=start_spread,
+                    start_workers=start_workers, reduce_circuit=reduce_circuit)
+    result = fitter.run_fit()
+
+    errors = {}
+    errors_percent = {}
+    for idx, name in enumerate(free):
+        if result['perror'] is None or result['perror'][idx] == 'N/A':
+            errors[name] = np.nan
+            errors_percent[name] = np.nan
+        else:
+            errors[name] = float(result['perror'][idx])
+            errors_percent[name] = float(result['perror_percent'][idx])
+
+    return FitResult(model, method, WEIGHTINGS[wgt_index - 1] if 1 <= wgt_index <= len(WEIGHTINGS) else wgt_index,
+                     dict(result['param_ret']), free, errors, errors_percent, result['chisqr'],
+                     result['red_chisqr'], result['residual'], result['success'], result['message'], result['nfev'],
+                     f_data, fitter.zf, time.time() - t_start, result['trace'], result.get('cache'),
+                     result.get('cancelled', False), result.get('minima'), result.get('multistart'),
+                     result.get('circuit'))
+
+
+class SeriesResult(object):
+    """
+    Result of fit_series, spectra ordered by condition
+    """
+
+    def __init__(self, model, names, conditions, results, starts, fit_time):
+        """
+        :param names: spectrum names
+        :param conditions: condition of each spectrum (temperature, SOC, cycle number, ...)
+        :param results: FitResult of each spectrum
+        :param starts: start of each fit, 'fresh' (template parameters), 'warm' (optimum of the previous spectrum)
+                       or 'restart' (warm start diverged, fitted again from the template)
+        """
+        self.model = model
+        self.names = names
+        self.conditions = conditions
+        self.results = results
+        self.starts = starts
+        self.fit_time = fit_time
+
+    def values(self, name):
+        """
+        :return: array of the parameter value along the series
+        """
+        return np.array([result.params[name] for result in self.results])
+
+    def table(self):
+        """
+        Parameter-vs-condition table
+        :return: list of column names, list of rows
+        """
+        free = self.results[0].free if self.results else []
+        par_names = list(models.MODELS[self.model]['params'])
+        cols = ["condition", "Data name", "chi-square", "reduced chi-square"]
+        for name in par_names:
+            cols += [name.upper(), name.upper() + '_error', name.upper() + '_error %']
+        cols += ["success", "nfev", "start", "fit time (s)"]
+
+        rows = []
+        for name, condition, result, start in zip(self.names, self.conditions, self.results, self.starts):
+            row = [condition, name, result.chisqr, result.red_chisqr]
+            for par_name in par_names:
+                if par_name in free:
+                    row += [result.params[par_name], result.errors[par_name], result.errors_percent[par_name]]
+                else:
+                    row += [result.params[par_name], '', '']
+            row += [result.success, result.nfev, start, '{:.3f}'.format(result.fit_time)]
+            rows.append(row)
+        return cols, rows
+
+    def save(self, path):
+        import csv
+
+        cols, rows = self.table()
+        with open(path, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(cols)
+            writer.writerows(rows)
+
+    def __repr__(self):
+        return "SeriesResult({0}, {1} spectra, {2} restarts)".format(self.model, len(self.results),
+                                                                    self.starts.count('restart'))
+
+
+def has_diverged(result, previous, divergence_ratio):
+    """
+    A warm started fit diverged if it failed, or if its reduced chi-square is more than divergence_ratio times
+    the one of the previous spectrum
+    """
+    if not result.success or not np.isfinite(result.chisqr):
+        return True
+    if not all(np.isfinite(result.params[name]) for name in result.free):
+        return True
+    return result.red_chisqr > divergence_ratio * previous.red_chisqr
+
+
+def fit_chain(job):
+    """
+    Fit spectra one after the other, each one starting from the optimum of the previous one
+    Run in a worker process by fit_series
+    :param job: dict with model, spectra (list of (freqs, Z)), params, free, divergence_ratio, fit_kwargs
+    :return: list of FitResult, list of starts
+    """
+    results = []
+    starts = []
+    previous = None
+    for freqs, Z in job['spectra']:
+        if previous is None:
+            result = fit(job['model'], freqs, Z, job['params'], job['free'], **job['fit_kwargs'])
+            start = 'fresh'
+        else:
+            warm_params = dict(job['params'])
+            for name in job['free']:
+                warm_params[name] = previous.params[name]
+            result = fit(job['model'], freqs, Z, warm_params, job['free'], **job['fit_kwargs'])
+            start = 'warm'
+            if has_diverged(result, previous, job['divergence_ratio']):
+                print("Warm start diverged (chi-square {:.6e}), fitting again from the template".format(result.chisqr))
+                fresh = fit(job['model'], freqs, Z, job['params'], job['free'], **job['fit_kwargs'])
+                if not np.isfinite(result.chisqr) or fresh.chisqr <= result.chisqr:
+                    result = fresh
+                    start = 'restart'
+        results.append(result)
+        starts.append(start)
+        previous = result
+    return results, starts
+
+
+def fit_series(model, spectra, conditions, params, free, names=None, chains=1, workers=1, divergence_ratio=10.0,
+               **fit_kwargs):
+    """
+    Fit a series of spectra (temperature, SOC, cycle number, ...) in the order of their condition, each spectrum
+    starting from the optimum of the previous one. A warm start that diverges (see has_diverged) is fitted again
+    from params and the better of the two fits is kept.
+    :param model: model name, key of models.MODELS
+    :param spectra: list of (freqs, Z)
+    :param conditions: condition of each spectrum, sets the fitting order
+    :param params: dict, parameter template, start of the first spectrum of each chain and of the restarts
+    :param free: names of the free parameters
+    :param names: spectrum names, default their index
+    :param chains: split the ordered series in this many independent chains, each starting from params
+    :param workers: processes running the chains
+    :param divergence_ratio: reduced chi-square ratio to the previous spectrum above which a warm start diverged
+    :param fit_kwargs: passed to fit (weighting, method, niters, rm_positive, ...)
+    :return: SeriesResult
+    """
+    if len(spectra) != len(conditions):
+        raise ValueError("{} spectra but {} conditions".format(len(spectra), len(conditions)))
+    if names is None:
+        names = [str(idx) for idx in range(len(spectra))]
+
+    order = np.argsort(np.asarray(conditions, dtype=np.float64), kind='stable')
+    segments = [segment for segment in np.array_split(order, max(1, min(chains, len(order)))) if len(segment)]
+    jobs = [{'model': model, 'spectra': [spectra[idx] for idx in segment], 'params': dict(params),
+             'free': list(free), 'divergence_ratio': divergence_ratio, 'fit_kwargs': fit_kwargs}
+            for segment in segments]
+
+    t_start = time.time()
+    if workers != 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)) if workers > 0 else None) as executor:
+            chain_outputs = list(executor.map(fit_chain, jobs))
+    else:
+        chain_outputs = [fit_chain(job) for job in jobs]
+
+    results = []
+    starts = []
+    for chain_results, chain_starts in chain_outputs:
+        results += chain_results
+        starts += chain_starts
+    return SeriesResult(model, [names[idx] for idx in order], [conditions[idx] for idx in order], results, starts,
+                        time.time() - t_start)
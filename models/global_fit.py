@@ -0,0 +1,406 @@
+"""
+Global fit of several spectra with shared and per-spectrum parameters
+
+The free parameters are packed in one vector: [shared..., local of spectrum 0..., local of spectrum 1..., ...].
+The residual of spectrum i only depends on the shared block and its own local block, so the Jacobian is block
+sparse. It is given to least_squares as a sparse matrix (analytic derivative) or as jac_sparsity (finite
+differences), so the cost of a step grows about linearly with the number of spectra instead of cubically.
+
+    from models import global_fit
+    result = global_fit.fit_global("Barsoukov-Pham-Lee_1D", spectra, params, shared=['r_m', 'q_w', 'c_d_liq'],
+                                   local=['r_ct', 'c_dl'], weighting='dataModulus')
+
+A long fit can write its best parameters to a checkpoint file every checkpoint_interval seconds; run again with the
+same checkpoint, it starts from there instead of the initial values (after a crash, or a cancel).
+"""
+import os
+import time
+import numpy as np
+from models import models, jacobian, telemetry, cache
+from models.ragged import RaggedSpectra
+
+
+class GlobalFit(object):
+    """
+    Residuals and block sparse Jacobian of a global fit
+    """
+
+    def __init__(self, model, spectra, params, shared, local, wgt_index, rm_positive=False, use_jac=True):
+        """
+        :param model: model name, key of models.MODELS
+        :param spectra: list of (freqs, Z)
+        :param params: dict of parameter values, or one dict per spectrum
+        :param shared: free parameters common to all spectra
+        :param local: free parameters fitted for each spectrum
+        :param wgt_index: weighting, index + 1 in engine.WEIGHTINGS
+        :param use_jac: analytic Jacobian when the model has one, else finite differences
+        """
+        mdl = models.MODELS[model]
+        if isinstance(params, dict):
+            params = [params] * len(spectra)
+        if len(params) != len(spectra):
+            raise ValueError("{} parameter sets for {} spectra".format(len(params), len(spectra)))
+        for name in list(shared) + list(local):
+            if name not in mdl['params']:
+                raise ValueError("Unknown parameter: {}".format(name))
+        overlap = set(shared) & set(local)
+        if overlap:
+            raise ValueError("Parameters both shared and local: {}".format(', '.join(sorted(overlap))))
+
+        self.model = model
+        self.calc_func = mdl['func']
+        self.jac_func = jacobian.MODEL_JACOBIANS.get(model) if use_jac else None
+        self.shared = list(shared)
+        self.local = list(local)
+        self.guess_names = self.shared + self.local
+        self.wgt_index = wgt_index
+        self.n_shared = len(self.shared)
+        self.n_local = len(self.local)
+        self.n_free = self.n_shared + len(spectra) * self.n_local
+
+        # all spectra in one ragged dataset, spectrum i is a slice of the concatenated arrays
+        self.data = RaggedSpectra.from_spectra(spectra)
+        kp_data = np.imag(self.data.z) < 0 if rm_positive else np.ones(self.data.z.size, dtype=bool)
+        self.fit_data = self.data.keep(kp_data)
+        self.f_data = self.data.split(self.data.f)
+        self.z_data = self.data.split(self.data.z)
+        self.fp_data = self.fit_data.split(self.fit_data.f)
+        self.zp_data = self.fit_data.split(self.fit_data.z)
+        # frequency terms of the models, computed once per spectrum
+        self.fp_context = [models.frequency_context(fp_data) for fp_data in self.fp_data]
+        self.layouts = []
+        for spectrum_params in params:
+            params_dict = {name: float(spectrum_params[name]) for name in mdl['params']}
+            self.layouts.append(models.ParameterLayout(mdl['params'], params_dict, self.guess_names))
+
+        # rows of each spectrum in the stacked residual vector, real and imaginary parts of its points
+        self.row_start = 2 * self.fit_data.offsets
+        self.n_residuals = int(self.row_start[-1])
+
+        # coordinates of the non-zero Jacobian entries, block by block in C order
+        rows = []
+        cols = []
+        for idx in range(len(spectra)):
+            block_rows = np.arange(self.row_start[idx], self.row_start[idx + 1])
+            block_cols = self.columns(idx)
+            rows.append(np.repeat(block_rows, block_cols.size))
+            cols.append(np.tile(block_cols, block_rows.size))
+        self.jac_rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+        self.jac_cols = np.concatenate(cols) if cols else np.zeros(0, dtype=int)
+
+    def columns(self, idx):
+        """
+        Columns of spectrum idx in the packed vector: shared block then its local block
+        """
+        local_start = self.n_shared + idx * self.n_local
+        return np.concatenate([np.arange(self.n_shared), np.arange(local_start, local_start + self.n_local)])
+
+    def pack(self):
+        """
+        Packed vector of the initial values
+        """
+        x = [self.layouts[0][name] for name in self.shared]
+        for layout in self.layouts:
+            x += [layout[name] for name in self.local]
+        return np.array(x, dtype=np.float64)
+
+    def spectrum_guess(self, x, idx):
+        return x[self.columns(idx)]
+
+    def residuals(self, x):
+        ret = np.empty(self.n_residuals, dtype=np.float64)
+        for idx, layout in enumerate(self.layouts):
+            ret[self.row_start[idx]:self.row_start[idx + 1]] = models.cost_vector(
+                self.spectrum_guess(x, idx), self.zp_data[idx], self.fp_context[idx], self.wgt_index, self.calc_func,
+                None, None, None, self.guess_names, layout)
+        return ret
+
+    def jacobian(self, x):
+        """
+        :return: scipy.sparse csr matrix (n_residuals, n_free)
+        """
+        from scipy.sparse import csr_matrix
+
+        blocks = []
+        for idx, layout in enumerate(self.layouts):
+            blocks.append(jacobian.cost_jacobian(self.spectrum_guess(x, idx), self.zp_data[idx], self.fp_context[idx],
+                                                 self.wgt_index, self.calc_func, None, None, None, self.guess_names,
+                                                 layout, jac_func=self.jac_func).ravel())
+        return csr_matrix((np.concatenate(blocks), (self.jac_rows, self.jac_cols)),
+                          shape=(self.n_residuals, self.n_free))
+
+    def sparsity(self):
+        """
+        Structure of the Jacobian, jac_sparsity of least_squares
+        """
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((np.ones(self.jac_rows.size, dtype=np.int8), (self.jac_rows, self.jac_cols)),
+                          shape=(self.n_residuals, self.n_free))
+
+    def spectrum_keys(self):
+        """
+        Hash of the points fitted of each spectrum (cache.hash_items)
+        """
+        return [cache.hash_items([fp_data, zp_data]) for fp_data, zp_data in zip(self.fp_data, self.zp_data)]
+
+    def parameter_errors(self, jac, scale):
+        """
+        Standard errors of the packed parameters, sqrt of the diagonal of pinv(J^T J) * scale, from the blocks of
+        J^T J: shared x shared summed over the spectra, shared x local and local x local of each spectrum.
+        The local part is block diagonal, it is eliminated with the Schur complement, so neither J nor J^T J is
+        formed densely. The columns of J are scaled to unit norm first
+        :param jac: Jacobian (n_residuals, n_free), scipy.sparse matrix or array
+        :param scale: chi-square / degrees of freedom
+        :return: (n_free,) array
+        """
+        n_shared = self.n_shared
+        blocks = []
+        norm2 = np.zeros(self.n_free)
+        for idx in range(len(self.layouts)):
+            block = jac[self.row_start[idx]:self.row_start[idx + 1]][:, self.columns(idx)]
+            block = block.toarray() if hasattr(block, 'toarray') else np.array(block)
+            blocks.append(block)
+            norm2[self.columns(idx)] += np.sum(block ** 2, axis=0)
+        # columns scaled to unit norm, the parameters span decades and pinv would drop the small singular values
+        col_norm = np.sqrt(norm2)
+        col_norm[col_norm == 0] = 1.0
+
+        schur = np.zeros((n_shared, n_shared))
+        cross = []
+        local_inv = []
+        for idx, block in enumerate(blocks):
+            block /= col_norm[self.columns(idx)]
+            jac_shared, jac_local = block[:, :n_shared], block[:, n_shared:]
+            shared_local = np.dot(jac_shared.T, jac_local)
+            local_inv.append(np.linalg.pinv(np.dot(jac_local.T, jac_local)))
+            cross.append(np.dot(shared_local, local_inv[-1]))
+            schur += np.dot(jac_shared.T, jac_shared) - np.dot(cross[-1], shared_local.T)
+
+        schur_inv = np.linalg.pinv(schur)
+        variances = [np.diag(schur_inv)]
+        for cross_block, local_block in zip(cross, local_inv):
+            # local block of the inverse: D^-1 + (B D^-1)^T S^-1 (B D^-1)
+            variances.append(np.diag(local_block) + np.einsum('ij,ik,kj->j', cross_block, schur_inv, cross_block))
+        return np.sqrt(np.abs(np.concatenate(variances) * scale)) / col_norm
+
+    def unpack(self, x):
+        """
+        :return: one dict of all parameter values per spectrum
+        """
+        params = []
+        for idx, layout in enumerate(self.layouts):
+            layout.fill(self.spectrum_guess(x, idx))
+            params.append(layout.to_dict())
+        return params
+
+
+def save_checkpoint(path, problem, x, names, nfev):
+    """
+    Write the packed vector x of a global fit, replacing the previous checkpoint at once
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as fp:
+        np.savez(fp, x=x, model=problem.model, shared=np.array(problem.shared, dtype=str),
+                 local=np.array(problem.local, dtype=str), names=np.array(names, dtype=str),
+                 spectra=np.array(problem.spectrum_keys(), dtype=str), nfev=nfev)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, problem, names):
+    """
+    :return: packed vector and number of function evaluations of a checkpoint of the same fit (model, shared and
+             local parameters, names and data of the spectra), None if there is none
+    """
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as checkpoint:
+        same_fit = (str(checkpoint['model']) == problem.model and list(checkpoint['shared']) == problem.shared and
+                    list(checkpoint['local']) == problem.local and list(checkpoint['names']) == list(names) and
+                    'spectra' in checkpoint.files and list(checkpoint['spectra']) == problem.spectrum_keys() and
+                    checkpoint['x'].size == problem.n_free)
+        if not same_fit:
+            print("Checkpoint {} is of another fit, not resumed".format(path))
+            return None
+        return np.array(checkpoint['x']), int(checkpoint['nfev'])
+
+
+class GlobalResult(object):
+    """
+    Result of fit_global
+    """
+
+    def __init__(self, model, names, shared, local, params, errors, chisqr, red_chisqr, spectrum_chisqr, success,
+                 message, nfev, fit_time, trace=None, cancelled=False):
+        """
+        :param names: spectrum names
+        :param params: list, dict of all parameter values of each spectrum
+        :param errors: list, dict free parameter name -> standard error of each spectrum (shared errors repeated)
+        :param spectrum_chisqr: sum of squares of each spectrum
+        :param cancelled: the fit was cancelled, params are the best ones so far
+        """
+        self.model = model
+        self.names = names
+        self.shared = shared
+        self.local = local
+        self.params = params
+        self.errors = errors
+        self.chisqr = chisqr
+        self.red_chisqr = red_chisqr
+        self.spectrum_chisqr = spectrum_chisqr
+        self.success = success
+        self.message = message
+        self.nfev = nfev
+        self.fit_time = fit_time
+        self.trace = trace
+        self.cancelled = cancelled
+
+    def values(self, name):
+        """
+        :return: array of the parameter value of each spectrum
+        """
+        return np.array([params[name] for params in self.params])
+
+    def table(self):
+        """
+        One row per spectrum
+        :return: list of column names, list of rows
+        """
+        par_names = list(models.MODELS[self.model]['params'])
+        cols = ["Data name", "chi-square"]
+        for name in par_names:
+            cols += [name.upper(), name.upper() + '_error', name.upper() + '_error %']
+        cols += ["shared"]
+
+        rows = []
+        for name, params, errors, chisqr in zip(self.names, self.params, self.errors, self.spectrum_chisqr):
+            row = [name, chisqr]
+            for par_name in par_names:
+                if par_name in errors:
+                    row += [params[par_name], errors[par_name], 100 * errors[par_name] / params[par_name]]
+                else:
+                    row += [params[par_name], '', '']
+            row += [' '.join(self.shared)]
+            rows.append(row)
+        return cols, rows
+
+    def save(self, path):
+        import csv
+
+        cols, rows = self.table()
+        with open(path, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(cols)
+            writer.writerows(rows)
+
+    def save_trace(self, path):
+        telemetry.save_trace(self.trace, path)
+
+    def __repr__(self):
+        return "GlobalResult({0}, {1} spectra, {2} shared, success={3}, chisqr={4:.6e}, nfev={5})".format(
+            self.model, len(self.params), len(self.shared), self.success, self.chisqr, self.nfev)
+
+
+def fit_global(model, spectra, params, shared, local, names=None, weighting='unit', niters=100000,
+               rm_positive=False, use_jac=True, callback=None, callback_interval=0.5, cancel=None, checkpoint=None,
+               checkpoint_interval=60.0):
+    """
+    Fit all spectra at once with least_squares (trf), shared parameters common to all of them
+    :param model: model name, key of models.MODELS
+    :param spectra: list of (freqs, Z)
+    :param params: dict of initial values, or one dict per spectrum (e.g. from a series fit);
+                   the shared parameters start from the values of the first spectrum
+    :param shared: names of the free parameters common to all spectra
+    :param local: names of the free parameters fitted for each spectrum, the others are kept fixed
+    :param names: spectrum names, default their index
+    :param weighting: one of engine.WEIGHTINGS, or its index + 1
+    :param niters: maximum number of function evaluations
+    :param use_jac: analytic block sparse Jacobian; False for finite differences with jac_sparsity
+    :param callback: progress callback, called with the last record of the fit trace
+    :param cancel: threading.Event, set from another thread to stop and keep the best parameters so far
+    :param checkpoint: file where the best parameters are saved during the fit (npz), the fit starts from it if it
+                       holds a checkpoint of the same fit; removed once the fit completes, kept if cancelled
+    :param checkpoint_interval: seconds between two checkpoints, at most
+    :return: GlobalResult
+    """
+    from scipy.optimize import least_squares
+    from models import engine
+
+    if model not in models.MODELS:
+        raise ValueError("Undefined model: {}".format(model))
+    wgt_index = weighting if isinstance(weighting, int) else engine.WEIGHTINGS.index(weighting) + 1
+    if names is None:
+        names = [str(idx) for idx in range(len(spectra))]
+
+    t_start = time.time()
+    problem = GlobalFit(model, spectra, params, shared, local, wgt_index, rm_positive, use_jac)
+    x_start = problem.pack()
+    if checkpoint is not None:
+        resumed = load_checkpoint(checkpoint, problem, names)
+        if resumed is not None:
+            x_start = resumed[0]
+            print("Resumed from {} ({} function evaluations before)".format(checkpoint, resumed[1]))
+
+    trace = telemetry.FitTrace(problem.n_residuals, problem.n_free, callback, callback_interval, cancel)
+    trace.stage = 'least_squares'
+    residual_func = trace.wrap(problem.residuals, 'vector')
+    if checkpoint is not None:
+        traced_func = residual_func
+        saved = {'time': time.perf_counter()}
+
+        # on a timer, not on improvement only: the best parameters so far (trace.best_x) after every evaluation
+        def residual_func(x):
+            ret = traced_func(x)
+            if time.perf_counter() - saved['time'] >= checkpoint_interval:
+                saved['time'] = time.perf_counter()
+                save_checkpoint(checkpoint, problem, trace.best_x, names, trace.nfev)
+            return ret
+
+    if problem.jac_func is not None:
+        jac_kwargs = {'jac': trace.wrap(problem.jacobian, 'jacobian')}
+    else:
+        jac_kwargs = {'jac': '2-point', 'jac_sparsity': problem.sparsity()}
+
+    # lsmr works on the sparse Jacobian without forming it densely, x_scale='jac' makes up for the parameters
+    # spanning decades (needed by the iterative solver, the dense one of Fitter.fit_leastsquares is not affected)
+    epsilon = np.finfo('float64').eps
+    cancelled = False
+    try:
+        r_lsq = least_squares(residual_func, x_start, max_nfev=niters,
+                              ftol=epsilon, gtol=epsilon, xtol=epsilon, tr_solver='lsmr', x_scale='jac', verbose=1,
+                              **jac_kwargs)
+        x, success, message, nfev, jac = r_lsq.x, r_lsq.success, r_lsq.message, r_lsq.nfev, r_lsq.jac
+    except telemetry.FitCancelled:
+        cancelled = True
+        x = trace.best_x if trace.best_x is not None else x_start
+        success = False
+        nfev = trace.nfev
+        message = "Cancelled after {} function evaluations, best parameters so far".format(nfev)
+        jac = problem.jacobian(x) if problem.jac_func is not None else None
+    trace.finish()
+    print("The number of function calls: ", nfev)
+    if checkpoint is not None:
+        if cancelled:
+            save_checkpoint(checkpoint, problem, x, names, nfev)
+        elif os.path.isfile(checkpoint):
+            os.remove(checkpoint)
+
+    residuals = problem.residuals(x)
+    chisqr = float(np.dot(residuals, residuals))
+    dof = max(problem.n_residuals - problem.n_free, 1)
+    spectrum_chisqr = [float(chisqr) for chisqr in problem.fit_data.segment_sum(residuals ** 2, stride=2)]
+
+    # errors from the blocks of the normal matrix, without densifying the Jacobian
+    if jac is not None:
+        perror = problem.parameter_errors(jac, chisqr / dof)
+    else:
+        perror = np.full(problem.n_free, np.nan)
+
+    all_params = problem.unpack(x)
+    errors = []
+    for idx in range(len(spectra)):
+        spectrum_errors = perror[problem.columns(idx)]
+        errors.append(dict(zip(problem.guess_names, [float(err) for err in spectrum_errors])))
+
+    return GlobalResult(model, list(names), problem.shared, problem.local, all_params, errors, chisqr, chisqr / dof,
+                        spectrum_chisqr, success, message, nfev, time.time() - t_start, trace.records, cancelled)
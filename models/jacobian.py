@@ -0,0 +1,318 @@
+import numpy as np
+from functools import partial
+from models import models
+
+
+def make_seeds(par_names):
+    """
+    Unit tangents of the model parameters
+    :param par_names: list of parameter names
+    :return: dict, name -> (n_params, 1) array
+    """
+    eye = np.eye(len(par_names))
+    return {name: eye[idx][:, np.newaxis] for idx, name in enumerate(par_names)}
+
+
+def diffusion_kernel_jac(u, dim):
+    """
+    Diffusion kernel h(u) with Zd = R_d * h(u), u = sqrt(R_d * jw * Cd*), and its derivative dh/du
+    :param u: complex array
+    :param dim: 1 (planar, coth), 2 (cylindrical, Bessel), 3 (spherical, tanh)
+    :return: h, dh/du
+    """
+    if dim == 1:
+        c = 1.0 / np.tanh(u)
+        h = c / u
+        dh = (1.0 - c ** 2) / u - c / u ** 2
+    elif dim == 2:
+        rho = models.besseli_ratio(u)
+        h = rho / u
+        drho = 1.0 - rho ** 2 + rho / u
+        dh = drho / u - rho / u ** 2
+    else:
+        t = np.ones(u.shape, dtype=np.complex128)
+        t[np.real(u) < 100] = np.tanh(u[np.real(u) < 100])
+        h = t / (u - t)
+        dh = (u * (1.0 - t ** 2) - t) / (u - t) ** 2
+    return h, dh
+
+
+def cathode_jac(ctx, parvals, seeds, dim):
+    """
+    DX30 cathode (Bisquert transmission line with Barsoukov particle) and its tangents
+    :param ctx: models.FrequencyContext
+    :param parvals: dict of parameter values
+    :param seeds: dict of parameter tangents, see make_seeds
+    :param dim: diffusion geometry, 1, 2 or 3
+    :return: Z_cathode, dZ_cathode (n_params, n_freqs)
+    """
+    jw = ctx.jw
+
+    R_m, dR_m = parvals['r_m'], seeds['r_m']
+    R_ct, dR_ct = parvals['r_ct'], seeds['r_ct']
+    R_d, dR_d = parvals['r_d'], seeds['r_d']
+    R_i, dR_i = parvals['r_i'], seeds['r_i']
+    C_dl, dC_dl = parvals['c_dl'], seeds['c_dl']
+    C_d, dC_d = parvals['c_d'], seeds['c_d']
+    C_i, dC_i = parvals['c_i'], seeds['c_i']
+    Q_w, dQ_w = parvals['q_w'], seeds['q_w']
+
+    # Cd* = C_d + (dim*(C_i + C_d) - C_d) / (1 + jw*R_i*C_i)
+    tau = R_i * C_i
+    dtau = C_i * dR_i + R_i * dC_i
+    hn = 1 + jw * tau
+    K = dim * (C_i + C_d) - C_d
+    dK = dim * (dC_i + dC_d) - dC_d
+    Cstar_d = C_d + K / hn
+    dCstar_d = dC_d + dK / hn - K * jw * dtau / hn ** 2
+
+    # Warburg CPE with exponent 0.5
+    Z_B = 1.0 / (jw * Q_w * ctx.cpe_b)
+    dZ_B = -Z_B * dQ_w / Q_w
+
+    u = np.sqrt(R_d * jw * Cstar_d)
+    du = jw * (dR_d * Cstar_d + R_d * dCstar_d) / (2 * u)
+    h, dh = diffusion_kernel_jac(u, dim)
+    Zd = R_d * h
+    dZd = dR_d * h + R_d * dh * du
+
+    Zs, dZs = R_m, dR_m
+    Y_P = jw * C_dl + 1.0 / (R_ct + Zd)
+    dY_P = jw * dC_dl - (dR_ct + dZd) / (R_ct + Zd) ** 2
+
+    s = np.sqrt(Y_P / Zs)
+    ds = (dY_P / Zs - Y_P * dZs / Zs ** 2) / (2 * s)
+    k = np.sqrt(Zs * Y_P)
+    dk = (dZs * Y_P + Zs * dY_P) / (2 * k)
+    c = 1.0 / np.tanh(k)
+    dc = (1.0 - c ** 2) * dk
+
+    N = 1 + Z_B * s * c
+    dN = dZ_B * s * c + Z_B * (ds * c + s * dc)
+    D = Z_B * Y_P / Zs + s * c
+    dD = (dZ_B * Y_P + Z_B * dY_P) / Zs - Z_B * Y_P * dZs / Zs ** 2 + ds * c + s * dc
+
+    Z = N / D
+    dZ = (dN - Z * dD) / D
+    return Z, dZ
+
+
+def dx15_jac(ctx, parvals, seeds):
+    """
+    DX15 liquid electrolyte (2 rails, ideal C) and its tangents
+    :return: Z_DX15, dZ_DX15 (n_params, n_freqs)
+    """
+    jw = ctx.jw
+
+    def rc(R, C, dR=0.0, dC=0.0):
+        # R || C element
+        den = 1 + jw * R * C
+        Z = R / den
+        return Z, (dR - jw * R ** 2 * dC) / den ** 2
+
+    Z1, dZ1 = rc(parvals['r_c_liq'], models.PLACEHOLDER_C, dR=seeds['r_c_liq'])
+    Z2, dZ2 = rc(parvals['r_a_liq'], models.PLACEHOLDER_C, dR=seeds['r_a_liq'])
+    Z3, dZ3 = rc(models.PLACEHOLDER_R, parvals['c_d_liq'], dC=seeds['c_d_liq'])
+    ZA, dZA = rc(parvals['r_+||'], models.PLACEHOLDER_C, dR=seeds['r_+||'])
+    ZB, dZB = rc(parvals['r_-||'], models.PLACEHOLDER_C, dR=seeds['r_-||'])
+
+    S = Z1 + Z2
+    dS = dZ1 + dZ2
+    p1 = Z1 * Z2 / S
+    dp1 = (dZ1 * Z2 + Z1 * dZ2) / S - p1 * dS / S
+    p2 = 2.0 / S
+    dp2 = -p2 * dS / S
+    k = np.sqrt(S / Z3)
+    dk = (dS / Z3 - S * dZ3 / Z3 ** 2) / (2 * k)
+    t = np.tanh(k / 2)
+    dt = (1.0 - t ** 2) * dk / 2
+    q = Z2 ** 2 * ZA + Z1 ** 2 * ZB
+    dq = 2 * Z2 * dZ2 * ZA + Z2 ** 2 * dZA + 2 * Z1 * dZ1 * ZB + Z1 ** 2 * dZB
+    p3 = k * ZA * ZB * S + q * t
+    dp3 = (dk * ZA * ZB * S + k * (dZA * ZB * S + ZA * dZB * S + ZA * ZB * dS)) + dq * t + q * dt
+    p4 = k * (ZA + ZB) + S * t
+    dp4 = dk * (ZA + ZB) + k * (dZA + dZB) + dS * t + S * dt
+
+    Z = p1 + p2 * p3 / p4
+    dZ = dp1 + (dp2 * p3 + p2 * dp3) / p4 - p2 * p3 * dp4 / p4 ** 2
+    return Z, dZ
+
+
+def stray_jac(ctx, parvals, seeds):
+    """
+    Stray L || R and its tangents
+    """
+    jwL = ctx.jw * parvals['l_str']
+    R = parvals['r_str']
+    den = R + jwL
+    Z = jwL * R / den
+    dZ = (ctx.jw * R ** 2 * seeds['l_str'] + jwL ** 2 * seeds['r_str']) / den ** 2
+    return Z, dZ
+
+
+def anode_jac(ctx, parvals, seeds):
+    """
+    Anode R_ct_Li || C_dl_Li and its tangents
+    """
+    R = parvals['r_ct_li']
+    Z = 1.0 / ((1.0 / R) + ctx.jw * parvals['c_dl_li'])
+    dZ = Z ** 2 * (seeds['r_ct_li'] / R ** 2 - ctx.jw * seeds['c_dl_li'])
+    return Z, dZ
+
+
+def subcircuit_tangents(ctx, parvals, seeds, frozen, parts):
+    """
+    Sum of the tangents of the sub-circuits in series, without the frozen ones (see models.subcircuit_impedance):
+    their parameters are fixed, their tangents are not used
+    :param parts: list of (name, function returning Z, dZ) in the order of the model
+    :return: (n_params, n_freqs) complex array
+    """
+    dZ = np.zeros((len(seeds), ctx.size), dtype=np.complex128)
+    for name, part_jac in parts:
+        if name not in frozen:
+            dZ = dZ + part_jac()[1]
+    return dZ
+
+
+def Barsoukov_Pham_Lee_jac(parvals, f, T=None, Voltage=None, c_case=5, frozen=()):
+    """
+    dZ/dp of models.Barsoukov_Pham_Lee for every parameter in models.HALF_CELL_PARAMS
+    :param f: frequencies, or their models.FrequencyContext
+    :param frozen: names of the sub-circuits of fixed parameters, skipped (see models.ReducedCircuit)
+    :return: dict, parameter name -> complex array of dZ/dp
+    """
+    ctx = models.frequency_context(f)
+    seeds = make_seeds(models.HALF_CELL_PARAMS)
+
+    dZ = subcircuit_tangents(ctx, parvals, seeds, frozen, [
+        ('cathode', lambda: cathode_jac(ctx, parvals, seeds, c_case - 4)),
+        ('dx15', lambda: dx15_jac(ctx, parvals, seeds))])
+    return dict(zip(models.HALF_CELL_PARAMS, dZ))
+
+
+def full_cell_jac(parvals, f, dim, frozen=()):
+    """
+    dZ/dp of the Barsoukov_Pham_Lee_*_Full_cell models for every parameter in models.FULL_CELL_PARAMS
+    """
+    ctx = models.frequency_context(f)
+    seeds = make_seeds(models.FULL_CELL_PARAMS)
+
+    dZ = subcircuit_tangents(ctx, parvals, seeds, frozen, [
+        ('stray', lambda: stray_jac(ctx, parvals, seeds)),
+        ('cathode', lambda: cathode_jac(ctx, parvals, seeds, dim)),
+        ('dx15', lambda: dx15_jac(ctx, parvals, seeds)),
+        ('anode', lambda: anode_jac(ctx, parvals, seeds))])
+    return dict(zip(models.FULL_CELL_PARAMS, dZ))
+
+
+def Barsoukov_Pham_Lee_1D_Full_cell_jac(parvals, f, T=None, Voltage=None, frozen=()):
+    return full_cell_jac(parvals, f, 1, frozen)
+
+
+def Barsoukov_Pham_Lee_2D_Full_cell_jac(parvals, f, T=None, Voltage=None, frozen=()):
+    return full_cell_jac(parvals, f, 2, frozen)
+
+
+def Barsoukov_Pham_Lee_3D_Full_cell_jac(parvals, f, T=None, Voltage=None, frozen=()):
+    return full_cell_jac(parvals, f, 3, frozen)
+
+
+# Analytic derivative of each model in models.MODELS
+MODEL_JACOBIANS = {
+    "Barsoukov-Pham-Lee_1D": partial(Barsoukov_Pham_Lee_jac, c_case=5),
+    "Barsoukov-Pham-Lee_2D": partial(Barsoukov_Pham_Lee_jac, c_case=6),
+    "Barsoukov-Pham-Lee_3D": partial(Barsoukov_Pham_Lee_jac, c_case=7),
+    "Barsoukov-Pham-Lee_1D_Full cell": Barsoukov_Pham_Lee_1D_Full_cell_jac,
+    "Barsoukov-Pham-Lee_2D_Full cell": Barsoukov_Pham_Lee_2D_Full_cell_jac,
+    "Barsoukov-Pham-Lee_3D_Full cell": Barsoukov_Pham_Lee_3D_Full_cell_jac,
+}
+
+
+def cost_jacobian(guess, Z, F, weighting, calc_func=None, T=None, Voltage=None, pars=None, guess_names=None,
+                  params_dict=None, jac_func=None):
+    """
+    Jacobian of models.cost_vector with respect to guess, same arguments as models.cost_vector
+    :param jac_func: derivative of calc_func, returns dict parameter name -> dZ/dp
+    :return: (2 * len(Z), len(guess)) array, rows interleaved real/imag as in models.get_cost_vector
+    """
+    jac = np.zeros((Z.size * 2, len(guess)), dtype=np.float64)
+    if isinstance(params_dict, models.ParameterLayout):
+        if not params_dict.is_valid(guess):
+            return jac
+        params_dict_local = params_dict.fill(guess, pars)
+    else:
+        for i in range(len(guess)):
+            if guess[i] <= 0 and not models.is_signed(guess_names[i]):
+                return jac
+
+        params_dict_local = dict(params_dict)
+        for idx, gs_name in enumerate(guess_names):
+            if pars is None:
+                params_dict_local[gs_name] = guess[idx]
+            else:
+                params_dict_local[gs_name] = guess[idx] * pars[idx]
+
+    dZ_dict = jac_func(params_dict_local, F, T, Voltage)
+    dcalc = np.array([dZ_dict[gs_name] for gs_name in guess_names]).T
+    if pars is not None:
+        dcalc = dcalc * np.asarray(pars)
+
+    zdata = Z[:, np.newaxis]
+    if weighting == 2:
+        # data-proportional
+        derror = -(np.real(dcalc) / np.real(zdata) + 1j * np.imag(dcalc) / np.imag(zdata))
+    elif weighting == 3:
+        # calc-proportional
+        zcalc = calc_func(params_dict_local, F, T, Voltage)[:, np.newaxis]
+        derror = -(np.real(zdata) * np.real(dcalc) / np.real(zcalc) ** 2 +
+                   1j * np.imag(zdata) * np.imag(dcalc) / np.imag(zcalc) ** 2)
+    elif weighting == 4:
+        # data-modulus
+        derror = -dcalc / np.abs(zdata)
+    elif weighting == 5:
+        # calc-modulus
+        zcalc = calc_func(params_dict_local, F, T, Voltage)[:, np.newaxis]
+        abs_zcalc = np.abs(zcalc)
+        dabs = np.real(np.conj(zcalc) * dcalc) / abs_zcalc
+        derror = -dcalc / abs_zcalc - (zdata - zcalc) * dabs / abs_zcalc ** 2
+    else:
+        derror = -dcalc
+
+    jac[0::2] = np.real(derror)
+    jac[1::2] = np.imag(derror)
+    jac[~np.isfinite(jac)] = 0.0
+    return jac
+
+
+def cost_gradient(guess, Z, F, weighting, calc_func=None, T=None, Voltage=None, pars=None, guess_names=None,
+                  params_dict=None, jac_func=None):
+    """
+    Gradient of models.cost_scalar with respect to guess
+    """
+    e1d = models.cost_vector(guess, Z, F, weighting, calc_func, T, Voltage, pars, guess_names, params_dict)
+    jac = cost_jacobian(guess, Z, F, weighting, calc_func, T, Voltage, pars, guess_names, params_dict, jac_func)
+    return 2.0 * np.dot(jac.T, e1d)
+
+
+def check_jacobian(guess, Z, F, weighting, calc_func=None, T=None, Voltage=None, pars=None, guess_names=None,
+                   params_dict=None, jac_func=None, rel_step=1e-4):
+    """
+    Compare cost_jacobian with central finite differences of models.cost_vector
+    Useful when adding a new model together with its derivative
+    :return: max abs difference, scaled by the max abs entry of each column
+    """
+    guess = np.asarray(guess, dtype=np.float64)
+    args = (Z, F, weighting, calc_func, T, Voltage, pars, guess_names, params_dict)
+    jac = cost_jacobian(guess, *args, jac_func=jac_func)
+    jac_fd = np.zeros_like(jac)
+    for idx in range(guess.size):
+        step = rel_step * guess[idx]
+        g_plus = guess.copy()
+        g_minus = guess.copy()
+        g_plus[idx] += step
+        g_minus[idx] -= step
+        jac_fd[:, idx] = (models.cost_vector(g_plus, *args) - models.cost_vector(g_minus, *args)) / (2 * step)
+
+    scale = np.max(np.abs(jac_fd), axis=0)
+    scale[scale == 0] = 1.0
+    return np.max(np.abs(jac - jac_fd) / scale)
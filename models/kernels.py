@@ -0,0 +1,200 @@
+"""
+Fused kernels of the Barsoukov-Pham-Lee models: one loop over parameter sets and frequencies computing the
+impedance of a point from scalars, without the intermediate arrays of models.cathode_impedance and
+models.dx15_impedance, and with each square root and tanh computed once.
+
+The kernels are compiled with numba.njit when Numba is installed, and used by the models once the numba backend is
+selected (models.set_backend('numba'), compiled on first use and cached next to this file); without Numba they are
+plain Python, far slower than the NumPy models, and only used to check them (benchmarks/bench_kernels.py,
+tests/test_kernels.py).
+
+    z = kernels.half_cell(pars, omegas, 1)      # same as models.half_cell_batch(pars, omegas, 1)
+"""
+import cmath
+import numpy as np
+from models.models import BESSEL_ASYMPTOTIC_RE, BESSEL_ASYMPTOTIC_TERMS
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AVAILABLE = numba is not None
+# Re(x) above which tanh(x) is 1 in double precision
+TANH_ONE_RE = 20.0
+# |x| below which x - tanh(x) is taken from its series (spherical diffusion, low frequencies)
+TANH_SERIES_ABS = 0.05
+# tolerance and maximum number of terms of the continued fraction of I1/I0
+BESSEL_CF_EPS = 1e-16
+BESSEL_CF_TERMS = 10000
+
+# columns of models.HALF_CELL_PARAMS, shifted by 2 in models.FULL_CELL_PARAMS (l_str, r_str first)
+R_M, R_CT, R_D, R_I, C_DL, C_D, C_I, Q_W, R_PLUS, R_MINUS, R_C_LIQ, R_A_LIQ, C_D_LIQ = range(13)
+R_CT_LI, C_DL_LI = 15, 16
+
+
+def jit(func):
+    """
+    numba.njit(cache=True) when Numba is installed, func itself otherwise
+    """
+    if numba is None:
+        return func
+    return numba.njit(cache=True)(func)
+
+
+@jit
+def tanh_point(x):
+    if x.real > TANH_ONE_RE:
+        return 1.0 + 0.0j
+    if x.real < -TANH_ONE_RE:
+        return -1.0 + 0.0j
+    return cmath.tanh(x)
+
+
+@jit
+def x_minus_tanh(x, t):
+    """
+    x - tanh(x), from its Taylor series for |x| < TANH_SERIES_ABS where the difference cancels
+    :param t: tanh(x)
+    """
+    if abs(x) >= TANH_SERIES_ABS:
+        return x - t
+    x2 = x * x
+    return x * x2 * (1.0 / 3.0 - x2 * (2.0 / 15.0 - x2 * (17.0 / 315.0 - x2 * (62.0 / 2835.0 -
+                                                                             x2 * 1382.0 / 155925.0))))
+
+
+@jit
+def besseli_ratio_point(x):
+    """
+    I0(x)/I1(x), models.besseli_ratio for one point: the Hankel series above models.BESSEL_ASYMPTOTIC_RE,
+    below it the continued fraction I1/I0 = 1/(2/x + 1/(4/x + 1/(6/x + ...))) (modified Lentz)
+    """
+    if x.real > BESSEL_ASYMPTOTIC_RE:
+        s0 = 1.0 + 0.0j
+        s1 = 1.0 + 0.0j
+        t0 = 1.0 + 0.0j
+        t1 = 1.0 + 0.0j
+        for k in range(1, BESSEL_ASYMPTOTIC_TERMS + 1):
+            t0 = -t0 * (0.0 - (2 * k - 1) ** 2) / (8.0 * k * x)
+            t1 = -t1 * (4.0 - (2 * k - 1) ** 2) / (8.0 * k * x)
+            s0 = s0 + t0
+            s1 = s1 + t1
+        return s0 / s1
+
+    tiny = 1e-300
+    ratio = tiny + 0.0j
+    c = ratio
+    d = 0.0 + 0.0j
+    for n in range(1, BESSEL_CF_TERMS + 1):
+        b = 2.0 * n / x
+        d = b + d
+        if d == 0:
+            d = tiny + 0.0j
+        c = b + 1.0 / c
+        if c == 0:
+            c = tiny + 0.0j
+        d = 1.0 / d
+        delta = c * d
+        ratio = ratio * delta
+        if abs(delta - 1.0) < BESSEL_CF_EPS:
+            break
+    return 1.0 / ratio
+
+
+@jit
+def cathode_point(jw, r_m, r_ct, r_d, r_i, c_dl, c_d, c_i, q_w, dim, cdl_hnc, cdl_hnt, cdl_hnp, cdl_hnu):
+    """
+    models.cathode_impedance at one angular frequency, jw = 1j * omega
+    """
+    cstar_d = c_d + (dim * (c_i + c_d) - c_d) / (1.0 + jw * (r_i * c_i))
+    cstar_dl = c_dl + cdl_hnc / ((1.0 + (jw * cdl_hnt) ** cdl_hnu) ** cdl_hnp)
+    cstar_b = q_w * jw ** -0.5
+
+    # sqrt(R_d / (jw Cd*)) = R_d / x and sqrt(jw Cd* / R_d) = x / R_d, arg(jw Cd*) is within (-pi, pi)
+    x = cmath.sqrt(r_d * (jw * cstar_d))
+    if dim == 1:
+        z_d = r_d / (x * tanh_point(x))
+    elif dim == 2:
+        z_d = r_d * besseli_ratio_point(x) / x
+    else:
+        t = tanh_point(x) if x.real < 100 else 1.0 + 0.0j
+        z_d = r_d * t / x_minus_tanh(x, t)
+
+    y_p = jw * cstar_dl + 1.0 / (r_ct + z_d)
+    z_b = 1.0 / (jw * cstar_b)
+    # sqrt(Zs * Y_P) = Zs * sqrt(Y_P / Zs), Zs = R_m > 0
+    s = cmath.sqrt(y_p / r_m)
+    s_coth = s / tanh_point(r_m * s)
+    return (1.0 + z_b * s_coth) / (z_b * y_p / r_m + s_coth)
+
+
+@jit
+def dx15_point(jw, r1, r2, c3, r_a, r_b):
+    """
+    models.dx15_impedance at one angular frequency
+    """
+    z1 = r1 / (1.0 + jw * r1 * 1e-20)
+    z2 = r2 / (1.0 + jw * r2 * 1e-20)
+    z3 = 1e20 / (1.0 + jw * 1e20 * c3)
+    z_a = r_a / (1.0 + jw * r_a * 1e-20)
+    z_b = r_b / (1.0 + jw * r_b * 1e-20)
+
+    z12 = z1 + z2
+    k = cmath.sqrt(z12 / z3)
+    t = tanh_point(k / 2.0)
+    p3 = k * z_a * z_b * z12 + (z2 * z2 * z_a + z1 * z1 * z_b) * t
+    p4 = k * (z_a + z_b) + z12 * t
+    return z1 * z2 / z12 + 2.0 / z12 * p3 / p4
+
+
+@jit
+def cell_kernel(pars, omegas, dim, full, out):
+    """
+    :param pars: (P, n_params) array, columns of models.HALF_CELL_PARAMS, or models.FULL_CELL_PARAMS if full
+    :param omegas: (1, n_freqs) row for every parameter set, or (P, 1) column, one frequency per parameter set
+    :param dim: diffusion geometry, 1, 2 or 3
+    :param full: stray LR and anode RC of the full cell, half cell (cathode + liquid electrolyte) otherwise
+    :param out: (P, n_freqs) complex array
+    """
+    last_row = omegas.shape[0] - 1
+    p0 = 2 if full else 0
+    cdl_hnp = 1.0 if full else 1e-20
+    for i in range(pars.shape[0]):
+        row = pars[i]
+        for j in range(out.shape[1]):
+            jw = 1j * omegas[min(i, last_row), j]
+            z = cathode_point(jw, row[p0 + R_M], row[p0 + R_CT], row[p0 + R_D], row[p0 + R_I], row[p0 + C_DL],
+                              row[p0 + C_D], row[p0 + C_I], row[p0 + Q_W], dim, 1e-20, 1e-20, cdl_hnp, cdl_hnp)
+            z += dx15_point(jw, row[p0 + R_C_LIQ], row[p0 + R_A_LIQ], row[p0 + C_D_LIQ], row[p0 + R_PLUS],
+                            row[p0 + R_MINUS])
+            if full:
+                z += 1.0 / (1.0 / (jw * row[0]) + 1.0 / row[1])
+                z += 1.0 / (1.0 / row[R_CT_LI] + jw * row[C_DL_LI])
+            out[i, j] = z
+
+
+def evaluate(pars, omegas, dim, full):
+    pars = np.ascontiguousarray(np.atleast_2d(pars), dtype=np.float64)
+    omegas = np.asarray(omegas, dtype=np.float64)
+    omegas = np.ascontiguousarray(omegas if omegas.ndim == 2 else omegas[np.newaxis, :])
+    out = np.empty((pars.shape[0], omegas.shape[1]), dtype=np.complex128)
+    cell_kernel(pars, omegas, dim, full, out)
+    return out
+
+
+def half_cell(pars, omegas, dim):
+    """
+    models.half_cell_batch: cathode + liquid electrolyte
+    :param omegas: angular frequencies, or a (P, 1) column
+    :return: (P, n_freqs) complex array
+    """
+    return evaluate(pars, omegas, dim, False)
+
+
+def full_cell(pars, omegas, dim):
+    """
+    models.full_cell_batch at the angular frequencies omegas: stray LR + cathode + liquid electrolyte + anode RC
+    :return: (P, n_freqs) complex array
+    """
+    return evaluate(pars, omegas, dim, True)
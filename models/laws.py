@@ -0,0 +1,145 @@
+"""
+Temperature and voltage laws of the model parameters
+
+A law makes a parameter a function of the temperature or the voltage of each data point, its own parameters
+are fitted directly, e.g. with laws={'r_ct': 'arrhenius', 'c_dl': 'voltage_exp'}:
+    r_ct(T) = r_ct * exp(r_ct_ea / k_B * (1 / T - 1 / t_ref))      r_ct at t_ref, r_ct_ea activation energy (eV)
+    c_dl(V) = c_dl * exp(c_dl_dv * (V - v_ref))                    c_dl at v_ref, c_dl_dv slope (1/V)
+The data of several spectra are stacked (stack_spectra) with the temperature / voltage of each point, and the
+model is evaluated in one call with one parameter set per point, instead of fitting each spectrum and regressing
+the fitted values afterwards.
+
+    law_model = laws.LawModel("Barsoukov-Pham-Lee_1D", {'r_ct': 'arrhenius', 'r_d': 'arrhenius'})
+    f, z, T = laws.stack_spectra(spectra, temperatures)
+    result = engine.fit("Barsoukov-Pham-Lee_1D", f, z, params, ['r_ct', 'r_ct_ea', 'r_d', 'r_d_ea'],
+                        laws={'r_ct': 'arrhenius', 'r_d': 'arrhenius'}, T=T)
+"""
+import numpy as np
+from models import models
+
+BOLTZMANN_EV = 8.617333262e-5
+CELSIUS_OFFSET = 273.15
+
+
+def arrhenius(value, coef, T, t_ref):
+    """
+    :param coef: activation energy (eV)
+    :param T: temperatures (K)
+    """
+    return value * np.exp(coef / BOLTZMANN_EV * (1.0 / T - 1.0 / t_ref))
+
+
+def voltage_linear(value, coef, V, v_ref):
+    return value * (1.0 + coef * (V - v_ref))
+
+
+def voltage_exp(value, coef, V, v_ref):
+    return value * np.exp(coef * (V - v_ref))
+
+
+# law name -> function, suffix of its parameter, variable ('T' or 'Voltage'), initial value of its parameter when
+# it is free and missing from the parameters (0, no dependence, has no scale to search around: 0.1 eV, 0.1 / V)
+LAWS = {
+    'arrhenius': {'func': arrhenius, 'suffix': '_ea', 'variable': 'T', 'start': 0.1},
+    'voltage_linear': {'func': voltage_linear, 'suffix': '_dv', 'variable': 'Voltage', 'start': 0.1},
+    'voltage_exp': {'func': voltage_exp, 'suffix': '_dv', 'variable': 'Voltage', 'start': 0.1},
+}
+
+
+class LawModel(object):
+    """
+    Model of models.MODELS with parameter laws, same signature as the model functions: (parvals, f, T, Voltage)
+    f, T and Voltage are per point; parvals holds the model parameters (values at t_ref / v_ref) and the law
+    parameters, names in self.par_names.
+    """
+
+    def __init__(self, model, laws, t_ref=298.15, v_ref=0.0, celsius=False):
+        """
+        :param model: model name, key of models.MODELS
+        :param laws: dict, parameter name -> law name (key of LAWS)
+        :param t_ref: reference temperature (K)
+        :param v_ref: reference voltage (V)
+        :param celsius: temperatures T given in degrees Celsius
+        """
+        if model not in models.MODELS:
+            raise ValueError("Undefined model: {}".format(model))
+        mdl = models.MODELS[model]
+        for name, law in laws.items():
+            if name not in mdl['params']:
+                raise ValueError("Unknown parameter: {}".format(name))
+            if law not in LAWS:
+                raise ValueError("Undefined law: {}".format(law))
+
+        self.model = model
+        self.batch_func = mdl['batch']
+        self.model_params = list(mdl['params'])
+        self.laws = dict(laws)
+        self.t_ref = t_ref
+        self.v_ref = v_ref
+        self.celsius = celsius
+        self.law_params = [name + LAWS[law]['suffix'] for name, law in sorted(self.laws.items())]
+        self.par_names = self.model_params + self.law_params
+        # (column of the parameter, column of the law parameter, law) of each law
+        self.columns = [(self.model_params.index(name), self.par_names.index(name + LAWS[law]['suffix']), LAWS[law])
+                        for name, law in sorted(self.laws.items())]
+
+    def variables(self, law, T, Voltage):
+        if law['variable'] == 'T':
+            if T is None:
+                raise ValueError("Temperature law without temperatures")
+            T = np.asarray(T, dtype=np.float64)
+            return T + CELSIUS_OFFSET if self.celsius else T, self.t_ref
+        if Voltage is None:
+            raise ValueError("Voltage law without voltages")
+        return np.asarray(Voltage, dtype=np.float64), self.v_ref
+
+    def point_parameters(self, parvals, n_points, T=None, Voltage=None):
+        """
+        :return: (n_points, len(model_params)) array, the model parameters of each point
+        """
+        values = models.parvals_to_array(parvals, self.par_names)[0]
+        pars = np.repeat(values[np.newaxis, :len(self.model_params)], n_points, axis=0)
+        for col, law_col, law in self.columns:
+            variable, ref = self.variables(law, T, Voltage)
+            pars[:, col] = law['func'](values[col], values[law_col], variable, ref)
+        return pars
+
+    def __call__(self, parvals, f, T=None, Voltage=None):
+        ctx = models.frequency_context(f, column=True)
+        pars = self.point_parameters(parvals, ctx.size, T, Voltage)
+        return self.batch_func(pars, ctx)[:, 0]
+
+    def key(self):
+        """
+        Name of the model with its laws, model name of the fit cache
+        """
+        return '{}|{}|{}|{}|{}'.format(self.model, sorted(self.laws.items()), self.t_ref, self.v_ref, self.celsius)
+
+
+def default_law_values(laws, params, free=()):
+    """
+    Law parameters missing from params are set to 0 (parameter independent of T / Voltage), or to the start value
+    of their law if they are free: the optimizers search around the initial values, differential evolution from
+    -10 to 10 times a signed initial value (engine.Fitter.diev_log_bounds)
+    :param free: names of the free parameters
+    :return: dict, params with the law parameters
+    """
+    params = dict(params)
+    for name, law in laws.items():
+        law_name = name + LAWS[law]['suffix']
+        params.setdefault(law_name, LAWS[law]['start'] if law_name in free else 0.0)
+    return params
+
+
+def stack_spectra(spectra, conditions):
+    """
+    Concatenate spectra into one dataset with the condition of each point
+    :param spectra: list of (freqs, Z)
+    :param conditions: temperature or voltage of each spectrum
+    :return: f, Z, condition per point
+    """
+    f_data = np.concatenate([np.asarray(freqs, dtype=np.float64) for freqs, _ in spectra])
+    z_data = np.concatenate([np.asarray(Z, dtype=np.complex128) for _, Z in spectra])
+    c_data = np.concatenate([np.full(len(freqs), condition, dtype=np.float64)
+                             for (freqs, _), condition in zip(spectra, conditions)])
+    return f_data, z_data, c_data
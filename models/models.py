@@ -1,630 +1,919 @@
-import numpy as np
-import copy
-from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QVariant, QThread
-from scipy.optimize import least_squares, leastsq, minimize, differential_evolution
-import plotly
-import plotly.graph_objs as go
-import random, os
-from functools import partial
-from scipy import special
-import mpmath
-mpmath.mp.dps = 16
-
-np.random.seed(211)
-random.seed(211)
-
-def diffcylim(w, R_d, Cd):
-    """ diffcylim R_d Cd """
-    ret_sqrt = np.sqrt(R_d * np.multiply(1j*w, Cd))
-
-    ret_mp = [R_d * mpmath.besseli(0, x) /  (x * mpmath.besseli(1, x)) for x in ret_sqrt]
-    
-    z_ret = np.array(ret_mp, dtype=np.complex128)
-    return z_ret
-
-def Barsoukov_Pham_Lee_1(parvals, f):
-    """
-    Barsoukov-Pham-Lee #1D
-    Cathode: DX30 modified with corrected Cd, Ci
-    Liquid electrolyte instead of R_ohm, use DX15
-    """
-
-    omegas = 2 * np.pi * np.array(f)
-    
-    #Cathode
-    R_m = parvals['r_m']
-    R_ct = parvals['r_ct']
-    R_d = parvals['r_d']
-
-    R_i = parvals["r_i"]
-    C_dl = parvals["c_dl"]
-    C_d = parvals["c_d"]
-
-    C_i = parvals["c_i"]
-    Q_W = parvals["q_w"]
-
-    Cdl_C0 = C_dl
-    Cdl_HNC = 1e-20
-    Cdl_HNT = 1e-20
-    Cdl_HNP = 1e-20
-    Cdl_HNU = 1e-20
-
-    Cd_C0 = C_d
-    Cd_HNC = C_i
-    Cd_HNT = R_i*C_i
-    Cd_HNP = 1
-    Cd_HNU = 1
-    CPE_B_T = Q_W
-    CPE_B_P = 0.5
-
-    Cstar_d = Cd_C0 + Cd_HNC / ((1 + (1j * omegas * Cd_HNT) ** Cd_HNU) ** Cd_HNP)
-    Cstar_dl = Cdl_C0 + Cdl_HNC / ((1 + (1j * omegas * Cdl_HNT) ** Cdl_HNU) ** Cdl_HNP)
-    Cstar_B = CPE_B_T * ((1j * omegas) ** (CPE_B_P - 1))
-
-    Zd_numerator = np.sqrt(R_d / (1j*np.multiply(omegas, Cstar_d)))
-    Zd_denominator = np.tanh(np.sqrt(R_d*1j * np.multiply(omegas, Cstar_d)))
-
-    Zd = np.divide(Zd_numerator, Zd_denominator)
-
-    Zs = R_m
-    Y_P = (1j * omegas * Cstar_dl) + 1.0 / (R_ct + Zd)
-    Z_B = 1.0 / (1j * omegas * Cstar_B)
-
-    Z_cathode = (1 + Z_B * np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P)))) / (
-            Z_B * Y_P / Zs + np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P))))
-            
-            
-    #Liquid electrolyte
-    DX15_R1 = parvals['r_c_liq']
-    DX15_C1 = 1e-20
-    DX15_R2 = parvals['r_a_liq']
-
-    DX15_C2 = 1e-20
-    DX15_R3 = 1e20
-    DX15_C3 = parvals['c_d_liq']
-    DX15_RA = parvals['r_+||']
-    DX15_CA = 1e-20
-    DX15_RB = parvals['r_-||']
-    DX15_CB = 1e-20
-
-    DX15_Z1 = np.divide(DX15_R1, 1 + 1j*omegas*DX15_R1*DX15_C1)
-    DX15_Z2 = np.divide(DX15_R2, 1 + 1j*omegas*DX15_R2*DX15_C2)
-    DX15_Z3 = np.divide(DX15_R3, 1 + 1j*omegas*DX15_R3*DX15_C3)
-    DX15_ZA = np.divide(DX15_RA, 1 + 1j*omegas*DX15_RA*DX15_CA)
-    DX15_ZB = np.divide(DX15_RB, 1 + 1j*omegas*DX15_RB*DX15_CB)
-
-    Z_DX15_p1 = np.divide(np.multiply(DX15_Z1, DX15_Z2), DX15_Z1 + DX15_Z2)
-    Z_DX15_p2 = np.divide(2.0, DX15_Z1 + DX15_Z2)
-    DX15_k = np.sqrt(np.divide(DX15_Z1 + DX15_Z2, DX15_Z3))
-    Z_DX15_p3 = DX15_k*DX15_ZA*DX15_ZB*(DX15_Z1 + DX15_Z2) + ((DX15_Z2**2) *DX15_ZA + (DX15_Z1**2) * DX15_ZB)*np.tanh(DX15_k/2)
-    Z_DX15_p4 = DX15_k*(DX15_ZA + DX15_ZB) + (DX15_Z1 + DX15_Z2)*np.tanh(DX15_k/2)
-    
-    Z_DX15 = Z_DX15_p1 + np.divide(Z_DX15_p2 * Z_DX15_p3, Z_DX15_p4)
-    
-    Z = Z_cathode + Z_DX15
-    return Z
-    
-def Barsoukov_Pham_Lee_2(parvals, f):
-    """ 
-    Barsoukov-Pham-Lee #2D
-    """
-    #co factor 2trong Cd, 2 trong Ci
-    omegas = 2 * np.pi * np.array(f)
-
-    R_m = parvals['r_m']
-    R_ct = parvals['r_ct']
-    R_d = parvals['r_d']
-
-    R_i = parvals["r_i"]
-    C_dl = parvals["c_dl"]
-    C_d = parvals["c_d"]
-
-    C_i = parvals["c_i"]
-    Q_W = parvals["q_w"]
-
-    Cdl_C0 = C_dl
-    Cdl_HNC = 1e-20
-    Cdl_HNT = 1e-20
-    Cdl_HNP = 1e-20
-    Cdl_HNU = 1e-20
-
-    Cd_C0 = C_d
-    Cd_HNC = C_i
-    Cd_HNT = R_i*C_i
-    Cd_HNP = 1
-    Cd_HNU = 1
-    CPE_B_T = Q_W
-    CPE_B_P = 0.5
-
-    Cstar_d = Cd_C0 + (2*(Cd_HNC + Cd_C0)- Cd_C0)/ ((1 + (1j * omegas * Cd_HNT) ** Cd_HNU) ** Cd_HNP)
-    Cstar_dl = Cdl_C0 + Cdl_HNC / ((1 + (1j * omegas * Cdl_HNT) ** Cdl_HNU) ** Cdl_HNP)
-    Cstar_B = CPE_B_T * ((1j * omegas) ** (CPE_B_P - 1))
-
-    Zd = diffcylim(omegas, R_d, Cstar_d)
-
-    Zs = R_m
-    Y_P = (1j * omegas * Cstar_dl) + 1.0 / (R_ct + Zd)
-    Z_B = 1.0 / (1j * omegas * Cstar_B)
-
-    Z_cathode = (1 + Z_B * np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P)))) / (
-            Z_B * Y_P / Zs + np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P))))
-            
-    #Liquid electrolyte
-    DX15_R1 = parvals['r_c_liq']
-    DX15_C1 = 1e-20
-    DX15_R2 = parvals['r_a_liq']
-
-    DX15_C2 = 1e-20
-    DX15_R3 = 1e20
-    DX15_C3 = parvals['c_d_liq']
-    DX15_RA = parvals['r_+||']
-    DX15_CA = 1e-20
-    DX15_RB = parvals['r_-||']
-    DX15_CB = 1e-20
-
-    DX15_Z1 = np.divide(DX15_R1, 1 + 1j*omegas*DX15_R1*DX15_C1)
-    DX15_Z2 = np.divide(DX15_R2, 1 + 1j*omegas*DX15_R2*DX15_C2)
-    DX15_Z3 = np.divide(DX15_R3, 1 + 1j*omegas*DX15_R3*DX15_C3)
-    DX15_ZA = np.divide(DX15_RA, 1 + 1j*omegas*DX15_RA*DX15_CA)
-    DX15_ZB = np.divide(DX15_RB, 1 + 1j*omegas*DX15_RB*DX15_CB)
-
-    Z_DX15_p1 = np.divide(np.multiply(DX15_Z1, DX15_Z2), DX15_Z1 + DX15_Z2)
-    Z_DX15_p2 = np.divide(2.0, DX15_Z1 + DX15_Z2)
-    DX15_k = np.sqrt(np.divide(DX15_Z1 + DX15_Z2, DX15_Z3))
-    Z_DX15_p3 = DX15_k*DX15_ZA*DX15_ZB*(DX15_Z1 + DX15_Z2) + ((DX15_Z2**2) *DX15_ZA + (DX15_Z1**2) * DX15_ZB)*np.tanh(DX15_k/2)
-    Z_DX15_p4 = DX15_k*(DX15_ZA + DX15_ZB) + (DX15_Z1 + DX15_Z2)*np.tanh(DX15_k/2)
-    
-    Z_DX15 = Z_DX15_p1 + np.divide(Z_DX15_p2 * Z_DX15_p3, Z_DX15_p4)
-    
-    Z = Z_cathode + Z_DX15
-
-    return Z
-
-def Barsoukov_Pham_Lee_3(parvals, f):
-    """ 
-    Barsoukov-Pham-Lee #3D
-    """
-    #co factor 3 trong Cd, 3 trong Ci
-    omegas = 2 * np.pi * np.array(f)
-
-    R_m = parvals['r_m']
-    R_ct = parvals['r_ct']
-    R_d = parvals['r_d']
-
-    R_i = parvals["r_i"]
-    C_dl = parvals["c_dl"]
-    C_d = parvals["c_d"]
-
-    C_i = parvals["c_i"]
-    Q_W = parvals["q_w"]
-
-    Cdl_C0 = C_dl
-    Cdl_HNC = 1e-20
-    Cdl_HNT = 1e-20
-    Cdl_HNP = 1e-20
-    Cdl_HNU = 1e-20
-
-    Cd_C0 = C_d
-    Cd_HNC = C_i
-    Cd_HNT = R_i*C_i
-    Cd_HNP = 1
-    Cd_HNU = 1
-    CPE_B_T = Q_W
-    CPE_B_P = 0.5
-
-    Cstar_d = Cd_C0 + (3*(Cd_HNC + Cd_C0)- Cd_C0) / ((1 + (1j * omegas * Cd_HNT) ** Cd_HNU) ** Cd_HNP)
-    Cstar_dl = Cdl_C0 + Cdl_HNC / ((1 + (1j * omegas * Cdl_HNT) ** Cdl_HNU) ** Cdl_HNP)
-    Cstar_B = CPE_B_T * ((1j * omegas) ** (CPE_B_P - 1))
-
-    tanh_sqrt = np.sqrt(R_d * (1j * omegas * Cstar_d))
-    tanh_values = (1+0j)*np.ones(tanh_sqrt.shape, dtype=np.complex64)
-    tanh_values[np.real(tanh_sqrt) < 100] = np.tanh(tanh_sqrt[np.real(tanh_sqrt) < 100])
-
-    Zd = tanh_values / (
-           np.sqrt(1j * omegas * Cstar_d / R_d) - (1 / R_d) * tanh_values)
-
-    Zs = R_m
-    Y_P = (1j * omegas * Cstar_dl) + 1.0 / (R_ct + Zd)
-    Z_B = 1.0 / (1j * omegas * Cstar_B)
-
-    Z_cathode = (1 + Z_B * np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P)))) / (
-            Z_B * Y_P / Zs + np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P))))
-
-    #Liquid electrolyte
-    DX15_R1 = parvals['r_c_liq']
-    DX15_C1 = 1e-20
-    DX15_R2 = parvals['r_a_liq']
-
-    DX15_C2 = 1e-20
-    DX15_R3 = 1e20
-    DX15_C3 = parvals['c_d_liq']
-    DX15_RA = parvals['r_+||']
-    DX15_CA = 1e-20
-    DX15_RB = parvals['r_-||']
-    DX15_CB = 1e-20
-
-    DX15_Z1 = np.divide(DX15_R1, 1 + 1j*omegas*DX15_R1*DX15_C1)
-    DX15_Z2 = np.divide(DX15_R2, 1 + 1j*omegas*DX15_R2*DX15_C2)
-    DX15_Z3 = np.divide(DX15_R3, 1 + 1j*omegas*DX15_R3*DX15_C3)
-    DX15_ZA = np.divide(DX15_RA, 1 + 1j*omegas*DX15_RA*DX15_CA)
-    DX15_ZB = np.divide(DX15_RB, 1 + 1j*omegas*DX15_RB*DX15_CB)
-
-    Z_DX15_p1 = np.divide(np.multiply(DX15_Z1, DX15_Z2), DX15_Z1 + DX15_Z2)
-    Z_DX15_p2 = np.divide(2.0, DX15_Z1 + DX15_Z2)
-    DX15_k = np.sqrt(np.divide(DX15_Z1 + DX15_Z2, DX15_Z3))
-    Z_DX15_p3 = DX15_k*DX15_ZA*DX15_ZB*(DX15_Z1 + DX15_Z2) + ((DX15_Z2**2) *DX15_ZA + (DX15_Z1**2) * DX15_ZB)*np.tanh(DX15_k/2)
-    Z_DX15_p4 = DX15_k*(DX15_ZA + DX15_ZB) + (DX15_Z1 + DX15_Z2)*np.tanh(DX15_k/2)
-    
-    Z_DX15 = Z_DX15_p1 + np.divide(Z_DX15_p2 * Z_DX15_p3, Z_DX15_p4)
-    
-    Z = Z_cathode + Z_DX15
-    return Z
-   
-
-def Barsoukov_Pham_Lee(parvals, f, T=None, Voltage=None, c_case=5):
-
-    if c_case == 5:
-        fit_zrzi = Barsoukov_Pham_Lee_1(parvals, f)
-    elif c_case == 6:
-        fit_zrzi = Barsoukov_Pham_Lee_2(parvals, f)
-    elif c_case == 7:
-        fit_zrzi = Barsoukov_Pham_Lee_3(parvals, f)
-    else:
-        print('Undefined')
-
-    L_str = 1e-20
-    R_str = 1e-20
-    Z_L = 1j * 2 * np.pi * f * L_str
-
-    fit_zrzi = 1 / ((1 / Z_L) + (1 / R_str)) + fit_zrzi
-
-    return fit_zrzi
-
-def Barsoukov_Pham_Lee_1D_Full_cell(parvals, f, T=None, Voltage=None):
-    
-    #Stray effect: Simple LR in parallel
-    L_str = parvals['l_str']
-    R_str = parvals['r_str']
-    Z_LR_str = 1.0/ ((1.0/(1j * 2 * np.pi * f * L_str)) + 1.0/R_str)
-    
-    omegas = 2*np.pi*f
-    #Cathode: DX30 with corrected Cd* equation, Cdl is ideal C while Ci is CHN
-    R_m = parvals['r_m']
-    R_ct = parvals['r_ct']
-    R_d = parvals['r_d']
-    R_i = parvals["r_i"]
-    
-    C0_dl = parvals["c_dl"]
-    CHN_dl = 1e-20
-    THN_dl = 1e-20
-    P_dl = 1.0
-    U_dl = 1.0
-    
-    C_d = parvals["c_d"]
-    C_i = parvals["c_i"]
-    
-    ###Tau_i is tau_HN_max, tau_i = Ri * Ci   
-    P_i = 1 
-    U_i = 1 
-    
-    Cd_HNT = (R_i * C_i) / (np.power(np.sin((np.pi*U_i*P_i)/(2*(P_i+1))) / np.sin((np.pi*U_i) / (2*(P_i+1))), 1/U_i))
-        
-    CPE_B_P = 0.5
-    Q_w = parvals["q_w"]
-    CPE_B_T = Q_w
-    
-    Cstar_d = C_d + (1*(C_i + C_d)- C_d) / ((1 + (1j * omegas * Cd_HNT) ** U_i) ** P_i)
-    Cstar_dl = C0_dl + CHN_dl / ((1 + (1j * omegas * THN_dl) ** U_dl) ** P_dl)
-    Cstar_B = CPE_B_T * ((1j * omegas) ** (CPE_B_P - 1))
-
-    Zd_numerator = np.sqrt(R_d / (1j*np.multiply(omegas, Cstar_d)))
-    Zd_denominator = np.tanh(np.sqrt(R_d*1j * np.multiply(omegas, Cstar_d)))
-
-    Zd = np.divide(Zd_numerator, Zd_denominator)
-
-    Zs = R_m
-    Y_P = (1j * omegas * Cstar_dl) + 1.0 / (R_ct + Zd)
-    Z_B = 1.0 / (1j * omegas * Cstar_B)
-
-    Z_cathode = (1 + Z_B * np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P)))) / (
-            Z_B * Y_P / Zs + np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P))))
-    
-    
-    #Separator with liquid electrolyte: DX15 with 2 rails, ideal C
-    DX15_R1 = parvals['r_c_liq']
-    DX15_C1 = 1e-20
-    DX15_R2 = parvals['r_a_liq']
-
-    DX15_C2 = 1e-20
-    DX15_R3 = 1e20
-    DX15_C3 = parvals['c_d_liq']
-    DX15_RA = parvals['r_+||']   # R_+||
-    DX15_CA = 1e-20
-    DX15_RB = parvals['r_-||']    # R_-||
-    DX15_CB = 1e-20
-
-    DX15_Z1 = np.divide(DX15_R1, 1 + 1j*omegas*DX15_R1*DX15_C1)
-    DX15_Z2 = np.divide(DX15_R2, 1 + 1j*omegas*DX15_R2*DX15_C2)
-    DX15_Z3 = np.divide(DX15_R3, 1 + 1j*omegas*DX15_R3*DX15_C3)
-    DX15_ZA = np.divide(DX15_RA, 1 + 1j*omegas*DX15_RA*DX15_CA)
-    DX15_ZB = np.divide(DX15_RB, 1 + 1j*omegas*DX15_RB*DX15_CB)
-
-    Z_DX15_p1 = np.divide(np.multiply(DX15_Z1, DX15_Z2), DX15_Z1 + DX15_Z2)
-    Z_DX15_p2 = np.divide(2.0, DX15_Z1 + DX15_Z2)
-    DX15_k = np.sqrt(np.divide(DX15_Z1 + DX15_Z2, DX15_Z3))
-    Z_DX15_p3 = DX15_k*DX15_ZA*DX15_ZB*(DX15_Z1 + DX15_Z2) + ((DX15_Z2**2) *DX15_ZA + (DX15_Z1**2) * DX15_ZB)*np.tanh(DX15_k/2)
-    Z_DX15_p4 = DX15_k*(DX15_ZA + DX15_ZB) + (DX15_Z1 + DX15_Z2)*np.tanh(DX15_k/2)
-    
-    Z_DX15 = Z_DX15_p1 + np.divide(Z_DX15_p2 * Z_DX15_p3, Z_DX15_p4)
-    
-    
-    #Anode: Simple RC in parallel
-    R_ct_Li = parvals['r_ct_li']
-    C_dl_Li = parvals['c_dl_li']
-    Z_dl_Li = 1.0/((1.0/R_ct_Li)+ (1j * 2 * np.pi * f * C_dl_Li))
-    
-    #Total impedance    
-    Z_ret = Z_LR_str + Z_cathode + Z_DX15 + Z_dl_Li
-    
-    return Z_ret
-
-def Barsoukov_Pham_Lee_2D_Full_cell(parvals, f, T=None, Voltage=None):
-    
-    #Stray effect: Simple LR in parallel
-    L_str = parvals['l_str']
-    R_str = parvals['r_str']
-    Z_LR_str = 1.0/ ((1.0/(1j * 2 * np.pi * f * L_str)) + 1.0/R_str)
-    
-    omegas = 2*np.pi*f
-    #Cathode: DX30 with corrected Cd* equation, Cdl is ideal C while Ci is CHN
-    R_m = parvals['r_m']
-    R_ct = parvals['r_ct']
-    R_d = parvals['r_d']
-    R_i = parvals["r_i"]
-    
-    C0_dl = parvals["c_dl"]
-    CHN_dl = 1e-20
-    THN_dl = 1e-20
-    P_dl = 1.0
-    U_dl = 1.0
-    
-    C_d = parvals["c_d"]
-    C_i = parvals["c_i"]
-    
-    ###Tau_i is tau_HN_max, tau_i = Ri * Ci   
-    P_i = 1 
-    U_i = 1 
-    
-    Cd_HNT = (R_i * C_i) / (np.power(np.sin((np.pi*U_i*P_i)/(2*(P_i+1))) / np.sin((np.pi*U_i) / (2*(P_i+1))), 1/U_i))
-        
-    CPE_B_P = 0.5
-    Q_w = parvals["q_w"]
-    CPE_B_T = Q_w
-    
-    Cstar_d = C_d + (2*(C_i + C_d)- C_d) / ((1 + (1j * omegas * Cd_HNT) ** U_i) ** P_i)
-    Cstar_dl = C0_dl + CHN_dl / ((1 + (1j * omegas * THN_dl) ** U_dl) ** P_dl)
-    Cstar_B = CPE_B_T * ((1j * omegas) ** (CPE_B_P - 1))
-
-    Zd = diffcylim(omegas, R_d, Cstar_d)
-
-    Zs = R_m
-    Y_P = (1j * omegas * Cstar_dl) + 1.0 / (R_ct + Zd)
-    Z_B = 1.0 / (1j * omegas * Cstar_B)
-
-    Z_cathode = (1 + Z_B * np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P)))) / (
-            Z_B * Y_P / Zs + np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P))))
-    
-    
-    #Separator with liquid electrolyte: DX15 with 2 rails, ideal C
-    DX15_R1 = parvals['r_c_liq']
-    DX15_C1 = 1e-20
-    DX15_R2 = parvals['r_a_liq']
-
-    DX15_C2 = 1e-20
-    DX15_R3 = 1e20
-    DX15_C3 = parvals['c_d_liq']
-    DX15_RA = parvals['r_+||']
-    DX15_CA = 1e-20
-    DX15_RB = parvals['r_-||']
-    DX15_CB = 1e-20
-
-    DX15_Z1 = np.divide(DX15_R1, 1 + 1j*omegas*DX15_R1*DX15_C1)
-    DX15_Z2 = np.divide(DX15_R2, 1 + 1j*omegas*DX15_R2*DX15_C2)
-    DX15_Z3 = np.divide(DX15_R3, 1 + 1j*omegas*DX15_R3*DX15_C3)
-    DX15_ZA = np.divide(DX15_RA, 1 + 1j*omegas*DX15_RA*DX15_CA)
-    DX15_ZB = np.divide(DX15_RB, 1 + 1j*omegas*DX15_RB*DX15_CB)
-
-    Z_DX15_p1 = np.divide(np.multiply(DX15_Z1, DX15_Z2), DX15_Z1 + DX15_Z2)
-    Z_DX15_p2 = np.divide(2.0, DX15_Z1 + DX15_Z2)
-    DX15_k = np.sqrt(np.divide(DX15_Z1 + DX15_Z2, DX15_Z3))
-    Z_DX15_p3 = DX15_k*DX15_ZA*DX15_ZB*(DX15_Z1 + DX15_Z2) + ((DX15_Z2**2) *DX15_ZA + (DX15_Z1**2) * DX15_ZB)*np.tanh(DX15_k/2)
-    Z_DX15_p4 = DX15_k*(DX15_ZA + DX15_ZB) + (DX15_Z1 + DX15_Z2)*np.tanh(DX15_k/2)
-    
-    Z_DX15 = Z_DX15_p1 + np.divide(Z_DX15_p2 * Z_DX15_p3, Z_DX15_p4)
-    
-    
-    #Anode: Simple RC in parallel
-    R_ct_Li = parvals['r_ct_li']
-    C_dl_Li = parvals['c_dl_li']
-    Z_dl_Li = 1.0/((1.0/R_ct_Li)+ (1j * 2 * np.pi * f * C_dl_Li))
-    
-    #Total impedance    
-    Z_ret = Z_LR_str + Z_cathode + Z_DX15 + Z_dl_Li
-    
-    return Z_ret
-
-def Barsoukov_Pham_Lee_3D_Full_cell(parvals, f, T=None, Voltage=None):
-    
-    #Stray effect: Simple LR in parallel
-    L_str = parvals['l_str']
-    R_str = parvals['r_str']
-    Z_LR_str = 1.0/ ((1.0/(1j * 2 * np.pi * f * L_str)) + 1.0/R_str)
-    
-    omegas = 2*np.pi*f
-    #Cathode: DX30 with corrected Cd* equation, Cdl is ideal C while Ci is CHN
-    R_m = parvals['r_m']
-    R_ct = parvals['r_ct']
-    R_d = parvals['r_d']
-    R_i = parvals["r_i"]
-    
-    C0_dl = parvals["c_dl"]
-    CHN_dl = 1e-20
-    THN_dl = 1e-20
-    P_dl = 1.0
-    U_dl = 1.0
-    
-    C_d = parvals["c_d"]
-    C_i = parvals["c_i"]
-    
-    ###Tau_i is tau_HN_max, tau_i = Ri * Ci   
-    P_i = 1 
-    U_i = 1 
-    
-    Cd_HNT = (R_i * C_i) / (np.power(np.sin((np.pi*U_i*P_i)/(2*(P_i+1))) / np.sin((np.pi*U_i) / (2*(P_i+1))), 1/U_i))
-        
-    CPE_B_P = 0.5
-    Q_w = parvals["q_w"]
-    CPE_B_T = Q_w
-    
-    Cstar_d = C_d + (3*(C_i + C_d)- C_d) / ((1 + (1j * omegas * Cd_HNT) ** U_i) ** P_i)
-    
-    Cstar_dl = C0_dl + CHN_dl / ((1 + (1j * omegas * THN_dl) ** U_dl) ** P_dl)
-    Cstar_B = CPE_B_T * ((1j * omegas) ** (CPE_B_P - 1))
-
-    tanh_sqrt = np.sqrt(R_d * (1j * omegas * Cstar_d))
-    tanh_values = (1+0j)*np.ones(tanh_sqrt.shape, dtype=np.complex64)
-    tanh_values[np.real(tanh_sqrt) < 100] = np.tanh(tanh_sqrt[np.real(tanh_sqrt) < 100])
-
-    Zd = tanh_values / (
-           np.sqrt(1j * omegas * Cstar_d / R_d) - (1 / R_d) * tanh_values)
-
-    Zs = R_m
-    Y_P = (1j * omegas * Cstar_dl) + 1.0 / (R_ct + Zd)
-    Z_B = 1.0 / (1j * omegas * Cstar_B)
-
-    Z_cathode = (1 + Z_B * np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P)))) / (
-            Z_B * Y_P / Zs + np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P))))
-    
-    
-    #Separator with liquid electrolyte: DX15 with 2 rails, ideal C
-    DX15_R1 = parvals['r_c_liq']
-    DX15_C1 = 1e-20
-    DX15_R2 = parvals['r_a_liq']
-
-    DX15_C2 = 1e-20
-    DX15_R3 = 1e20
-    DX15_C3 = parvals['c_d_liq']
-    DX15_RA = parvals['r_+||']
-    DX15_CA = 1e-20
-    DX15_RB = parvals['r_-||']
-    DX15_CB = 1e-20
-
-    DX15_Z1 = np.divide(DX15_R1, 1 + 1j*omegas*DX15_R1*DX15_C1)
-    DX15_Z2 = np.divide(DX15_R2, 1 + 1j*omegas*DX15_R2*DX15_C2)
-    DX15_Z3 = np.divide(DX15_R3, 1 + 1j*omegas*DX15_R3*DX15_C3)
-    DX15_ZA = np.divide(DX15_RA, 1 + 1j*omegas*DX15_RA*DX15_CA)
-    DX15_ZB = np.divide(DX15_RB, 1 + 1j*omegas*DX15_RB*DX15_CB)
-
-    Z_DX15_p1 = np.divide(np.multiply(DX15_Z1, DX15_Z2), DX15_Z1 + DX15_Z2)
-    Z_DX15_p2 = np.divide(2.0, DX15_Z1 + DX15_Z2)
-    DX15_k = np.sqrt(np.divide(DX15_Z1 + DX15_Z2, DX15_Z3))
-    Z_DX15_p3 = DX15_k*DX15_ZA*DX15_ZB*(DX15_Z1 + DX15_Z2) + ((DX15_Z2**2) *DX15_ZA + (DX15_Z1**2) * DX15_ZB)*np.tanh(DX15_k/2)
-    Z_DX15_p4 = DX15_k*(DX15_ZA + DX15_ZB) + (DX15_Z1 + DX15_Z2)*np.tanh(DX15_k/2)
-    
-    Z_DX15 = Z_DX15_p1 + np.divide(Z_DX15_p2 * Z_DX15_p3, Z_DX15_p4)
-    
-    
-    #Anode: Simple RC in parallel
-    R_ct_Li = parvals['r_ct_li']
-    C_dl_Li = parvals['c_dl_li']
-    Z_dl_Li = 1.0/((1.0/R_ct_Li)+ (1j * 2 * np.pi * f * C_dl_Li))
-    
-    #Total impedance    
-    Z_ret = Z_LR_str + Z_cathode + Z_DX15 + Z_dl_Li
-    
-    return Z_ret
-
-def get_cost_vector(zcalc, zdata, weighting):
-    """
-    Get cost vector
-    :param y_pred:
-    :param ydata:
-    :param weighting:
-        2: data-proportional
-        3: calc-proportional
-        4: data-modulus
-        5: calc-modulus
-        otherwise: unit weighting
-    :return:
-    """
-
-    # if np.count_nonzero(np.logical_or(np.isinf(zcalc), np.isnan(zcalc))):
-    #     return 1e16 * np.ones(len(zcalc) * 2)
-
-    error = zdata - zcalc
-    if weighting == 2:
-        # data-proportional
-        error.real = np.real(error) / np.real(zdata)
-        error.imag = np.imag(error) / np.imag(zdata)
-    elif weighting == 3:
-        # calc-proportional
-        error.real = np.real(error) / np.real(zcalc)
-        error.imag = np.imag(error) / np.imag(zcalc)
-    elif weighting == 4:
-        # data-modulus
-        error = error / np.abs(zdata)
-    elif weighting == 5:
-        # calc-modulus
-        error = error / np.abs(zcalc)
-
-    # e1d = error.view(np.float64)
-    e1d = np.zeros(zdata.size * 2, dtype=np.float64)
-    e1d[0:e1d.size:2] = error.real
-    e1d[1:e1d.size:2] = error.imag
-    if np.count_nonzero(np.logical_or(np.isinf(e1d), np.isnan(e1d))):
-        print("Residual NaN, INF")
-    return e1d
-
-
-def cost_vector(guess, Z, F, weighting, calc_func=None, T=None, Voltage=None, pars=None, guess_names=None,
-                params_dict=None):
-    """
-    Type of weighting
-    2: data-proportional
-    3: calc-proportional
-    4: data-modulus
-    5: calc-modulus
-    otherwise: unit weighting
-    """
-    for i in range(len(guess)):
-        # print(guess_names[i])
-        if guess[i] <= 0 and guess_names[i] != 'r_str':
-            # print("WARNING ", i, guess[i].value)
-            return 1.0e16 * np.ones(len(Z) * 2)
-
-    params_dict_local = copy.deepcopy(params_dict)
-
-    for idx, gs_name in enumerate(guess_names):
-        if pars is None:
-            params_dict_local[gs_name] = guess[idx]
-        else:
-            params_dict_local[gs_name] = guess[idx] * pars[idx]
-
-    # calc = Linh_func_OLO(par * guess, F)
-    calc = calc_func(params_dict_local, F, T, Voltage)
-
-    if np.count_nonzero(np.logical_or(np.isinf(calc), np.isnan(calc))):
-        return 1e16 * np.ones(len(Z) * 2)
-
-    e1d = get_cost_vector(calc, Z, weighting)
-
-    return e1d
-
-
-def cost_scalar(guess, Z, F, weighting, calc_func=None, T=None, Voltage=None, pars=None, guess_names=None,
-                params_dict=None):
-    """
-    """
-    e1d = cost_vector(guess, Z, F, weighting, calc_func, T, Voltage, pars, guess_names, params_dict)
-    return np.sum(np.array(e1d) ** 2)
-    
\ No newline at end of file
+import os
+import numpy as np
+import random
+import importlib.util
+from functools import partial
+
+np.random.seed(211)
+random.seed(211)
+
+# Re(x) above which the I0/I1 ratio is taken from the Hankel asymptotic series
+BESSEL_ASYMPTOTIC_RE = 50.0
+BESSEL_ASYMPTOTIC_TERMS = 12
+
+# Parameter names (as sent by the GUI) of the sub-circuits, of the half cell and full cell models
+CATHODE_PARAMS = ['r_m', 'r_ct', 'r_d', 'r_i', 'c_dl', 'c_d', 'c_i', 'q_w']
+DX15_PARAMS = ['r_+||', 'r_-||', 'r_c_liq', 'r_a_liq', 'c_d_liq']
+STRAY_PARAMS = ['l_str', 'r_str']
+ANODE_PARAMS = ['r_ct_li', 'c_dl_li']
+HALF_CELL_PARAMS = CATHODE_PARAMS + DX15_PARAMS
+FULL_CELL_PARAMS = STRAY_PARAMS + HALF_CELL_PARAMS + ANODE_PARAMS
+# Sub-circuits in series of the models ('half': HALF_CELL_PARAMS models, 'full': FULL_CELL_PARAMS) and the
+# parameters they depend on. The impedance of a sub-circuit whose parameters are all fixed is computed once per fit
+# (frozen, see reduce_circuit and subcircuit_impedance)
+SUBCIRCUITS = [
+    {'name': 'stray', 'circuits': ('full',), 'params': STRAY_PARAMS, 'label': 'stray L || R'},
+    {'name': 'cathode', 'circuits': ('half', 'full'), 'params': CATHODE_PARAMS, 'label': 'cathode DX30'},
+    {'name': 'dx15', 'circuits': ('half', 'full'), 'params': DX15_PARAMS, 'label': 'liquid electrolyte DX15'},
+    {'name': 'anode', 'circuits': ('full',), 'params': ANODE_PARAMS, 'label': 'anode Rct || Cdl'},
+]
+SUBCIRCUIT_PARAMS = {subcircuit['name']: subcircuit['params'] for subcircuit in SUBCIRCUITS}
+# fixed elements of the models: exponent of the Warburg CPE of the cathode, capacitance and resistance of the DX15
+# elements removed from the circuit, stray L and R of the half cell models
+CPE_B_P = 0.5
+PLACEHOLDER_C = 1e-20
+PLACEHOLDER_R = 1e20
+HALF_CELL_STRAY = 1e-20
+# largest relative change of the model, at every frequency, for an element to be removed from a fit (reduce_circuit)
+DEAD_RTOL = 1e-12
+# parameters allowed to be negative: stray resistance, activation energies and voltage slopes (models/laws.py)
+SIGNED_PARAMS = ['r_str']
+SIGNED_SUFFIXES = ('_ea', '_dv')
+
+
+# 'numpy': the functions below, 'numba': half_cell_batch and full_cell_batch run the fused kernels of
+# models/kernels.py (imported and compiled on first use). The kernels evaluate the whole circuit (no dead element nor
+# frozen sub-circuit, see reduce_circuit) and differ from the functions below in the last digits: opt in with
+# set_backend('numba'), or the PYPHYEIS_BACKEND environment variable, also read by worker processes
+BACKENDS = ['numpy', 'numba']
+BACKEND = 'numpy'
+
+
+def set_backend(backend):
+    """
+    Select the implementation of the models, 'numba' needs Numba
+    :return: previous backend
+    """
+    global BACKEND
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend {}, expected one of {}".format(backend, ', '.join(BACKENDS)))
+    if backend == 'numba' and importlib.util.find_spec('numba') is None:
+        raise ValueError("The numba backend needs Numba")
+    previous, BACKEND = BACKEND, backend
+    return previous
+
+
+if os.environ.get('PYPHYEIS_BACKEND'):
+    try:
+        set_backend(os.environ['PYPHYEIS_BACKEND'])
+    except ValueError as error:
+        print("PYPHYEIS_BACKEND ignored:", error)
+
+
+def is_signed(name):
+    return name in SIGNED_PARAMS or name.endswith(SIGNED_SUFFIXES)
+
+
+def besseli_ratio_asymptotic(x):
+    """
+    I0(x)/I1(x) from the large-argument (Hankel) expansion of I0 and I1.
+    The exponential factors cancel, so it never overflows. Valid for Re(x) >> 1.
+    :param x: complex array
+    :return: complex array
+    """
+    s0 = np.ones_like(x)
+    s1 = np.ones_like(x)
+    t0 = np.ones_like(x)
+    t1 = np.ones_like(x)
+    for k in range(1, BESSEL_ASYMPTOTIC_TERMS + 1):
+        t0 = -t0 * (0.0 - (2 * k - 1) ** 2) / (8.0 * k * x)
+        t1 = -t1 * (4.0 - (2 * k - 1) ** 2) / (8.0 * k * x)
+        s0 = s0 + t0
+        s1 = s1 + t1
+    return s0 / s1
+
+
+def besseli_ratio(x):
+    """
+    Vectorized I0(x)/I1(x) for complex x.
+    Exponentially scaled Bessel functions (scipy.special.ive) are used for Re(x) <= BESSEL_ASYMPTOTIC_RE,
+    the asymptotic series above it, so large |x| never overflows.
+    Relative error against mpmath is below 1e-14 for 1e-8 <= |x| <= 1e10, 0 <= arg(x) <= pi/4,
+    which covers every x = sqrt(R_d * 1j * w * Cd) reached by the models (arg(Cd*) <= 0).
+    :param x: complex array
+    :return: complex array
+    """
+    from scipy import special
+
+    x = np.asarray(x, dtype=np.complex128)
+    ret = np.empty_like(x)
+    is_large = np.real(x) > BESSEL_ASYMPTOTIC_RE
+    ret[is_large] = besseli_ratio_asymptotic(x[is_large])
+    x_small = x[~is_large]
+    ret[~is_large] = special.ive(0, x_small) / special.ive(1, x_small)
+    return ret
+
+
+def diffcylim_mpmath(w, R_d, Cd):
+    """ diffcylim R_d Cd, reference implementation with mpmath (slow, one point at a time) """
+    import mpmath
+    mpmath.mp.dps = 16
+
+    ret_sqrt = np.sqrt(R_d * np.multiply(1j*w, Cd))
+
+    ret_mp = [mpmath.besseli(0, x) / (x * mpmath.besseli(1, x)) for x in ret_sqrt.ravel()]
+
+    z_ret = R_d * np.array(ret_mp, dtype=np.complex128).reshape(ret_sqrt.shape)
+    return z_ret
+
+
+def diffcylim(w, R_d, Cd, reference=False):
+    """
+    diffcylim R_d Cd
+    :param w: angular frequencies
+    :param R_d: diffusion resistance
+    :param Cd: (complex) diffusion capacitance
+    :param reference: use the mpmath implementation, for validation only
+    :return: R_d * I0(x) / (x * I1(x)) with x = sqrt(R_d * 1j * w * Cd)
+    """
+    if reference:
+        return diffcylim_mpmath(w, R_d, Cd)
+
+    ret_sqrt = np.sqrt(R_d * np.multiply(1j*w, Cd))
+
+    z_ret = R_d * besseli_ratio(ret_sqrt) / ret_sqrt
+    return z_ret
+
+
+class ParameterLayout(object):
+    """
+    Parameter values of one model kept in a (1, n_params) array, in the column order of its *_batch model.
+    The free parameters (guess_names) have fixed positions, so the cost functions write a guess into the array
+    instead of copying and rebuilding the parameter dict at each evaluation.
+    The models read the array directly (parvals_to_array), parameter names are still accepted: layout['r_ct']
+    """
+
+    def __init__(self, par_names, params_dict, guess_names):
+        """
+        :param par_names: parameter order, HALF_CELL_PARAMS or FULL_CELL_PARAMS
+        :param params_dict: dict of parameter values, fixed parameters and initial values of the free ones
+        :param guess_names: names of the free parameters, in the order of the guess vector
+        """
+        self.par_names = par_names
+        self.index = {name: idx for idx, name in enumerate(par_names)}
+        self.values = np.array([[params_dict[name] for name in par_names]], dtype=np.float64)
+        self.row = self.values[0]
+        self.guess_names = list(guess_names)
+        self.free_index = np.array([self.index[name] for name in self.guess_names], dtype=np.intp)
+        # signed parameters (is_signed) may be negative, every other free parameter must stay positive
+        self.is_positive = np.array([not is_signed(name) for name in self.guess_names], dtype=bool)
+
+    def __getitem__(self, name):
+        return self.row[self.index[name]]
+
+    def is_valid(self, guess):
+        return not ((np.asarray(guess) <= 0) & self.is_positive).any()
+
+    def fill(self, guess, pars=None):
+        """
+        Write the free parameters
+        :param guess: values of the free parameters, relative to pars if pars is not None (Dr method)
+        :return: self
+        """
+        if pars is None:
+            self.row[self.free_index] = guess
+        else:
+            self.row[self.free_index] = np.multiply(guess, pars)
+        return self
+
+    def to_dict(self):
+        return dict(zip(self.par_names, self.row.tolist()))
+
+
+def parvals_to_array(parvals, par_names):
+    """
+    Parameter dict to a (1, n_params) array for the *_batch models
+    :param parvals: dict of parameter values, or ParameterLayout
+    :param par_names: parameter order, HALF_CELL_PARAMS or FULL_CELL_PARAMS
+    :return:
+    """
+    if isinstance(parvals, ParameterLayout) and parvals.par_names == par_names:
+        return parvals.values
+    return np.array([[parvals[name] for name in par_names]], dtype=np.float64)
+
+
+def batch_columns(pars, par_names):
+    """
+    Split a (P, n_params) array into (P, 1) columns, keyed by parameter name
+    :param pars: (P, n_params) array, or (n_params,) for a single parameter set
+    :param par_names: parameter order
+    :return: dict, name -> (P, 1) array
+    """
+    pars = np.atleast_2d(np.asarray(pars, dtype=np.float64))
+    return {name: pars[:, idx:idx + 1] for idx, name in enumerate(par_names)}
+
+
+def frequency_row(f):
+    """
+    Frequencies as a (1, n_freqs) row, broadcast against the (P, 1) parameter columns of the *_batch models.
+    A (P, 1) column is kept as is: parameter set i is evaluated at frequency i only (per-point parameters)
+    """
+    f = np.asarray(f)
+    if f.ndim == 2:
+        return f
+    return f[np.newaxis, :]
+
+
+class FrequencyContext(object):
+    """
+    Terms of the models depending only on the frequencies: built once per dataset (engine.Fitter,
+    global_fit.GlobalFit) and given to the models, *_batch models and derivatives in place of the frequencies,
+    so that an evaluation in the cost loop computes only the terms depending on the parameters.
+    The arrays are frequency_row(f) shaped.
+    """
+
+    def __init__(self, f):
+        """
+        :param f: frequencies, or a (P, 1) column (see frequency_row)
+        """
+        self.f = np.asarray(f, dtype=np.float64)
+        self.size = self.f.size
+        self.omegas = 2 * np.pi * frequency_row(self.f)
+        self.jw = 1j * self.omegas
+        # (jw)^(P-1) of the Warburg CPE, Z_B = 1 / (jw * Q_W * cpe_b)
+        self.cpe_b = self.jw ** (CPE_B_P - 1)
+        # jw R of the PLACEHOLDER_R resistor (DX15)
+        self.jw_placeholder_r = self.jw * PLACEHOLDER_R
+        self.z_stray = stray_impedance(self, HALF_CELL_STRAY, HALF_CELL_STRAY)
+        self.hn_terms = {}
+        self.subcircuits = {}
+        self.column_context = None
+
+    def __len__(self):
+        return self.size
+
+    def hn_term(self, C, T, P, U):
+        """
+        Havriliak-Negami term C / (1 + (jw T)^U)^P of fixed parameters, e.g. the placeholder of Cdl*
+        """
+        key = (C, T, P, U)
+        if key not in self.hn_terms:
+            self.hn_terms[key] = C / ((1 + (self.jw * T) ** U) ** P)
+        return self.hn_terms[key]
+
+    def subcircuit(self, name, key, compute):
+        """
+        Impedance of a frozen sub-circuit at these frequencies: compute() once, again only if key (parameter values)
+        changed since the last call
+        """
+        entry = self.subcircuits.get(name)
+        if entry is None or entry[0] != key:
+            entry = (key, compute())
+            self.subcircuits[name] = entry
+        return entry[1]
+
+    def column(self):
+        """
+        Context of the frequencies as a (n, 1) column, one frequency per parameter set (see laws.LawModel)
+        """
+        if self.f.ndim == 2 and self.f.shape[1] == 1:
+            return self
+        if self.column_context is None:
+            self.column_context = FrequencyContext(self.f.reshape(-1, 1))
+        return self.column_context
+
+
+def frequency_context(f, column=False):
+    """
+    :param f: frequencies, or a FrequencyContext, returned as is
+    :param column: context of the frequencies as a (n, 1) column (see FrequencyContext.column)
+    :return: FrequencyContext
+    """
+    if isinstance(f, FrequencyContext):
+        return f.column() if column else f
+    f = np.asarray(f, dtype=np.float64)
+    return FrequencyContext(f.reshape(-1, 1) if column else f)
+
+
+def diffusion_impedance(ctx, R_d, Cstar_d, dim):
+    """
+    Finite-length diffusion Zd with complex capacitance Cd*
+    :param ctx: FrequencyContext
+    :param dim: 1: planar (coth), 2: cylindrical (Bessel), 3: spherical (tanh)
+    :return:
+    """
+    jw_cd = ctx.jw * Cstar_d
+    if dim == 1:
+        Zd_numerator = np.sqrt(R_d / jw_cd)
+        Zd_denominator = np.tanh(np.sqrt(R_d * jw_cd))
+
+        Zd = np.divide(Zd_numerator, Zd_denominator)
+    elif dim == 2:
+        Zd = diffcylim(ctx.omegas, R_d, Cstar_d)
+    else:
+        tanh_sqrt = np.sqrt(R_d * jw_cd)
+        tanh_values = (1+0j)*np.ones(tanh_sqrt.shape, dtype=np.complex128)
+        tanh_values[np.real(tanh_sqrt) < 100] = np.tanh(tanh_sqrt[np.real(tanh_sqrt) < 100])
+
+        Zd = tanh_values / (
+               np.sqrt(jw_cd / R_d) - (1 / R_d) * tanh_values)
+    return Zd
+
+
+def cathode_impedance(ctx, R_m, R_ct, R_d, R_i, C_dl, C_d, C_i, Q_W, dim,
+                      Cdl_HNC=1e-20, Cdl_HNT=1e-20, Cdl_HNP=1e-20, Cdl_HNU=1e-20, dead=()):
+    """
+    Cathode: DX30 modified with corrected Cd, Ci
+    Cdl is ideal C (HN placeholder), Ci is CHN with tau_i = R_i * C_i
+    :param ctx: FrequencyContext
+    :param dim: diffusion geometry, factor dim in Cd*, see diffusion_impedance
+    :param dead: names of the elements removed (see DEAD_ELEMENTS): 'c_dl', 'cdl_hn', 'q_w_open', 'q_w_short'
+    :return:
+    """
+    Cdl_C0 = C_dl
+
+    Cd_C0 = C_d
+    Cd_HNC = C_i
+    Cd_HNT = R_i*C_i
+
+    # Cd_HNP = Cd_HNU = 1
+    Cstar_d = Cd_C0 + (dim*(Cd_HNC + Cd_C0) - Cd_C0) / (1 + ctx.jw * Cd_HNT)
+    if 'cdl_hn' in dead:
+        Cstar_dl = Cdl_C0
+    else:
+        Cstar_dl = Cdl_C0 + ctx.hn_term(Cdl_HNC, Cdl_HNT, Cdl_HNP, Cdl_HNU)
+
+    Zd = diffusion_impedance(ctx, R_d, Cstar_d, dim)
+
+    Zs = R_m
+    if 'c_dl' in dead:
+        Y_P = 1.0 / (R_ct + Zd)
+    else:
+        Y_P = (ctx.jw * Cstar_dl) + 1.0 / (R_ct + Zd)
+
+    # Z_B infinite (open) or 0 (short): transmission line ended by an open or a short circuit
+    if 'q_w_open' in dead:
+        return np.sqrt(Zs / Y_P) / np.tanh(np.sqrt(Zs * Y_P))
+    if 'q_w_short' in dead:
+        return np.sqrt(Zs / Y_P) * np.tanh(np.sqrt(Zs * Y_P))
+    Z_B = 1.0 / (ctx.jw * (Q_W * ctx.cpe_b))
+
+    Z_cathode = (1 + Z_B * np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P)))) / (
+            Z_B * Y_P / Zs + np.sqrt(Y_P / Zs) * (1.0 / np.tanh(np.sqrt(Zs * Y_P))))
+    return Z_cathode
+
+
+def dx15_impedance(ctx, DX15_R1, DX15_R2, DX15_C3, DX15_RA, DX15_RB, dead=()):
+    """
+    Separator with liquid electrolyte: DX15 with 2 rails, ideal C
+    C1, C2, CA, CB are PLACEHOLDER_C and R3 is PLACEHOLDER_R, jw R3 is taken from ctx
+    :param ctx: FrequencyContext
+    :param DX15_R1: R_c_liq
+    :param DX15_R2: R_a_liq
+    :param DX15_C3: C_d_liq
+    :param DX15_RA: R_+||
+    :param DX15_RB: R_-||
+    :param dead: names of the placeholders removed (see DEAD_ELEMENTS): 'dx15_c', 'dx15_r3'
+    :return:
+    """
+    if 'dx15_c' in dead:
+        DX15_Z1, DX15_Z2, DX15_ZA, DX15_ZB = DX15_R1, DX15_R2, DX15_RA, DX15_RB
+    else:
+        DX15_Z1 = np.divide(DX15_R1, 1 + ctx.jw*DX15_R1*PLACEHOLDER_C)
+        DX15_Z2 = np.divide(DX15_R2, 1 + ctx.jw*DX15_R2*PLACEHOLDER_C)
+        DX15_ZA = np.divide(DX15_RA, 1 + ctx.jw*DX15_RA*PLACEHOLDER_C)
+        DX15_ZB = np.divide(DX15_RB, 1 + ctx.jw*DX15_RB*PLACEHOLDER_C)
+    if 'dx15_r3' in dead:
+        DX15_Z3 = 1.0 / (ctx.jw * DX15_C3)
+    else:
+        DX15_Z3 = np.divide(PLACEHOLDER_R, 1 + ctx.jw_placeholder_r*DX15_C3)
+
+    Z_DX15_p1 = np.divide(np.multiply(DX15_Z1, DX15_Z2), DX15_Z1 + DX15_Z2)
+    Z_DX15_p2 = np.divide(2.0, DX15_Z1 + DX15_Z2)
+    DX15_k = np.sqrt(np.divide(DX15_Z1 + DX15_Z2, DX15_Z3))
+    Z_DX15_p3 = DX15_k*DX15_ZA*DX15_ZB*(DX15_Z1 + DX15_Z2) + ((DX15_Z2**2) *DX15_ZA + (DX15_Z1**2) * DX15_ZB)*np.tanh(DX15_k/2)
+    Z_DX15_p4 = DX15_k*(DX15_ZA + DX15_ZB) + (DX15_Z1 + DX15_Z2)*np.tanh(DX15_k/2)
+
+    Z_DX15 = Z_DX15_p1 + np.divide(Z_DX15_p2 * Z_DX15_p3, Z_DX15_p4)
+    return Z_DX15
+
+
+def stray_impedance(ctx, L_str, R_str):
+    """
+    Stray effect: Simple LR in parallel
+    :param ctx: FrequencyContext
+    """
+    return 1.0 / ((1.0 / (ctx.jw * L_str)) + 1.0 / R_str)
+
+
+def anode_impedance(ctx, R_ct_Li, C_dl_Li, dead=()):
+    """
+    Anode: Simple RC in parallel
+    :param ctx: FrequencyContext
+    :param dead: 'anode_c' in dead: C_dl_Li removed (open)
+    """
+    if 'anode_c' in dead:
+        return R_ct_Li
+    return 1.0 / ((1.0 / R_ct_Li) + (ctx.jw * C_dl_Li))
+
+
+def subcircuit_impedance(ctx, name, p, frozen, key, compute):
+    """
+    Impedance of the sub-circuit name (see SUBCIRCUITS): compute(p), or, if name is frozen, its value for these
+    parameters and frequencies, computed once (FrequencyContext.subcircuit).
+    The parameters of a frozen sub-circuit are fixed, the same for every parameter set: it is computed for the first
+    one and broadcast against the others
+    :param p: parameter columns, see batch_columns
+    :param frozen: names of the frozen sub-circuits
+    :param key: what else the impedance depends on (model, dead elements)
+    :param compute: function of the parameter columns
+    """
+    if name not in frozen:
+        return compute(p)
+    first = {par: p[par][:1] for par in SUBCIRCUIT_PARAMS[name]}
+    values = tuple(float(first[par][0, 0]) for par in SUBCIRCUIT_PARAMS[name])
+    return ctx.subcircuit(name, (key, values), lambda: compute(first))
+
+
+def half_cell_batch(pars, ctx, dim, dead=(), frozen=()):
+    """
+    Cathode + liquid electrolyte, without stray
+    :param pars: (P, len(HALF_CELL_PARAMS)) array
+    :param ctx: FrequencyContext of the frequencies, or of a (P, 1) column to pair each parameter set with one
+                frequency
+    :param dim: diffusion geometry, 1, 2 or 3
+    :param dead: names of the elements removed from the circuit (see reduce_circuit), ignored by the numba
+                 kernels
+    :param frozen: names of the sub-circuits of fixed parameters, computed once (see subcircuit_impedance),
+                   ignored by the numba kernels
+    :return: (P, n_freqs) complex array, (P, 1) for a column of frequencies
+    """
+    if BACKEND == 'numba':
+        from models import kernels
+
+        return kernels.half_cell(pars, ctx.omegas, dim)
+
+    p = batch_columns(pars, HALF_CELL_PARAMS)
+
+    Z_cathode = subcircuit_impedance(
+        ctx, 'cathode', p, frozen, ('half', dim, dead),
+        lambda q: cathode_impedance(ctx, q['r_m'], q['r_ct'], q['r_d'], q['r_i'], q['c_dl'], q['c_d'], q['c_i'],
+                                    q['q_w'], dim, dead=dead))
+    if 'dx15' in dead:
+        return Z_cathode
+    Z_DX15 = subcircuit_impedance(
+        ctx, 'dx15', p, frozen, dead,
+        lambda q: dx15_impedance(ctx, q['r_c_liq'], q['r_a_liq'], q['c_d_liq'], q['r_+||'], q['r_-||'], dead))
+
+    Z = Z_cathode + Z_DX15
+    return Z
+
+
+def Barsoukov_Pham_Lee_1(parvals, f):
+    """
+    Barsoukov-Pham-Lee #1D
+    Cathode: DX30 modified with corrected Cd, Ci
+    Liquid electrolyte instead of R_ohm, use DX15
+    """
+    return half_cell_batch(parvals_to_array(parvals, HALF_CELL_PARAMS), frequency_context(f), 1)[0]
+
+
+def Barsoukov_Pham_Lee_2(parvals, f):
+    """
+    Barsoukov-Pham-Lee #2D
+    """
+    return half_cell_batch(parvals_to_array(parvals, HALF_CELL_PARAMS), frequency_context(f), 2)[0]
+
+
+def Barsoukov_Pham_Lee_3(parvals, f):
+    """
+    Barsoukov-Pham-Lee #3D
+    """
+    return half_cell_batch(parvals_to_array(parvals, HALF_CELL_PARAMS), frequency_context(f), 3)[0]
+
+
+def Barsoukov_Pham_Lee_batch(pars, f, T=None, Voltage=None, c_case=5, dead=(), frozen=()):
+    """
+    Barsoukov-Pham-Lee 1D (c_case=5), 2D (c_case=6), 3D (c_case=7) for many parameter sets at once
+    :param pars: (P, len(HALF_CELL_PARAMS)) array, columns ordered as HALF_CELL_PARAMS
+    :param f: frequencies, or a (P, 1) column (see half_cell_batch), or their FrequencyContext
+    :param dead: names of the elements removed from the circuit (see reduce_circuit)
+    :param frozen: names of the sub-circuits computed once (see half_cell_batch)
+    :return: (P, n_freqs) complex array
+    """
+    if c_case not in (5, 6, 7):
+        print('Undefined')
+        return None
+
+    ctx = frequency_context(f)
+    fit_zrzi = half_cell_batch(pars, ctx, c_case - 4, dead, frozen)
+
+    # stray L and R fixed at HALF_CELL_STRAY
+    if 'stray' not in dead:
+        fit_zrzi = ctx.z_stray + fit_zrzi
+
+    return fit_zrzi
+
+
+def Barsoukov_Pham_Lee(parvals, f, T=None, Voltage=None, c_case=5, dead=(), frozen=()):
+    fit_zrzi = Barsoukov_Pham_Lee_batch(parvals_to_array(parvals, HALF_CELL_PARAMS), f, T, Voltage, c_case, dead,
+                                        frozen)
+    return fit_zrzi[0]
+
+
+def full_cell_batch(pars, f, dim, dead=(), frozen=()):
+    """
+    Stray LR + cathode + liquid electrolyte + anode RC
+    :param pars: (P, len(FULL_CELL_PARAMS)) array, columns ordered as FULL_CELL_PARAMS
+    :param f: frequencies, or a (P, 1) column (see half_cell_batch), or their FrequencyContext
+    :param dim: diffusion geometry, 1, 2 or 3
+    :param dead: names of the elements removed from the circuit (see reduce_circuit), ignored by the numba
+                 kernels
+    :param frozen: names of the sub-circuits of fixed parameters, computed once (see subcircuit_impedance),
+                   ignored by the numba kernels
+    :return: (P, n_freqs) complex array
+    """
+    ctx = frequency_context(f)
+    if BACKEND == 'numba':
+        from models import kernels
+
+        return kernels.full_cell(pars, ctx.omegas, dim)
+
+    p = batch_columns(pars, FULL_CELL_PARAMS)
+
+    #Cathode: DX30 with corrected Cd* equation, Cdl is ideal C while Ci is CHN
+    Z_cathode = subcircuit_impedance(
+        ctx, 'cathode', p, frozen, ('full', dim, dead),
+        lambda q: cathode_impedance(ctx, q['r_m'], q['r_ct'], q['r_d'], q['r_i'], q['c_dl'], q['c_d'], q['c_i'],
+                                    q['q_w'], dim, Cdl_HNC=1e-20, Cdl_HNT=1e-20, Cdl_HNP=1.0, Cdl_HNU=1.0,
+                                    dead=dead))
+
+    #Total impedance, without the elements removed
+    if 'stray' in dead:
+        Z_ret = Z_cathode
+    else:
+        Z_ret = subcircuit_impedance(ctx, 'stray', p, frozen, (),
+                                     lambda q: stray_impedance(ctx, q['l_str'], q['r_str'])) + Z_cathode
+    if 'dx15' not in dead:
+        Z_ret = Z_ret + subcircuit_impedance(
+            ctx, 'dx15', p, frozen, dead,
+            lambda q: dx15_impedance(ctx, q['r_c_liq'], q['r_a_liq'], q['c_d_liq'], q['r_+||'], q['r_-||'], dead))
+    if 'anode' not in dead:
+        Z_ret = Z_ret + subcircuit_impedance(ctx, 'anode', p, frozen, dead,
+                                             lambda q: anode_impedance(ctx, q['r_ct_li'], q['c_dl_li'], dead))
+
+    return Z_ret
+
+
+def Barsoukov_Pham_Lee_1D_Full_cell_batch(pars, f, T=None, Voltage=None, dead=(), frozen=()):
+    return full_cell_batch(pars, f, 1, dead, frozen)
+
+
+def Barsoukov_Pham_Lee_2D_Full_cell_batch(pars, f, T=None, Voltage=None, dead=(), frozen=()):
+    return full_cell_batch(pars, f, 2, dead, frozen)
+
+
+def Barsoukov_Pham_Lee_3D_Full_cell_batch(pars, f, T=None, Voltage=None, dead=(), frozen=()):
+    return full_cell_batch(pars, f, 3, dead, frozen)
+
+
+def Barsoukov_Pham_Lee_1D_Full_cell(parvals, f, T=None, Voltage=None, dead=(), frozen=()):
+    return full_cell_batch(parvals_to_array(parvals, FULL_CELL_PARAMS), f, 1, dead, frozen)[0]
+
+
+def Barsoukov_Pham_Lee_2D_Full_cell(parvals, f, T=None, Voltage=None, dead=(), frozen=()):
+    return full_cell_batch(parvals_to_array(parvals, FULL_CELL_PARAMS), f, 2, dead, frozen)[0]
+
+
+def Barsoukov_Pham_Lee_3D_Full_cell(parvals, f, T=None, Voltage=None, dead=(), frozen=()):
+    return full_cell_batch(parvals_to_array(parvals, FULL_CELL_PARAMS), f, 3, dead, frozen)[0]
+
+
+# Models selectable in the GUI and the command line (PyPhyEIS_cli.py):
+# model function, batched model (see *_batch) and its parameter order
+MODELS = {
+    "Barsoukov-Pham-Lee_1D": {'func': partial(Barsoukov_Pham_Lee, c_case=5),
+                              'batch': partial(Barsoukov_Pham_Lee_batch, c_case=5), 'params': HALF_CELL_PARAMS},
+    "Barsoukov-Pham-Lee_2D": {'func': partial(Barsoukov_Pham_Lee, c_case=6),
+                              'batch': partial(Barsoukov_Pham_Lee_batch, c_case=6), 'params': HALF_CELL_PARAMS},
+    "Barsoukov-Pham-Lee_3D": {'func': partial(Barsoukov_Pham_Lee, c_case=7),
+                              'batch': partial(Barsoukov_Pham_Lee_batch, c_case=7), 'params': HALF_CELL_PARAMS},
+    "Barsoukov-Pham-Lee_1D_Full cell": {'func': Barsoukov_Pham_Lee_1D_Full_cell,
+                                        'batch': Barsoukov_Pham_Lee_1D_Full_cell_batch, 'params': FULL_CELL_PARAMS},
+    "Barsoukov-Pham-Lee_2D_Full cell": {'func': Barsoukov_Pham_Lee_2D_Full_cell,
+                                        'batch': Barsoukov_Pham_Lee_2D_Full_cell_batch, 'params': FULL_CELL_PARAMS},
+    "Barsoukov-Pham-Lee_3D_Full cell": {'func': Barsoukov_Pham_Lee_3D_Full_cell,
+                                        'batch': Barsoukov_Pham_Lee_3D_Full_cell_batch, 'params': FULL_CELL_PARAMS},
+}
+
+# Elements a fit may remove from the circuit (see reduce_circuit), tried in this order:
+# name (the dead argument of the models), circuits ('half': HALF_CELL_PARAMS models, 'full': FULL_CELL_PARAMS),
+# parameters that must all be fixed (none for the placeholders of the models), elements whose removal makes it
+# moot, open or short circuit, description
+DEAD_ELEMENTS = [
+    {'name': 'stray', 'circuits': ('half',), 'params': (), 'unless': (), 'state': 'short',
+     'label': 'stray L || R placeholder'},
+    {'name': 'stray', 'circuits': ('full',), 'params': STRAY_PARAMS, 'unless': (), 'state': 'short',
+     'label': 'stray L || R'},
+    {'name': 'c_dl', 'circuits': ('half', 'full'), 'params': ('c_dl',), 'unless': (), 'state': 'open',
+     'label': 'Cdl'},
+    {'name': 'cdl_hn', 'circuits': ('half', 'full'), 'params': (), 'unless': ('c_dl',), 'state': 'open',
+     'label': 'Havriliak-Negami placeholder of Cdl'},
+    {'name': 'q_w_open', 'circuits': ('half', 'full'), 'params': ('q_w',), 'unless': (), 'state': 'open',
+     'label': 'Warburg CPE Qw'},
+    {'name': 'q_w_short', 'circuits': ('half', 'full'), 'params': ('q_w',), 'unless': ('q_w_open',),
+     'state': 'short', 'label': 'Warburg CPE Qw'},
+    {'name': 'dx15', 'circuits': ('half', 'full'), 'params': DX15_PARAMS, 'unless': (), 'state': 'short',
+     'label': 'liquid electrolyte DX15'},
+    {'name': 'dx15_c', 'circuits': ('half', 'full'), 'params': (), 'unless': ('dx15',), 'state': 'open',
+     'label': 'DX15 placeholders C1, C2, CA, CB'},
+    {'name': 'dx15_r3', 'circuits': ('half', 'full'), 'params': (), 'unless': ('dx15',), 'state': 'open',
+     'label': 'DX15 placeholder R3'},
+    {'name': 'anode', 'circuits': ('full',), 'params': ANODE_PARAMS, 'unless': (), 'state': 'short',
+     'label': 'anode Rct || Cdl'},
+    {'name': 'anode_c', 'circuits': ('full',), 'params': ('c_dl_li',), 'unless': ('anode',), 'state': 'open',
+     'label': 'anode Cdl'},
+]
+
+
+def circuit_kind(model):
+    return 'full' if MODELS[model]['params'] is FULL_CELL_PARAMS else 'half'
+
+
+class ReducedCircuit(object):
+    """
+    Model of MODELS without its dead elements, and with the impedance of its frozen sub-circuits computed once:
+    func and batch have the signatures of the model functions
+    """
+
+    def __init__(self, model, dead=(), frozen=()):
+        """
+        :param model: model name, key of MODELS
+        :param dead: names of the elements removed, see DEAD_ELEMENTS
+        :param frozen: names of the sub-circuits of fixed parameters, see SUBCIRCUITS
+        """
+        mdl = MODELS[model]
+        self.model = model
+        self.dead = tuple(dead)
+        self.frozen = tuple(frozen)
+        self.func = self.bind(mdl['func'], True)
+        self.batch = self.bind(mdl['batch'], True)
+
+    def bind(self, func, with_dead):
+        kwargs = {}
+        if with_dead and self.dead:
+            kwargs['dead'] = self.dead
+        if self.frozen:
+            kwargs['frozen'] = self.frozen
+        return partial(func, **kwargs) if kwargs else func
+
+    def jacobian(self, jac_func):
+        """
+        :param jac_func: derivative of the model, see jacobian.MODEL_JACOBIANS
+        :return: jac_func skipping the frozen sub-circuits
+        """
+        return self.bind(jac_func, False)
+
+    def frozen_labels(self):
+        kind = circuit_kind(self.model)
+        return [subcircuit['label'] for subcircuit in SUBCIRCUITS
+                if subcircuit['name'] in self.frozen and kind in subcircuit['circuits']]
+
+    def elements(self):
+        """
+        :return: descriptions of the elements removed, with the open or short circuit replacing them
+        """
+        kind = circuit_kind(self.model)
+        return ['{} ({})'.format(element['label'], element['state']) for element in DEAD_ELEMENTS
+                if element['name'] in self.dead and kind in element['circuits']]
+
+    def deviation(self, params, f):
+        """
+        Largest relative change of the model made by removing the dead elements, at params (see model_change)
+        :param params: dict of parameter values, e.g. the fitted ones
+        :param f: frequencies, or their FrequencyContext
+        """
+        if not self.dead:
+            return 0.0
+        mdl = MODELS[self.model]
+        ctx = frequency_context(f)
+        pars = parvals_to_array(params, mdl['params'])
+        with np.errstate(all='ignore'):
+            return model_change(mdl['batch'](pars, ctx)[0], mdl['batch'](pars, ctx, dead=self.dead)[0])
+
+    def describe(self):
+        if not self.dead:
+            text = "Circuit: {}, no element removed".format(self.model)
+        else:
+            text = "Reduced circuit: {} without {}".format(self.model, ', '.join(self.elements()))
+        if self.frozen:
+            text += "; fixed, computed once: {}".format(', '.join(self.frozen_labels()))
+        return text
+
+
+def model_change(z_full, z_reduced):
+    """
+    Largest relative change from z_full to z_reduced, over the points where z_full is finite; inf if z_reduced
+    overflows at one of them
+    """
+    compared = np.isfinite(z_full)
+    if not np.all(np.isfinite(z_reduced[compared])):
+        return np.inf
+    if not np.any(compared):
+        return 0.0
+    return float(np.max(np.abs(z_reduced[compared] - z_full[compared]) / np.abs(z_full[compared])))
+
+
+def reduce_circuit(model, params, free, f, rtol=DEAD_RTOL):
+    """
+    Elements of the model that are open or short circuits for a fit: placeholders of the models, and elements
+    whose parameters are fixed at values removing them (1e-20 or 1e20).
+    An element is removed if the model without it, and without the elements removed before it (DEAD_ELEMENTS
+    order), stays within rtol of the full model at every frequency, at the initial parameter values (see
+    model_change). It must also stay finite where the full model is; points where the full model overflows are not
+    compared. The fitted values are checked again after the fit (ReducedCircuit.deviation).
+    The sub-circuits left whose parameters are all fixed are frozen: their impedance is computed once per fit
+    (see subcircuit_impedance), unless no parameter of the circuit is free.
+    The numba kernels evaluate the full circuit, nothing is removed or frozen with that backend.
+    :param model: model name, key of MODELS
+    :param params: dict of parameter values, or ParameterLayout
+    :param free: names of the free parameters
+    :param f: frequencies of the fit, or their FrequencyContext
+    :param rtol: largest relative change of the model
+    :return: ReducedCircuit
+    """
+    if BACKEND == 'numba':
+        return ReducedCircuit(model)
+    mdl = MODELS[model]
+    kind = circuit_kind(model)
+    ctx = frequency_context(f)
+    pars = parvals_to_array(params, mdl['params'])
+    with np.errstate(all='ignore'):
+        z_full = mdl['batch'](pars, ctx)[0]
+        dead = []
+        for element in DEAD_ELEMENTS:
+            if kind not in element['circuits'] or any(name in free for name in element['params']) or \
+                    any(name in dead for name in element['unless']):
+                continue
+            z_reduced = mdl['batch'](pars, ctx, dead=tuple(dead + [element['name']]))[0]
+            if model_change(z_full, z_reduced) <= rtol:
+                dead.append(element['name'])
+
+    frozen = []
+    if any(name in free for name in mdl['params']):
+        frozen = [subcircuit['name'] for subcircuit in SUBCIRCUITS
+                  if kind in subcircuit['circuits'] and subcircuit['name'] not in dead and
+                  not any(name in free for name in subcircuit['params'])]
+    return ReducedCircuit(model, dead, frozen)
+
+
+def get_cost_vector(zcalc, zdata, weighting):
+    """
+    Get cost vector
+    :param y_pred:
+    :param ydata:
+    :param weighting:
+        2: data-proportional
+        3: calc-proportional
+        4: data-modulus
+        5: calc-modulus
+        otherwise: unit weighting
+    :return:
+    """
+
+    # if np.count_nonzero(np.logical_or(np.isinf(zcalc), np.isnan(zcalc))):
+    #     return 1e16 * np.ones(len(zcalc) * 2)
+
+    error = zdata - zcalc
+    if weighting == 2:
+        # data-proportional
+        error.real = np.real(error) / np.real(zdata)
+        error.imag = np.imag(error) / np.imag(zdata)
+    elif weighting == 3:
+        # calc-proportional
+        error.real = np.real(error) / np.real(zcalc)
+        error.imag = np.imag(error) / np.imag(zcalc)
+    elif weighting == 4:
+        # data-modulus
+        error = error / np.abs(zdata)
+    elif weighting == 5:
+        # calc-modulus
+        error = error / np.abs(zcalc)
+
+    # real, imag interleaved: the float64 view of the complex array
+    # zcalc may be (P, n_freqs) for batched evaluation, one cost vector per row
+    e1d = np.ascontiguousarray(error, dtype=np.complex128).view(np.float64)
+    if not np.isfinite(e1d).all():
+        print("Residual NaN, INF")
+    return e1d
+
+
+def cost_vector(guess, Z, F, weighting, calc_func=None, T=None, Voltage=None, pars=None, guess_names=None,
+                params_dict=None):
+    """
+    Type of weighting
+    2: data-proportional
+    3: calc-proportional
+    4: data-modulus
+    5: calc-modulus
+    otherwise: unit weighting
+    :param params_dict: dict of parameter values, or ParameterLayout (faster, no dict rebuilt per call)
+    """
+    if isinstance(params_dict, ParameterLayout):
+        if not params_dict.is_valid(guess):
+            return 1.0e16 * np.ones(len(Z) * 2)
+        params_dict_local = params_dict.fill(guess, pars)
+    else:
+        for i in range(len(guess)):
+            if guess[i] <= 0 and not is_signed(guess_names[i]):
+                return 1.0e16 * np.ones(len(Z) * 2)
+
+        # parameter values are floats, a shallow copy is enough
+        params_dict_local = dict(params_dict)
+        for idx, gs_name in enumerate(guess_names):
+            if pars is None:
+                params_dict_local[gs_name] = guess[idx]
+            else:
+                params_dict_local[gs_name] = guess[idx] * pars[idx]
+
+    calc = calc_func(params_dict_local, F, T, Voltage)
+
+    if not np.isfinite(calc).all():
+        return 1e16 * np.ones(len(Z) * 2)
+
+    e1d = get_cost_vector(calc, Z, weighting)
+
+    return e1d
+
+
+def cost_scalar(guess, Z, F, weighting, calc_func=None, T=None, Voltage=None, pars=None, guess_names=None,
+                params_dict=None):
+    """
+    """
+    e1d = cost_vector(guess, Z, F, weighting, calc_func, T, Voltage, pars, guess_names, params_dict)
+    return np.sum(np.array(e1d) ** 2)
+    
+
+def from_log10(log_guess, linear=None):
+    """
+    Parameter values of a guess in log10 space
+    :param log_guess: (n_free,) array, or (n_free, S) for S guesses
+    :param linear: boolean mask of the free parameters given as values, not log10 (signed parameters), None if none
+    """
+    if linear is None:
+        return np.power(10.0, log_guess)
+    values = np.array(log_guess, dtype=np.float64)
+    is_log = ~np.asarray(linear, dtype=bool)
+    values[is_log] = np.power(10.0, values[is_log])
+    return values
+
+
+def cost_scalar_log10(log_guess, Z, F, weighting, calc_func=None, T=None, Voltage=None, pars=None, guess_names=None,
+                      params_dict=None, linear=None):
+    """
+    cost_scalar with the free parameters given as log10 values, except the linear ones (see from_log10)
+    """
+    return cost_scalar(from_log10(log_guess, linear), Z, F, weighting, calc_func, T, Voltage, pars, guess_names,
+                       params_dict)
+
+
+def cost_scalar_batch(guesses, Z, F, weighting, batch_func=None, T=None, Voltage=None, pars=None, guess_names=None,
+                      params_dict=None, par_names=None):
+    """
+    cost_scalar for many guesses at once, with a single call of a batched model
+    :param guesses: (n_free, S) array, one guess per column (scipy vectorized layout)
+    :param batch_func: batched model, e.g. Barsoukov_Pham_Lee_batch
+    :param par_names: column order of batch_func, HALF_CELL_PARAMS or FULL_CELL_PARAMS
+    :return: (S,) array
+    """
+    guesses = np.asarray(guesses, dtype=np.float64).reshape(len(guess_names), -1)
+    n_sets = guesses.shape[1]
+
+    pars_all = np.repeat(parvals_to_array(params_dict, par_names), n_sets, axis=0)
+    is_invalid = np.zeros(n_sets, dtype=bool)
+    for idx, gs_name in enumerate(guess_names):
+        if not is_signed(gs_name):
+            is_invalid |= guesses[idx] <= 0
+        if pars is None:
+            pars_all[:, par_names.index(gs_name)] = guesses[idx]
+        else:
+            pars_all[:, par_names.index(gs_name)] = guesses[idx] * pars[idx]
+
+    calc = batch_func(pars_all, F, T, Voltage)
+    is_invalid |= np.any(np.logical_or(np.isinf(calc), np.isnan(calc)), axis=1)
+    calc[is_invalid] = Z
+
+    e1d = get_cost_vector(calc, Z, weighting)
+    ret = np.sum(e1d ** 2, axis=1)
+    # same value as cost_scalar of the 1e16 vector returned by cost_vector
+    ret[is_invalid] = 1.0e32 * (len(Z) * 2)
+    return ret
+
+
+def cost_scalar_log10_batch(log_guesses, Z, F, weighting, batch_func=None, T=None, Voltage=None, pars=None,
+                            guess_names=None, params_dict=None, par_names=None, linear=None):
+    """
+    cost_scalar_batch with the free parameters given as log10 values, except the linear ones (see from_log10)
+    """
+    return cost_scalar_batch(from_log10(log_guesses, linear), Z, F, weighting, batch_func, T, Voltage, pars,
+                             guess_names, params_dict, par_names)
@@ -0,0 +1,230 @@
+"""
+Plot export: all panels of a fit in one HTML page
+
+plotly.js is written once next to the page (plotly-<version>.min.js) and shared by every export, the page only
+holds the figure data of each panel as JSON, drawn by plotly.js when the panel is scrolled into view. A panel is
+serialized again only when its data changed (data_key), so a new page after an identical fit or a simulation
+reuses the JSON of the previous one.
+
+Large series (more than LARGE_PLOT_POINTS points) are drawn with WebGL traces decimated by largest triangle three
+buckets (lttb), in the plotted coordinates (log scale for frequencies). The full resolution figure is kept in the
+page, unparsed, and drawn by the 'Full resolution' button of the panel.
+
+    export = plots.PlotExport()
+    export.begin()
+    key = export.data_key(f_data, z_data, zf)
+    if not export.is_current(['Impedance'], key):
+        export.set_panel('Impedance', key, go.Figure(...))
+    path = export.write(['Impedance'])
+"""
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+PLOT_CONFIG = {'scrollZoom': True, 'editable': False, 'edits': {'legendPosition': True}}
+PANEL_SIZE = 500
+# points of a page above which the series are decimated, points kept per spectrum at least
+LARGE_PLOT_POINTS = 20000
+MIN_SPECTRUM_POINTS = 20
+
+PAGE_TEMPLATE = """<html><head><meta charset="utf-8">
+<script src="{plotly_js}"></script>
+<style>.panel {{display: inline-block; width: {size}px; height: {size}px;}}</style>
+</head><body>
+{panels}
+<script>
+var config = {config};
+function draw(div) {{
+    if (div.dataset.drawn) return;
+    div.dataset.drawn = 1;
+    var figure = JSON.parse(document.getElementById(div.id + '_data').textContent);
+    var full = document.getElementById(div.id + '_full');
+    var panel_config = config;
+    if (full) {{
+        panel_config = Object.assign({{}}, config, {{modeBarButtonsToAdd: [{{
+            name: 'Full resolution', icon: Plotly.Icons.autoscale, click: function (gd) {{
+                var full_figure = JSON.parse(full.textContent);
+                Plotly.react(gd, full_figure.data, gd.layout, config);
+            }}}}]}});
+    }}
+    Plotly.newPlot(div, figure.data, figure.layout, panel_config);
+}}
+var panels = document.getElementsByClassName('panel');
+if ('IntersectionObserver' in window) {{
+    var observer = new IntersectionObserver(function (entries) {{
+        entries.forEach(function (entry) {{ if (entry.isIntersecting) draw(entry.target); }});
+    }});
+    for (var i = 0; i < panels.length; i++) observer.observe(panels[i]);
+}} else {{
+    for (var i = 0; i < panels.length; i++) draw(panels[i]);
+}}
+</script>
+</body></html>
+"""
+PANEL_TEMPLATE = """<div class="panel" id="panel_{idx}"></div>
+<script type="application/json" id="panel_{idx}_data">{figure}</script>"""
+FULL_TEMPLATE = """
+<script type="application/json" id="panel_{idx}_full">{figure}</script>"""
+
+
+def lttb(x, y, n_out):
+    """
+    Largest triangle three buckets: points keeping the shape of the line x, y
+    The points are split in n_out - 2 buckets in their order, the first and last points are kept, and in each bucket
+    the point making the largest triangle with the point kept before and the mean of the next bucket
+    :return: indices of the n_out points kept, all indices if there are not more points
+    """
+    n_points = len(x)
+    if n_out >= n_points or n_out < 3:
+        return np.arange(n_points)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # bucket edges, the last point is a bucket of its own
+    edges = np.append(np.linspace(1, n_points - 1, n_out - 1).astype(int), n_points)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x, edges[:-1]) / counts
+    mean_y = np.add.reduceat(y, edges[:-1]) / counts
+
+    keep = np.empty(n_out, dtype=int)
+    keep[0] = 0
+    keep[-1] = n_points - 1
+    last = 0
+    for idx in range(n_out - 2):
+        start, stop = edges[idx], edges[idx + 1]
+        last_x, last_y = x[last], y[last]
+        area = np.abs((last_x - mean_x[idx + 1]) * (y[start:stop] - last_y) -
+                      (last_x - x[start:stop]) * (mean_y[idx + 1] - last_y))
+        last = start + int(area.argmax())
+        keep[idx + 1] = last
+    return keep
+
+
+def decimate(x, y, n_out, log_x=False, log_y=False):
+    """
+    lttb on the plotted coordinates
+    :param log_x: log axis, the shape is kept in log10(|x|)
+    :param log_y: log axis, the shape is kept in log10(|y|)
+    :return: indices of the points kept
+    """
+    if len(x) <= n_out:
+        return np.arange(len(x))
+    with np.errstate(divide='ignore'):
+        x_plot = np.log10(np.abs(x)) if log_x else np.asarray(x, dtype=np.float64)
+        y_plot = np.log10(np.abs(y)) if log_y else np.asarray(y, dtype=np.float64)
+    x_plot = np.where(np.isfinite(x_plot), x_plot, 0.0)
+    y_plot = np.where(np.isfinite(y_plot), y_plot, 0.0)
+    return lttb(x_plot, y_plot, n_out)
+
+
+def plotly_js_name():
+    import plotly
+
+    return 'plotly-{}.min.js'.format(plotly.__version__)
+
+
+def write_plotly_js(directory):
+    """
+    Write plotly.js in directory, unless already there
+    :return: file name relative to directory, bytes written
+    """
+    file_name = plotly_js_name()
+    path = os.path.join(directory, file_name)
+    if os.path.isfile(path):
+        return file_name, 0
+    from plotly.offline import get_plotlyjs
+
+    content = get_plotlyjs().encode('utf-8')
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as fp:
+        fp.write(content)
+    os.replace(tmp_path, path)
+    return file_name, len(content)
+
+
+class PlotExport(object):
+    """
+    Panels of the last pages, serialized figures keyed by their data
+    """
+
+    def __init__(self, directory='', file_name='impedance_plot.html'):
+        """
+        :param directory: directory of the page and of plotly.js, default the working directory
+        :param file_name: page file name
+        """
+        self.directory = directory
+        self.file_name = file_name
+        self.panels = {}
+        self.rebuilt = []
+        self.t_start = None
+        self.stats = None
+
+    @staticmethod
+    def data_key(*values):
+        """
+        Digest of the data of a panel: arrays by content, anything else by its repr
+        """
+        digest = hashlib.sha1()
+        for value in values:
+            if isinstance(value, np.ndarray):
+                digest.update(str((value.dtype, value.shape)).encode())
+                digest.update(np.ascontiguousarray(value).tobytes())
+            else:
+                digest.update(repr(value).encode())
+            digest.update(b'|')
+        return digest.hexdigest()
+
+    def begin(self):
+        """
+        Start a page: reset the timer and the list of rebuilt panels
+        """
+        self.t_start = time.perf_counter()
+        self.rebuilt = []
+
+    def is_current(self, names, key):
+        return all(name in self.panels and self.panels[name][0] == key for name in names)
+
+    def set_panel(self, name, key, figure, full_figure=None):
+        """
+        :param figure: plotly Figure of the panel, or dict of data and layout (not validated, faster for many traces)
+        :param full_figure: full resolution figure, drawn on demand, when figure is decimated
+        """
+        import plotly.io as pio
+
+        self.panels[name] = (key, pio.to_json(figure, validate=False),
+                             pio.to_json(full_figure, validate=False) if full_figure is not None else None)
+        self.rebuilt.append(name)
+
+    def write(self, names):
+        """
+        Write the page with the panels names, in this order
+        :return: path to the page
+        """
+        if self.t_start is None:
+            self.begin()
+        plotly_js, js_bytes = write_plotly_js(self.directory)
+        panels = []
+        for idx, name in enumerate(names):
+            _, figure, full_figure = self.panels[name]
+            panel = PANEL_TEMPLATE.format(idx=idx, figure=figure.replace('</', '<\\/'))
+            if full_figure is not None:
+                panel += FULL_TEMPLATE.format(idx=idx, figure=full_figure.replace('</', '<\\/'))
+            panels.append(panel)
+        page = PAGE_TEMPLATE.format(plotly_js=plotly_js, size=PANEL_SIZE, panels='\n'.join(panels),
+                                    config=json.dumps(PLOT_CONFIG))
+        content = page.encode('utf-8')
+        path = os.path.join(self.directory, self.file_name)
+        with open(path, 'wb') as fp:
+            fp.write(content)
+
+        # panels not on this page are dropped
+        self.panels = {name: self.panels[name] for name in names}
+        self.stats = {'panels': len(names), 'rebuilt': len(self.rebuilt), 'bytes': len(content) + js_bytes,
+                      'time': time.perf_counter() - self.t_start}
+        self.t_start = None
+        return path
+
+    def summary(self):
+        return "Plot export: {0} panels ({1} rebuilt), {2:.1f} kB in {3:.3f} s".format(
+            self.stats['panels'], self.stats['rebuilt'], self.stats['bytes'] / 1e3, self.stats['time'])
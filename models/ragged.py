@@ -0,0 +1,97 @@
+"""
+Several spectra held as one concatenated dataset with explicit offsets
+
+Spectrum i is the points offsets[i]:offsets[i + 1] of every per-point array (frequencies, data, fitted impedance,
+residuals, temperature), so it is a slice (a view, no copy) found without scanning the data. Spectra sharing
+a temperature stay distinct, each one has its own id.
+"""
+import numpy as np
+
+
+class RaggedSpectra(object):
+    """
+    Concatenated spectra with their offsets, ids and condition (temperature, voltage, ...)
+    """
+
+    def __init__(self, f, z, offsets, ids=None, conditions=None):
+        """
+        :param f: frequencies of all spectra, concatenated
+        :param z: impedance of all spectra, concatenated
+        :param offsets: start of each spectrum, plus the total length (n_spectra + 1)
+        :param ids: name of each spectrum, default its index
+        :param conditions: condition of each spectrum, e.g. temperature
+        """
+        self.f = np.asarray(f)
+        self.z = np.asarray(z)
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+        if self.offsets[0] != 0 or self.offsets[-1] != self.f.size or np.any(np.diff(self.offsets) < 0):
+            raise ValueError("Offsets do not split the {} points".format(self.f.size))
+        self.ids = list(ids) if ids is not None else [str(idx) for idx in range(len(self.offsets) - 1)]
+        self.conditions = np.asarray(conditions, dtype=np.float64) if conditions is not None else None
+
+    @classmethod
+    def from_spectra(cls, spectra, ids=None, conditions=None):
+        """
+        :param spectra: list of (f, z)
+        """
+        sizes = [len(f) for f, _ in spectra]
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.intp)
+        f = np.concatenate([np.asarray(f, dtype=np.float64) for f, _ in spectra]) if spectra else np.zeros(0)
+        z = np.concatenate([np.asarray(z, dtype=np.complex128) for _, z in spectra]) if spectra \
+            else np.zeros(0, dtype=np.complex128)
+        return cls(f, z, offsets, ids, conditions)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def slice(self, idx):
+        return slice(self.offsets[idx], self.offsets[idx + 1])
+
+    def spectrum(self, idx):
+        """
+        :return: frequencies, impedance of spectrum idx (views)
+        """
+        sl = self.slice(idx)
+        return self.f[sl], self.z[sl]
+
+    def values(self, array, idx):
+        """
+        Part of a per-point array (e.g. fitted impedance) belonging to spectrum idx (view)
+        """
+        return array[self.slice(idx)]
+
+    def split(self, array):
+        """
+        :return: list of the views of array for each spectrum
+        """
+        return [array[self.offsets[idx]:self.offsets[idx + 1]] for idx in range(len(self))]
+
+    def index(self, spectrum_id):
+        return self.ids.index(spectrum_id)
+
+    def point_conditions(self):
+        """
+        Condition of each point, e.g. the temperature of laws.LawModel
+        """
+        return np.repeat(self.conditions, np.diff(self.offsets))
+
+    def segment_sum(self, array, stride=1):
+        """
+        Sum of a per-point array over each spectrum, e.g. the chi-square of each spectrum from squared residuals
+        :param stride: rows per point, e.g. 2 for residuals of models.cost_vector (real and imaginary rows)
+        :return: (n_spectra,) array, 0 for an empty spectrum
+        """
+        array = np.asarray(array)
+        offsets = stride * self.offsets
+        cumsum = np.concatenate([np.zeros((1,) + array.shape[1:], dtype=array.dtype), np.cumsum(array, axis=0)])
+        return cumsum[offsets[1:]] - cumsum[offsets[:-1]]
+
+    def keep(self, mask):
+        """
+        Subset of the points, e.g. Im(Z) < 0 for fitting, with the offsets updated
+        :param mask: boolean per point
+        :return: RaggedSpectra
+        """
+        mask = np.asarray(mask, dtype=bool)
+        offsets = np.concatenate([[0], np.cumsum(mask)])[self.offsets]
+        return RaggedSpectra(self.f[mask], self.z[mask], offsets, self.ids, self.conditions)
@@ -0,0 +1,233 @@
+"""
+Spectrum and parameter files
+
+Spectra are tab separated frequency, Z', Z'' columns, after a header of a few lines:
+- 'txt': no header (dx30_read_data)
+- 'dat': 7 header lines, the temperature on the second one (llz_read_data, otmlsm10_read_data, dx19_read_data)
+A file is read at once and its numeric block converted in a single call. Parsed files are kept in memory,
+keyed by path, modification time and size, so fitting the same file again never parses it again.
+Spectra of a store (models/store.py) are given as '<store directory>#<index>' (read_source), and read from the
+memory mapped columns without parsing.
+"""
+import os
+from collections import OrderedDict
+import numpy as np
+
+FORMATS = {
+    'txt': {'header_lines': 0, 'temperature_line': None},
+    'dat': {'header_lines': 7, 'temperature_line': 1},
+}
+PARSED_CACHE_SIZE = 4096
+PARSED_CACHE = OrderedDict()
+STORE_SEPARATOR = '#'
+OPEN_STORES = {}
+
+
+def file_format(dataPath):
+    return 'dat' if dataPath.endswith('.dat') else 'txt'
+
+
+def parse_columns(text, n_cols=3):
+    """
+    Numeric block to a (n_rows, n_cols) array, extra columns and blank lines ignored
+    :param text: data lines
+    :return:
+    """
+    lines = [line for line in text.split('\n') if line.strip() != '']
+    if not lines:
+        return np.zeros((0, n_cols), dtype=np.float64)
+
+    width = len(lines[0].split())
+    try:
+        # whitespace separated text, converted by numpy without a Python float per token
+        values = np.fromstring(text, dtype=np.float64, sep=' ')
+    except ValueError:
+        values = None
+    if values is not None and width >= n_cols and values.size == len(lines) * width:
+        return values.reshape(-1, width)[:, :n_cols].copy()
+    # ragged lines (e.g. extra trailing columns) or malformed ones, one line at a time
+    rows = np.empty((len(lines), n_cols), dtype=np.float64)
+    for idx, line in enumerate(lines):
+        tokens = line.split()
+        if len(tokens) < n_cols:
+            raise ValueError("Data line {0}: {1} columns, {2} expected: {3!r}".format(idx + 1, len(tokens), n_cols,
+                                                                                      line))
+        try:
+            rows[idx] = [float(token) for token in tokens[:n_cols]]
+        except ValueError:
+            raise ValueError("Data line {0}: not numeric: {1!r}".format(idx + 1, line))
+    return rows
+
+
+def parse_spectrum(dataPath, fmt=None):
+    """
+    Parse a spectrum file, without cache
+    :param fmt: key of FORMATS, default from the file extension
+    :return: dict with f (frequencies), z (complex impedance), temperature (None without header), name
+    """
+    spec = FORMATS[fmt or file_format(dataPath)]
+    with open(dataPath, encoding='utf-8-sig') as fo:
+        text = fo.read()
+
+    if spec['header_lines']:
+        parts = text.split('\n', spec['header_lines'])
+        header, body = parts[:spec['header_lines']], parts[-1] if len(parts) > spec['header_lines'] else ''
+    else:
+        header, body = [], text
+
+    temperature = None
+    if spec['temperature_line'] is not None:
+        temperature = float(header[spec['temperature_line']])
+
+    rows = parse_columns(body)
+    f_data = np.ascontiguousarray(rows[:, 0])
+    z_data = rows[:, 1] + 1j * rows[:, 2]
+    return {'f': f_data, 'z': z_data, 'temperature': temperature, 'name': os.path.basename(dataPath)}
+
+
+def read_file(dataPath, fmt=None):
+    """
+    Parsed spectrum from PARSED_CACHE, parsed again only if the file changed
+    The arrays are shared between calls and read-only, copy them before modifying
+    :return: dict, see parse_spectrum
+    """
+    stat = os.stat(dataPath)
+    key = (os.path.abspath(dataPath), fmt)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = PARSED_CACHE.get(key)
+    if cached is not None and cached[0] == stamp:
+        PARSED_CACHE.move_to_end(key)
+        return cached[1]
+
+    entry = parse_spectrum(dataPath, fmt)
+    entry['f'].setflags(write=False)
+    entry['z'].setflags(write=False)
+    PARSED_CACHE[key] = (stamp, entry)
+    PARSED_CACHE.move_to_end(key)
+    while len(PARSED_CACHE) > PARSED_CACHE_SIZE:
+        PARSED_CACHE.popitem(last=False)
+    return entry
+
+
+def open_store(store_path):
+    """
+    SpectrumStore opened once per process, mapped again when spectra were appended
+    """
+    from models import store
+
+    meta_time = os.stat(os.path.join(store_path, 'meta.json')).st_mtime_ns
+    opened = OPEN_STORES.get(store_path)
+    if opened is None or opened[0] != meta_time:
+        opened = (meta_time, store.SpectrumStore(store_path))
+        OPEN_STORES[store_path] = opened
+    return opened[1]
+
+
+def store_sources(store_path, indices=None):
+    """
+    :param indices: spectra of the store, default all (see SpectrumStore.select)
+    :return: list of sources '<store_path>#<index>' for read_source
+    """
+    if indices is None:
+        indices = range(len(open_store(store_path)))
+    return ['{}{}{}'.format(store_path, STORE_SEPARATOR, idx) for idx in indices]
+
+
+def read_source(source):
+    """
+    Spectrum from a file, or from a store as '<store directory>#<index>'
+    :return: dict, see parse_spectrum; the arrays of a store spectrum are views of its mapped columns
+    """
+    if os.path.isfile(source):
+        return read_file(source)
+    store_path, _, idx = source.rpartition(STORE_SEPARATOR)
+    spectra = open_store(store_path)
+    f_data, z_data = spectra.spectrum(int(idx))
+    metadata = spectra.metadata(int(idx))
+    temperature = metadata['temperature'] if not np.isnan(metadata['temperature']) else None
+    return {'f': f_data, 'z': z_data, 'temperature': temperature, 'name': metadata['name']}
+
+
+def read_spectrum(dataPath, rm_positive=False):
+    """
+    Load a tab separated spectrum (frequency, Z', Z''), as FittingImpedance.dx30_read_data for fitting
+    :param dataPath: path to data file, or store spectrum (see read_source)
+    :param rm_positive: keep only points with Z'' < 0 for fitting
+    :return: f_data, z_data, fp_data, zp_data
+    """
+    entry = read_source(dataPath)
+    f_data = entry['f']
+    z_data = entry['z']
+
+    if rm_positive:
+        kp_data = (np.imag(z_data) < 0)
+        fp_data = f_data[kp_data]
+        zp_data = z_data[kp_data]
+    else:
+        fp_data = f_data.copy()
+        zp_data = z_data.copy()
+
+    return f_data, z_data, fp_data, zp_data
+
+
+def read_dat_spectrum(dataPath):
+    """
+    Load one spectrum of a temperature series (.dat), as FittingImpedance.llz_read_data:
+    temperature on the second line, tab separated frequency, Z', Z'' from the eighth line
+    :param dataPath: path to data file
+    :return: f_data, z_data, temperature
+    """
+    entry = read_file(dataPath, 'dat')
+    return entry['f'], entry['z'], entry['temperature']
+
+
+def read_series(ls_data_path, fmt='dat', unique_temperature=True):
+    """
+    Load a temperature series, as FittingImpedance.llz_read_data: files sorted by path
+    :param ls_data_path: list of data files
+    :param unique_temperature: skip a file whose temperature was already read, needed when the spectra are
+                               told apart by temperature; not with their offsets (see ragged.RaggedSpectra)
+    :return: list of parsed spectra (see parse_spectrum)
+    """
+    spectra = []
+    temperatures = set()
+    for data_path in sorted(ls_data_path):
+        entry = read_file(data_path, fmt)
+        if unique_temperature and entry['temperature'] in temperatures:
+            continue
+        temperatures.add(entry['temperature'])
+        spectra.append(entry)
+    return spectra
+
+
+def read_parameters(load_path):
+    """
+    Load parameters from a file written by FittingImpedance.saveParameters
+    A parameter is free if its error column holds a value, as in FittingImpedance.loadParameters
+    :param load_path: path to csv file
+    :return: par_names (lower case, as sent by the GUI), par_values, par_frees
+    """
+    import pandas as pd
+
+    df_pars = pd.read_csv(load_path, header=None, sep=',').values
+    ld_names = df_pars[0, :]
+    if "Data name" in ld_names:
+        st_index = 3
+    elif "chi-square" in ld_names:
+        st_index = 2
+    else:
+        st_index = 0
+
+    df_names = df_pars[0, st_index:]
+    df_values = df_pars[1, st_index:]
+
+    par_values = []
+    par_names = []
+    par_frees = [1] * (len(df_names) // 3)
+    for idx in range(len(df_names) // 3):
+        par_names.append(str(df_names[3*idx]).lower())
+        par_values.append(float(df_values[3*idx]))
+        if np.isnan(float(df_values[3*idx + 1])):
+            par_frees[idx] = 0
+
+    return par_names, par_values, par_frees
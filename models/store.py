@@ -0,0 +1,179 @@
+"""
+Columnar store of many spectra, opened with memory mapping
+
+A store is a directory of flat binary columns:
+- freqs.f64: frequencies of all spectra, concatenated (float64)
+- z.c128: impedance of all spectra, concatenated (complex128, real/imag float64 pairs)
+- offsets.i64: start of each spectrum in freqs / z, plus the total length (int64, n_spectra + 1)
+- temperature.f64, voltage.f64: metadata of each spectrum (float64, nan if unknown)
+- names.txt: file name of each spectrum, one per line
+- meta.json: number of spectra, written last: a spectrum appended by an interrupted process is not visible
+
+Spectra are read as slices of the mapped columns, without copy or parsing.
+
+    spectra = store.SpectrumStore('campaign.store', mode='a')
+    spectra.append_files(glob.glob('cycling/*.dat'))
+    for idx in spectra.select(temperature=(20, 30)):
+        f, z = spectra.spectrum(idx)
+"""
+import os
+import json
+import fnmatch
+import numpy as np
+
+COLUMNS = {'freqs': ('freqs.f64', np.float64), 'z': ('z.c128', np.complex128),
+           'offsets': ('offsets.i64', np.int64), 'temperature': ('temperature.f64', np.float64),
+           'voltage': ('voltage.f64', np.float64)}
+STORE_VERSION = 1
+
+
+def is_store(path):
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+class SpectrumStore(object):
+    """
+    Spectra in a store directory, mode 'r' (read only) or 'a' (append, created if missing)
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        if not is_store(path):
+            if mode == 'r':
+                raise IOError("No spectrum store in {}".format(path))
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            for name, (file_name, dtype) in COLUMNS.items():
+                with open(os.path.join(path, file_name), 'wb') as fp:
+                    if name == 'offsets':
+                        fp.write(np.zeros(1, dtype=dtype).tobytes())
+            open(os.path.join(path, 'names.txt'), 'w').close()
+            self.write_meta(0)
+        self.reload()
+
+    def write_meta(self, n_spectra):
+        meta_path = os.path.join(self.path, 'meta.json')
+        tmp_path = '{}.{}.tmp'.format(meta_path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            json.dump({'version': STORE_VERSION, 'n_spectra': n_spectra}, fp)
+        os.replace(tmp_path, meta_path)
+
+    def column(self, name, length):
+        """
+        Read-only memory map of the first length items of a column
+        """
+        file_name, dtype = COLUMNS[name]
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, file_name), dtype=dtype, mode='r', shape=(length,))
+
+    def reload(self):
+        """
+        Map the columns again, e.g. after spectra were appended by another process
+        """
+        with open(os.path.join(self.path, 'meta.json')) as fp:
+            meta = json.load(fp)
+        self.n_spectra = meta['n_spectra']
+        self.offsets = np.array(self.column('offsets', self.n_spectra + 1))
+        n_points = int(self.offsets[-1])
+        self.freqs = self.column('freqs', n_points)
+        self.z = self.column('z', n_points)
+        self.temperature = self.column('temperature', self.n_spectra)
+        self.voltage = self.column('voltage', self.n_spectra)
+        with open(os.path.join(self.path, 'names.txt')) as fp:
+            self.names = fp.read().split('\n')[:self.n_spectra]
+
+    def close(self):
+        self.freqs = self.z = self.temperature = self.voltage = None
+
+    def __len__(self):
+        return self.n_spectra
+
+    def spectrum(self, idx):
+        """
+        :return: frequencies, impedance of spectrum idx, views of the mapped columns
+        """
+        start, stop = self.offsets[idx], self.offsets[idx + 1]
+        return self.freqs[start:stop], self.z[start:stop]
+
+    def metadata(self, idx):
+        return {'name': self.names[idx], 'temperature': float(self.temperature[idx]),
+                'voltage': float(self.voltage[idx])}
+
+    def select(self, temperature=None, voltage=None, name=None):
+        """
+        Indices of the spectra matching all the given conditions
+        :param temperature: (min, max), inclusive
+        :param voltage: (min, max), inclusive
+        :param name: shell pattern on the file name, e.g. 'cycle_01*'
+        :return: int array
+        """
+        keep = np.ones(self.n_spectra, dtype=bool)
+        for values, bounds in ((self.temperature, temperature), (self.voltage, voltage)):
+            if bounds is not None:
+                keep &= (values >= bounds[0]) & (values <= bounds[1])
+        if name is not None:
+            keep &= np.array([fnmatch.fnmatch(spectrum_name, name) for spectrum_name in self.names], dtype=bool)
+        return np.flatnonzero(keep)
+
+    def append(self, f, z, temperature=np.nan, voltage=np.nan, name=''):
+        self.extend([(f, z, temperature, voltage, name)])
+
+    def extend(self, spectra):
+        """
+        Append spectra
+        :param spectra: list of (f, z, temperature, voltage, name)
+        """
+        if self.mode != 'a':
+            raise IOError("Spectrum store opened read only")
+        if not spectra:
+            return
+
+        # columns are truncated to the committed length first, dropping the leftovers of an interrupted append
+        lengths = {'freqs': int(self.offsets[-1]), 'z': int(self.offsets[-1]), 'offsets': self.n_spectra + 1,
+                   'temperature': self.n_spectra, 'voltage': self.n_spectra}
+        stop = int(self.offsets[-1])
+        new_offsets = []
+        for f, _, _, _, _ in spectra:
+            stop += len(f)
+            new_offsets.append(stop)
+        new_columns = {
+            'freqs': np.concatenate([np.asarray(f, dtype=np.float64) for f, _, _, _, _ in spectra]),
+            'z': np.concatenate([np.asarray(z, dtype=np.complex128) for _, z, _, _, _ in spectra]),
+            'offsets': np.array(new_offsets, dtype=np.int64),
+            'temperature': np.array([temperature for _, _, temperature, _, _ in spectra], dtype=np.float64),
+            'voltage': np.array([voltage for _, _, _, voltage, _ in spectra], dtype=np.float64)}
+        # a mapped file cannot be truncated on Windows
+        self.close()
+        for name, (file_name, dtype) in COLUMNS.items():
+            with open(os.path.join(self.path, file_name), 'r+b') as fp:
+                fp.truncate(lengths[name] * np.dtype(dtype).itemsize)
+                fp.seek(0, os.SEEK_END)
+                fp.write(new_columns[name].tobytes())
+
+        names_path = os.path.join(self.path, 'names.txt')
+        tmp_path = '{}.{}.tmp'.format(names_path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            fp.write('\n'.join(self.names + [os.path.basename(name) for _, _, _, _, name in spectra]))
+        os.replace(tmp_path, names_path)
+        self.write_meta(self.n_spectra + len(spectra))
+        self.reload()
+
+    def append_files(self, data_files, batch_size=1000):
+        """
+        Parse spectrum files (see readers.read_file) into the store
+        :return: number of spectra appended
+        """
+        from models import readers
+
+        batch = []
+        for data_path in data_files:
+            entry = readers.read_file(data_path)
+            temperature = entry['temperature'] if entry['temperature'] is not None else np.nan
+            batch.append((entry['f'], entry['z'], temperature, np.nan, entry['name']))
+            if len(batch) == batch_size:
+                self.extend(batch)
+                batch = []
+        self.extend(batch)
+        return len(data_files)
@@ -0,0 +1,158 @@
+"""
+Per-iteration telemetry of a fit
+
+The cost functions handed to the optimizers are wrapped (FitTrace.wrap), so every optimizer is traced the same way:
+an iteration is recorded each time a cost evaluation improves on the best cost so far.
+The traced cost functions are also where a fit is cancelled: once the cancel event of the trace is set, the next
+evaluation raises FitCancelled and the fit keeps the best parameters evaluated so far (FitTrace.best_x).
+"""
+import csv
+import time
+import threading
+import numpy as np
+from models import models
+
+TRACE_FIELDS = ['iteration', 'nfev', 'njev', 'cost', 'red_chisqr', 'step_norm', 'time', 'time_model',
+                'time_optimizer', 'stage']
+
+
+class FitCancelled(Exception):
+    """
+    Raised by a traced cost function once the fit is cancelled
+    """
+
+
+class TracedCost(object):
+    """
+    Cost function wrapper feeding a FitTrace
+
+    kind:
+        'vector': returns the residual vector (models.cost_vector)
+        'scalar': returns the sum of squares (models.cost_scalar)
+        'batch': returns one sum of squares per column of x (models.cost_scalar_batch)
+        'jacobian': derivative, only counted and timed
+    """
+
+    def __init__(self, trace, func, kind, log10=False, scale=None, linear=None):
+        """
+        :param log10: x holds log10 of the parameters (differential evolution)
+        :param linear: with log10, boolean mask of the parameters x holds as values (see models.from_log10)
+        :param scale: x is recorded divided by scale, e.g. the initial values when the other stages fit
+                      relative values (dr_method)
+        """
+        self.trace = trace
+        self.func = func
+        self.kind = kind
+        self.log10 = log10
+        self.scale = scale
+        self.linear = linear
+
+    def __call__(self, x, *args):
+        if self.trace.cancel_event.is_set():
+            raise FitCancelled()
+        t_start = time.perf_counter()
+        ret = self.func(x, *args)
+        self.trace.time_model += time.perf_counter() - t_start
+
+        if self.kind == 'jacobian':
+            self.trace.njev += 1
+            return ret
+
+        x = models.from_log10(x, self.linear) if self.log10 else np.asarray(x)
+        if self.scale is not None:
+            x = x / (self.scale if self.kind != 'batch' else np.reshape(self.scale, (-1, 1)))
+        if self.kind == 'vector':
+            self.trace.evaluated(x, np.dot(ret, ret), 1)
+        elif self.kind == 'scalar':
+            self.trace.evaluated(x, ret, 1)
+        else:
+            x = x.reshape(-1, np.size(ret))
+            best = np.argmin(ret)
+            self.trace.evaluated(x[:, best], ret[best], np.size(ret))
+        return ret
+
+
+class FitTrace(object):
+    """
+    Records cost, reduced chi-square, step norm, number of evaluations and the time spent in the
+    cost functions (model) and outside them (optimizer) at each iteration.
+    Records are dicts with TRACE_FIELDS; the step norm is relative, |dx / x|, since the parameters span decades.
+    """
+
+    def __init__(self, n_points, n_free, callback=None, interval=0.5, cancel_event=None):
+        """
+        :param n_points: number of real residuals (2 * number of frequencies)
+        :param n_free: number of free parameters
+        :param callback: called with the last record, at most every interval seconds and once at the end
+        :param interval: seconds between two callbacks
+        :param cancel_event: threading.Event, set from another thread to cancel the fit (see FitCancelled)
+        """
+        self.dof = max(n_points - n_free, 1)
+        self.callback = callback
+        self.interval = interval
+        self.records = []
+        self.nfev = 0
+        self.njev = 0
+        self.time_model = 0.0
+        self.best_cost = np.inf
+        self.best_x = None
+        self.stage = ''
+        self.t_start = time.perf_counter()
+        self.t_callback = -np.inf
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+
+    def wrap(self, func, kind, log10=False, scale=None, linear=None):
+        if func is None:
+            return None
+        return TracedCost(self, func, kind, log10, scale, linear)
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def evaluated(self, x, cost, n_evals):
+        """
+        Count n_evals evaluations, record an iteration if cost is the best so far
+        """
+        self.nfev += n_evals
+        if not cost < self.best_cost:
+            return
+        if self.best_x is None:
+            step_norm = 0.0
+        else:
+            scale = np.abs(self.best_x)
+            scale[scale == 0] = 1.0
+            step_norm = float(np.linalg.norm((x - self.best_x) / scale))
+        self.best_cost = float(cost)
+        self.best_x = np.array(x, dtype=np.float64)
+        self.record(step_norm)
+
+    def record(self, step_norm=0.0):
+        elapsed = time.perf_counter() - self.t_start
+        self.records.append({'iteration': len(self.records), 'nfev': self.nfev, 'njev': self.njev,
+                             'cost': self.best_cost, 'red_chisqr': self.best_cost / self.dof,
+                             'step_norm': step_norm, 'time': elapsed, 'time_model': self.time_model,
+                             'time_optimizer': elapsed - self.time_model, 'stage': self.stage})
+        if self.callback is not None and elapsed - self.t_callback >= self.interval:
+            self.t_callback = elapsed
+            self.callback(self.records[-1])
+
+    def finish(self):
+        """
+        Last record (final counters and times), always sent to the callback
+        """
+        self.t_callback = -np.inf
+        self.record()
+
+    def save(self, path):
+        save_trace(self.records, path)
+
+
+def save_trace(records, path):
+    """
+    Write trace records to a csv file
+    """
+    with open(path, 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=TRACE_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
@@ -0,0 +1,25 @@
+"""
+Parameter sets of the tests, fitted values of the tutorials (tutorials/Examples): 8_Barsoukov for the half cell
+models, 10_Fitting experimental data for the full cell models
+"""
+import numpy as np
+from models import models
+
+HALF_CELL = {'r_m': 6.24, 'r_ct': 13.869, 'r_d': 26.01, 'r_i': 96.9, 'c_dl': 3.03e-07, 'c_d': 0.07, 'c_i': 1.032,
+             'q_w': 1e-20, 'r_+||': 1e-20, 'r_-||': 1e-20, 'r_c_liq': 51.9, 'r_a_liq': 6.99, 'c_d_liq': 0.5}
+FULL_CELL = {'l_str': 3.854639e-07, 'r_str': 3.756996, 'r_m': 8.508027, 'r_ct': 18.57249, 'r_d': 8.237766,
+             'r_i': 106.909, 'c_dl': 1.304944e-06, 'c_d': 0.340376, 'c_i': 1.033651, 'q_w': 0.0004830201,
+             'r_+||': 1e-20, 'r_-||': 1e+20, 'r_c_liq': 16.31728, 'r_a_liq': 10.05564, 'c_d_liq': 0.3701643,
+             'r_ct_li': 3.703044, 'c_dl_li': 0.0001400279}
+FREQS = np.logspace(-2, 5, 36)
+
+
+def model_params(model):
+    return dict(FULL_CELL if models.MODELS[model]['params'] is models.FULL_CELL_PARAMS else HALF_CELL)
+
+
+def free_parameters(params):
+    """
+    Parameters not removed from the circuit (not fixed at 1e-20 or 1e20)
+    """
+    return [name for name, value in params.items() if 1e-15 < abs(value) < 1e15]
@@ -0,0 +1,36 @@
+"""
+Batched models (models.MODELS[...]['batch']) against one evaluation of the model per parameter set
+"""
+import numpy as np
+import pytest
+from models import models
+from tests.params import FREQS, model_params
+
+RTOL = 1e-12
+
+
+def parameter_sets(model, n_sets=5):
+    mdl = models.MODELS[model]
+    base = np.array([model_params(model)[name] for name in mdl['params']])
+    scale = np.linspace(0.5, 2.0, n_sets)[:, np.newaxis]
+    positive = (base > 1e-15) & (base < 1e15)
+    return np.where(positive, base * scale, base)
+
+
+@pytest.mark.parametrize('model', sorted(models.MODELS))
+def test_batch_matches_single_evaluations(model):
+    mdl = models.MODELS[model]
+    pars = parameter_sets(model)
+    expected = [mdl['func'](dict(zip(mdl['params'], row)), FREQS) for row in pars]
+    np.testing.assert_allclose(mdl['batch'](pars, FREQS), expected, rtol=RTOL)
+
+
+@pytest.mark.parametrize('model', sorted(models.MODELS))
+def test_batch_with_one_frequency_per_set(model):
+    mdl = models.MODELS[model]
+    pars = parameter_sets(model)
+    f_column = FREQS[::7][:len(pars), np.newaxis]
+    expected = [mdl['func'](dict(zip(mdl['params'], row)), FREQS[::7])[idx] for idx, row in enumerate(pars)]
+    z_column = mdl['batch'](pars, f_column)
+    assert z_column.shape == (len(pars), 1)
+    np.testing.assert_allclose(z_column[:, 0], expected, rtol=RTOL)
@@ -0,0 +1,30 @@
+"""
+I0(x)/I1(x) of the cylindrical diffusion against mpmath, on both sides of models.BESSEL_ASYMPTOTIC_RE
+"""
+import numpy as np
+import pytest
+from models import models, kernels
+
+mpmath = pytest.importorskip('mpmath')
+
+RTOL = 1e-13
+# |x| from near 0 to far above BESSEL_ASYMPTOTIC_RE, arg(x) from 0 to pi/4 (x = sqrt(R_d * jw * Cd*))
+X = np.outer(np.logspace(-8, 6, 57), np.exp(1j * np.linspace(0.0, np.pi / 4, 5))).ravel()
+
+
+def reference(x):
+    with mpmath.workdps(40):
+        return np.array([complex(mpmath.besseli(0, mpmath.mpc(z)) / mpmath.besseli(1, mpmath.mpc(z))) for z in x])
+
+
+def test_sample_covers_both_branches():
+    assert np.any(X.real > models.BESSEL_ASYMPTOTIC_RE)
+    assert np.any(X.real <= models.BESSEL_ASYMPTOTIC_RE)
+
+
+def test_besseli_ratio():
+    np.testing.assert_allclose(models.besseli_ratio(X), reference(X), rtol=RTOL)
+
+
+def test_kernel_besseli_ratio_point():
+    np.testing.assert_allclose([kernels.besseli_ratio_point(x) for x in X], reference(X), rtol=RTOL)
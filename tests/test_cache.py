@@ -0,0 +1,35 @@
+"""
+Fit cache (models/cache.py): exact hits only for fits by the same model code and backend
+"""
+from models import models, engine, cache
+from tests.params import FREQS, HALF_CELL
+
+MODEL = 'Barsoukov-Pham-Lee_1D'
+
+
+def fit(fit_cache):
+    z_data = models.MODELS[MODEL]['func'](HALF_CELL, FREQS)
+    return engine.fit(MODEL, FREQS, z_data, dict(HALF_CELL, r_ct=15.0), ['r_ct', 'c_dl'], cache=fit_cache)
+
+
+def test_hit_for_the_same_code(tmp_path):
+    fit_cache = cache.FitCache(str(tmp_path))
+    assert fit(fit_cache).cache == 'miss'
+    assert fit(fit_cache).cache == 'hit'
+
+
+def test_no_hit_for_another_model_code(tmp_path, monkeypatch):
+    fit_cache = cache.FitCache(str(tmp_path))
+    assert fit(fit_cache).cache == 'miss'
+    monkeypatch.setattr(cache, '_source_key', 'other version')
+    assert fit(fit_cache).cache == 'warm'
+
+
+def test_key_depends_on_backend(tmp_path, monkeypatch):
+    fit_cache = cache.FitCache(str(tmp_path))
+    args = (MODEL, FREQS, FREQS, FREQS, FREQS, HALF_CELL, ['r_ct'], [15.0], ())
+    keys = fit_cache.keys(*args)
+    monkeypatch.setattr(models, 'BACKEND', 'numba')
+    keys_numba = fit_cache.keys(*args)
+    assert keys_numba[:2] == keys[:2]
+    assert keys_numba[2] != keys[2]
@@ -0,0 +1,43 @@
+"""
+Cancelled fits (engine.fit cancel event): the best parameters so far, in the multi-start workers too
+"""
+import threading
+import numpy as np
+from models import models, engine
+from tests.params import FREQS, HALF_CELL
+
+HALF_CELL_MODEL = 'Barsoukov-Pham-Lee_1D'
+FREE = ['r_ct', 'c_dl', 'r_d']
+GUESS = dict(HALF_CELL, r_ct=3.0 * HALF_CELL['r_ct'], c_dl=0.3 * HALF_CELL['c_dl'], r_d=2.0 * HALF_CELL['r_d'])
+
+
+def test_cancelled_fit_keeps_best_parameters():
+    z_data = models.MODELS[HALF_CELL_MODEL]['func'](HALF_CELL, FREQS)
+    cancel = threading.Event()
+
+    def callback(record):
+        if record['nfev'] >= 3:
+            cancel.set()
+
+    result = engine.fit(HALF_CELL_MODEL, FREQS, z_data, GUESS, FREE, callback=callback, callback_interval=0.0,
+                        cancel=cancel)
+    assert result.cancelled
+    assert not result.success
+    start = engine.fit(HALF_CELL_MODEL, FREQS, z_data, GUESS, FREE, niters=1)
+    # the best evaluation of the trace, better than the guess, not the converged fit
+    best_cost = min(record['cost'] for record in result.trace)
+    np.testing.assert_allclose(result.chisqr, best_cost, rtol=1e-9)
+    assert result.chisqr < start.trace[0]['cost']
+    assert result.chisqr > 1e-12
+    assert all(np.isnan(result.errors[name]) for name in FREE)
+
+
+def test_cancel_reaches_start_workers():
+    z_data = models.MODELS[HALF_CELL_MODEL]['func'](HALF_CELL, FREQS)
+    cancel = threading.Event()
+    cancel.set()
+    result = engine.fit(HALF_CELL_MODEL, FREQS, z_data, GUESS, FREE, n_starts=4, start_workers=2, cancel=cancel)
+    assert result.cancelled
+    # every start stopped at its first evaluation
+    assert result.nfev == 0
+    assert np.isfinite(result.chisqr)
@@ -0,0 +1,54 @@
+"""
+Differential evolution bounds of signed parameters and of parameters starting at 0
+"""
+import numpy as np
+import pytest
+from models import models, engine, laws
+from tests.params import FREQS, FULL_CELL, HALF_CELL
+
+FULL_CELL_MODEL = 'Barsoukov-Pham-Lee_1D_Full cell'
+HALF_CELL_MODEL = 'Barsoukov-Pham-Lee_1D'
+
+
+def test_signed_parameter_bounds_are_linear():
+    params = dict(FULL_CELL, r_str=-0.5)
+    z_data = models.MODELS[FULL_CELL_MODEL]['func'](params, FREQS)
+    # bounds -10 to 10 times |r_str|
+    result = engine.fit(FULL_CELL_MODEL, FREQS, z_data, dict(params, r_str=-0.6), ['r_str', 'r_ct'],
+                        method='differential_evolution', niters=3, diev_polish=False)
+    assert np.isfinite(result.chisqr)
+    assert -6.0 <= result.params['r_str'] <= 6.0
+
+
+def test_signed_law_parameter_bounds_are_linear():
+    T = np.repeat([273.15, 298.15, 323.15], FREQS.size)
+    f_data = np.tile(FREQS, 3)
+    params = dict(HALF_CELL, r_ct_ea=-0.1)
+    law_model = laws.LawModel(HALF_CELL_MODEL, {'r_ct': 'arrhenius'})
+    z_data = law_model(params, f_data, T)
+    result = engine.fit(HALF_CELL_MODEL, f_data, z_data, params, ['r_ct', 'r_ct_ea'],
+                        method='differential_evolution', niters=3, laws=law_model, T=T)
+    assert np.isfinite(result.chisqr)
+
+
+def test_parameter_at_zero_needs_bounds():
+    params = dict(FULL_CELL, r_str=0.0)
+    z_data = models.MODELS[FULL_CELL_MODEL]['func'](FULL_CELL, FREQS)
+    with pytest.raises(ValueError, match='r_str'):
+        engine.fit(FULL_CELL_MODEL, FREQS, z_data, params, ['r_str', 'r_ct'], method='differential_evolution',
+                   niters=3)
+    result = engine.fit(FULL_CELL_MODEL, FREQS, z_data, params, ['r_str', 'r_ct'], method='differential_evolution',
+                        niters=3, diev_bounds={'r_str': (-10.0, 10.0)})
+    assert np.isfinite(result.chisqr)
+
+
+def test_free_law_parameter_missing_from_params():
+    T = np.repeat([273.15, 298.15, 323.15], FREQS.size)
+    f_data = np.tile(FREQS, 3)
+    law_model = laws.LawModel(HALF_CELL_MODEL, {'r_ct': 'arrhenius'})
+    z_data = law_model(dict(HALF_CELL, r_ct_ea=0.3), f_data, T)
+    assert laws.default_law_values(law_model.laws, HALF_CELL)['r_ct_ea'] == 0.0
+    assert laws.default_law_values(law_model.laws, HALF_CELL, ['r_ct_ea'])['r_ct_ea'] == laws.LAWS['arrhenius']['start']
+    result = engine.fit(HALF_CELL_MODEL, f_data, z_data, HALF_CELL, ['r_ct', 'r_ct_ea'],
+                        method='differential_evolution', niters=3, laws=law_model, T=T)
+    assert np.isfinite(result.chisqr)
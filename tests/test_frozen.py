@@ -0,0 +1,72 @@
+"""
+Frozen sub-circuits (models.subcircuit_impedance): the cost of a fit with them computed once is the cost of the full
+model, and their memo follows the fixed values and the frequencies
+"""
+import numpy as np
+import pytest
+from models import models, engine
+from tests.params import FREQS, model_params
+
+FREE = ['r_ct', 'c_dl']
+
+
+def frozen_circuit(model):
+    frozen = [subcircuit['name'] for subcircuit in models.SUBCIRCUITS
+              if models.circuit_kind(model) in subcircuit['circuits'] and
+              not any(name in FREE for name in subcircuit['params'])]
+    return models.ReducedCircuit(model, frozen=frozen)
+
+
+@pytest.mark.parametrize('model', sorted(models.MODELS))
+def test_frozen_cost_vector_matches(model):
+    params = model_params(model)
+    mdl = models.MODELS[model]
+    circuit = frozen_circuit(model)
+    assert circuit.frozen
+    ctx = models.frequency_context(FREQS)
+    z_data = mdl['func'](params, FREQS) * (1.0 + 0.01 * np.cos(np.arange(FREQS.size)))
+    for scale in (1.0, 1.3, 0.7):
+        guess = np.array([scale * params[name] for name in FREE])
+        expected = models.cost_vector(guess, z_data, FREQS, 1, mdl['func'], guess_names=FREE, params_dict=params)
+        frozen = models.cost_vector(guess, z_data, ctx, 1, circuit.func, guess_names=FREE, params_dict=params)
+        np.testing.assert_allclose(frozen, expected, rtol=1e-12, atol=0.0)
+
+
+@pytest.mark.parametrize('model', ['Barsoukov-Pham-Lee_1D', 'Barsoukov-Pham-Lee_3D_Full cell'])
+def test_memo_follows_fixed_values_and_frequencies(model):
+    params = model_params(model)
+    mdl = models.MODELS[model]
+    circuit = frozen_circuit(model)
+    ctx = models.frequency_context(FREQS)
+    np.testing.assert_allclose(circuit.func(params, ctx), mdl['func'](params, FREQS), rtol=1e-12)
+
+    # a fixed value of each frozen sub-circuit changed between two fits on the same frequencies
+    changed = dict(params)
+    for name in circuit.frozen:
+        par_name = next(par_name for par_name in models.SUBCIRCUIT_PARAMS[name] if params[par_name] > 1e-15)
+        changed[par_name] = 2.0 * params[par_name]
+    assert np.max(np.abs(mdl['func'](changed, FREQS) / mdl['func'](params, FREQS) - 1.0)) > 1e-3
+    np.testing.assert_allclose(circuit.func(changed, ctx), mdl['func'](changed, FREQS), rtol=1e-12)
+    np.testing.assert_allclose(circuit.func(params, ctx), mdl['func'](params, FREQS), rtol=1e-12)
+
+    # another frequency grid
+    freqs = np.logspace(-1, 4, 21)
+    np.testing.assert_allclose(circuit.func(params, models.frequency_context(freqs)), mdl['func'](params, freqs),
+                               rtol=1e-12)
+
+
+@pytest.mark.parametrize('model', sorted(models.MODELS))
+def test_nothing_frozen_without_free_parameter(model):
+    params = model_params(model)
+    assert models.reduce_circuit(model, params, [], FREQS).frozen == ()
+    assert models.reduce_circuit(model, params, FREE, FREQS).frozen != ()
+
+    # simulation: the model itself
+    mdl = models.MODELS[model]
+    z = mdl['func'](params, FREQS)
+    fitter = engine.Fitter(2, np.array([]), [dict(params), 'least_squares', z, FREQS, z, FREQS, 1, mdl['func'],
+                                             None, None, None, None],
+                           fixed_params=[], par_names=mdl['params'], model_name=model)
+    assert fitter.circuit is None
+    fitter.run_fit()
+    np.testing.assert_array_equal(fitter.zf, z)
@@ -0,0 +1,71 @@
+"""
+Global fit (models/global_fit.py): parameter errors from the blocks of the normal matrix, checkpoints of the same
+spectra only, written on a timer
+"""
+import os
+import numpy as np
+from models import models, global_fit
+from tests.params import FREQS, HALF_CELL
+
+MODEL = 'Barsoukov-Pham-Lee_1D'
+SHARED = ['r_m', 'r_d']
+LOCAL = ['r_ct', 'c_dl']
+
+
+def make_spectra(n_spectra=4, drift=0.3):
+    spectra = []
+    for idx in range(n_spectra):
+        spectrum_params = dict(HALF_CELL, r_ct=HALF_CELL['r_ct'] * (1 + drift * idx),
+                               c_dl=HALF_CELL['c_dl'] * (1 + drift * idx))
+        spectra.append((FREQS, models.MODELS[MODEL]['func'](spectrum_params, FREQS)))
+    return spectra
+
+
+def make_problem(n_spectra=4, drift=0.3):
+    return global_fit.GlobalFit(MODEL, make_spectra(n_spectra, drift), HALF_CELL, SHARED, LOCAL, 1)
+
+
+def test_parameter_errors_match_dense_covariance():
+    problem = make_problem()
+    jac = problem.jacobian(1.01 * problem.pack())
+    dense = jac.toarray()
+    col_norm = np.linalg.norm(dense, axis=0)
+    scaled = dense / col_norm
+    expected = np.sqrt(np.diag(np.linalg.pinv(np.dot(scaled.T, scaled))) * 2.0) / col_norm
+    np.testing.assert_allclose(problem.parameter_errors(jac, 2.0), expected, rtol=1e-9)
+    np.testing.assert_allclose(problem.parameter_errors(dense, 2.0), expected, rtol=1e-9)
+
+
+def test_checkpoint_of_other_spectra_not_resumed(tmp_path):
+    path = str(tmp_path / 'checkpoint.npz')
+    names = ['a', 'b', 'c', 'd']
+    problem = make_problem()
+    x = 1.1 * problem.pack()
+    global_fit.save_checkpoint(path, problem, x, names, 12)
+
+    resumed = global_fit.load_checkpoint(path, make_problem(), names)
+    np.testing.assert_array_equal(resumed[0], x)
+    assert resumed[1] == 12
+    assert global_fit.load_checkpoint(path, make_problem(drift=0.31), names) is None
+
+
+def test_checkpoint_written_on_timer(tmp_path, monkeypatch):
+    path = str(tmp_path / 'checkpoint.npz')
+    saved = []
+    save_checkpoint = global_fit.save_checkpoint
+
+    def save(path, problem, x, names, nfev):
+        saved.append((nfev, problem.residuals(x)))
+        save_checkpoint(path, problem, x, names, nfev)
+
+    monkeypatch.setattr(global_fit, 'save_checkpoint', save)
+    # finite differences: most evaluations do not improve on the best cost
+    result = global_fit.fit_global(MODEL, make_spectra(), HALF_CELL, SHARED, LOCAL, use_jac=False, checkpoint=path,
+                                   checkpoint_interval=0.0)
+    # after every evaluation, improving or not, the best parameters so far
+    improvements = len(result.trace) - 1
+    assert [nfev for nfev, _ in saved] == list(range(1, len(saved) + 1))
+    assert len(saved) > improvements
+    costs = [np.dot(residuals, residuals) for _, residuals in saved]
+    assert all(np.diff(costs) <= 0.0)
+    assert not os.path.isfile(path)
@@ -0,0 +1,50 @@
+"""
+The GUI script run as __main__ (PyPhyEIS.py): its fit thread still reaches models.engine
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+pytest.importorskip('PyQt5.QtQml')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt5.QtCore import QObject
+from PyQt5.QtQml import QQmlApplicationEngine
+from PyQt5.QtWidgets import QApplication
+from models import models
+from tests.params import FREQS, HALF_CELL
+
+HALF_CELL_MODEL = 'Barsoukov-Pham-Lee_1D'
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PyPhyEIS.py')
+
+
+@pytest.fixture
+def main_namespace(monkeypatch):
+    # the __main__ block without the page (its WebEngine view may be missing) and with an event loop returning at once
+    monkeypatch.setattr(sys, 'argv', [SCRIPT])
+    monkeypatch.setattr(QQmlApplicationEngine, 'load', lambda self, url: None)
+    monkeypatch.setattr(QQmlApplicationEngine, 'rootObjects', lambda self: [QObject()])
+    monkeypatch.setattr(QApplication, 'exec_', lambda self: 0)
+    monkeypatch.chdir(os.path.dirname(SCRIPT))
+    namespace = {'__name__': '__main__', '__file__': SCRIPT}
+    with open(SCRIPT) as fh:
+        code = compile(fh.read(), SCRIPT, 'exec')
+    with pytest.raises(SystemExit):
+        exec(code, namespace)
+    return namespace
+
+
+def test_run_fitting_after_main(main_namespace):
+    mdl = models.MODELS[HALF_CELL_MODEL]
+    params = {name: HALF_CELL[name] for name in mdl['params']}
+    z_data = mdl['func'](params, FREQS)
+    free = ['r_ct', 'c_dl']
+    runner = main_namespace['RunFitting'](1, np.array([1.2 * params[name] for name in free]),
+                                          [dict(params), 'least_squares', z_data, FREQS, z_data, FREQS, 1, mdl['func'],
+                                           None, None, None, None],
+                                          fixed_params=free, jac_func=None, batch_func=mdl['batch'],
+                                          par_names=mdl['params'], model_name=HALF_CELL_MODEL)
+    runner.run()
+    assert runner.result['success']
+    np.testing.assert_allclose([runner.result['param_ret'][name] for name in free], [params[name] for name in free],
+                               rtol=1e-6)
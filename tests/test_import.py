@@ -0,0 +1,21 @@
+"""
+Import of the fitting core in a fresh interpreter (see benchmarks/bench_import.py): no GUI, plotting, pandas nor
+scipy.optimize, and little time on top of NumPy
+"""
+import pytest
+from benchmarks.bench_import import MODULES, import_once
+
+# seconds the fitting core may add to the import time of NumPy
+IMPORT_BUDGET = 0.5
+
+
+@pytest.mark.parametrize('module', [module for module in MODULES if module.startswith('models')])
+def test_core_does_not_import_heavy_modules(module):
+    _, loaded = import_once(module)
+    assert loaded == []
+
+
+def test_engine_import_time():
+    t_numpy = min(import_once('numpy')[0] for _ in range(3))
+    t_engine = min(import_once('models.engine')[0] for _ in range(3))
+    assert t_engine - t_numpy < IMPORT_BUDGET
@@ -0,0 +1,28 @@
+"""
+Analytic derivatives (models/jacobian.py) against central finite differences of the cost vector
+"""
+import numpy as np
+import pytest
+from models import models, jacobian
+from tests.params import FREQS, model_params, free_parameters
+
+RTOL = 1e-6
+
+
+@pytest.mark.parametrize('dr_method', [False, True])
+@pytest.mark.parametrize('weighting', [1, 2, 3, 4, 5])
+@pytest.mark.parametrize('model', sorted(jacobian.MODEL_JACOBIANS))
+def test_cost_jacobian_matches_finite_differences(model, weighting, dr_method):
+    params = model_params(model)
+    free = free_parameters(params)
+    calc_func = models.MODELS[model]['func']
+    z_data = calc_func(params, FREQS) * (1.0 + 0.01 * np.cos(np.arange(FREQS.size)))
+
+    guess = np.array([1.1 * params[name] for name in free])
+    pars = None
+    if dr_method:
+        guess, pars = np.ones(len(free)), guess
+
+    error = jacobian.check_jacobian(guess, z_data, FREQS, weighting, calc_func, None, None, pars, free, params,
+                                    jac_func=jacobian.MODEL_JACOBIANS[model])
+    assert error < RTOL
@@ -0,0 +1,21 @@
+"""
+Fused kernels (models/kernels.py) against the NumPy models, see benchmarks/bench_kernels.py; without Numba the
+kernels run as plain Python
+"""
+import os
+import pytest
+from models import models
+from benchmarks.bench_kernels import RTOL, check_model
+from tests.params import FREQS, model_params
+
+
+@pytest.mark.skipif(bool(os.environ.get('PYPHYEIS_BACKEND')), reason='backend selected by PYPHYEIS_BACKEND')
+def test_numpy_is_the_default_backend():
+    assert models.BACKEND == 'numpy'
+
+
+@pytest.mark.parametrize('model', sorted(models.MODELS))
+def test_kernels_match_numpy_models(model):
+    # one spectrum, a batch of parameter sets, a column of frequencies
+    differences = check_model(model, model_params(model), FREQS, 8)
+    assert max(differences) < RTOL
@@ -0,0 +1,44 @@
+"""
+Multi-start fits (engine.Fitter.fit_multistart): starts ending at the same parameters are one minimum, minima of
+the same chi-square are kept apart and flagged degenerate
+"""
+import numpy as np
+from models import models, engine
+from tests.params import FREQS, HALF_CELL, FULL_CELL
+
+HALF_CELL_MODEL = 'Barsoukov-Pham-Lee_1D'
+FULL_CELL_MODEL = 'Barsoukov-Pham-Lee_1D_Full cell'
+N_STARTS = 5
+
+
+def test_same_parameters():
+    assert engine.same_parameters([1e-20, 5.0], [1.0005e-20, 5.002], 1e-3)
+    assert not engine.same_parameters([1e-20, 5.0], [1.1e-20, 5.0], 1e-3)
+    # signed and zero values compared relative to their value
+    assert engine.same_parameters([-0.5, 0.0, 2.0], [-0.50049, 0.0, 2.0], 1e-3)
+    assert not engine.same_parameters([-0.5, 2.0], [0.5, 2.0], 1e-3)
+
+
+def test_starts_ending_at_one_minimum():
+    z_data = models.MODELS[HALF_CELL_MODEL]['func'](HALF_CELL, FREQS)
+    result = engine.fit(HALF_CELL_MODEL, FREQS, z_data, HALF_CELL, ['r_ct', 'c_dl'], n_starts=N_STARTS)
+    assert len(result.minima) == 1
+    assert result.minima[0]['count'] == N_STARTS
+    assert not result.minima[0]['degenerate']
+
+
+def test_minima_of_same_chisqr_kept_apart():
+    # the stray L || R is a short circuit whatever l_str: its value is not determined
+    params = dict(FULL_CELL, r_str=1e-20)
+    z_data = models.MODELS[FULL_CELL_MODEL]['func'](params, FREQS)
+    z_data = z_data * (1.0 + 1e-3 * np.random.default_rng(5).standard_normal(z_data.size))
+    result = engine.fit(FULL_CELL_MODEL, FREQS, z_data, params, ['r_ct', 'l_str'], n_starts=N_STARTS)
+    assert len(result.minima) == N_STARTS
+    assert sum(minimum['count'] for minimum in result.minima) == N_STARTS
+    assert all(minimum['degenerate'] for minimum in result.minima)
+    chisqr = [minimum['chisqr'] for minimum in result.minima]
+    assert chisqr == sorted(chisqr)
+    assert result.chisqr == chisqr[0]
+    assert result.params['l_str'] == result.minima[0]['params']['l_str']
+    r_ct = [minimum['params']['r_ct'] for minimum in result.minima]
+    np.testing.assert_allclose(r_ct, r_ct[0], rtol=1e-6)
@@ -0,0 +1,58 @@
+"""
+Ragged spectra (models/ragged.py): spectra of unequal lengths packed with offsets and unpacked again
+"""
+import numpy as np
+import pytest
+from models.ragged import RaggedSpectra
+
+SIZES = [5, 0, 3, 8]
+
+
+def make_spectra():
+    spectra = []
+    for idx, n_points in enumerate(SIZES):
+        f = np.logspace(5, -2, n_points)
+        spectra.append((f, (idx + 1.0) * (1.0 + 10.0 / (1.0 + 1j * f))))
+    return spectra
+
+
+def test_pack_and_unpack():
+    spectra = make_spectra()
+    ragged = RaggedSpectra.from_spectra(spectra, ids=['a', 'b', 'c', 'd'], conditions=[280.0, 290.0, 300.0, 310.0])
+    assert len(ragged) == len(SIZES)
+    np.testing.assert_array_equal(ragged.offsets, np.concatenate([[0], np.cumsum(SIZES)]))
+    for idx, (f, z) in enumerate(spectra):
+        f_packed, z_packed = ragged.spectrum(idx)
+        np.testing.assert_array_equal(f_packed, f)
+        np.testing.assert_array_equal(z_packed, z)
+        np.testing.assert_array_equal(ragged.split(ragged.z)[idx], z)
+    assert ragged.index('c') == 2
+    np.testing.assert_array_equal(ragged.point_conditions(), np.repeat([280.0, 290.0, 300.0, 310.0], SIZES))
+
+
+def test_segment_sum():
+    ragged = RaggedSpectra.from_spectra(make_spectra())
+    values = np.arange(sum(SIZES), dtype=np.float64)
+    np.testing.assert_array_equal(ragged.segment_sum(values), [np.sum(part) for part in ragged.split(values)])
+    # real and imaginary rows of each point
+    residuals = np.repeat(values, 2)
+    np.testing.assert_array_equal(ragged.segment_sum(residuals, stride=2), 2 * ragged.segment_sum(values))
+
+
+def test_keep():
+    spectra = make_spectra()
+    ragged = RaggedSpectra.from_spectra(spectra, ids=['a', 'b', 'c', 'd'])
+    mask = ragged.f > 1.0
+    kept = ragged.keep(mask)
+    assert kept.ids == ragged.ids
+    for idx, (f, z) in enumerate(spectra):
+        f_kept, z_kept = kept.spectrum(idx)
+        np.testing.assert_array_equal(f_kept, f[f > 1.0])
+        np.testing.assert_array_equal(z_kept, z[f > 1.0])
+
+
+def test_offsets_must_split_the_points():
+    with pytest.raises(ValueError):
+        RaggedSpectra(np.zeros(4), np.zeros(4), [0, 3, 2, 4])
+    with pytest.raises(ValueError):
+        RaggedSpectra(np.zeros(4), np.zeros(4), [0, 2, 3])
@@ -0,0 +1,45 @@
+"""
+Spectrum files (models/readers.py): numeric blocks, malformed lines, the parsed-file cache
+"""
+import numpy as np
+import pytest
+from models import readers
+
+ROWS = np.array([[1e5, 6.5, -0.25], [1e2, 12.0, -8.5], [1e-2, 140.0, -60.0]])
+
+
+def data_lines(rows, sep='\t', extra=''):
+    return [sep.join('{:.17g}'.format(value) for value in row) + extra for row in rows]
+
+
+def test_parse_columns():
+    text = '\n'.join(data_lines(ROWS)) + '\n'
+    np.testing.assert_array_equal(readers.parse_columns(text), ROWS)
+    # blank lines, Windows line ends and extra columns
+    text = '\r\n'.join(data_lines(ROWS, ' ', ' 0.5')) + '\r\n\r\n'
+    np.testing.assert_array_equal(readers.parse_columns(text), ROWS)
+    assert readers.parse_columns('\n \n').shape == (0, 3)
+
+
+def test_parse_columns_ragged_extra_columns():
+    text = '1 2 3 4\n5 6 7\n8 9 10 11 12 13\n'
+    np.testing.assert_array_equal(readers.parse_columns(text), [[1, 2, 3], [5, 6, 7], [8, 9, 10]])
+
+
+@pytest.mark.parametrize('text', ['1 2 3\n4 5\n', '1 2\n3 4\n', '1 2 3\n4 5 x\n7 8 9\n', '1 2 3\n4 5 6\nx y z\n',
+                                  '1 2 3\n4,5,6\n'])
+def test_parse_columns_malformed_line(text):
+    with pytest.raises(ValueError, match='Data line'):
+        readers.parse_columns(text)
+
+
+def test_read_file_round_trip(tmp_path):
+    path = tmp_path / 'spectrum.dat'
+    header = ['header', '298.15', '', '', '', '', 'freq\tZre\tZim']
+    path.write_text('\n'.join(header + data_lines(ROWS)) + '\n')
+    entry = readers.read_file(str(path))
+    assert entry['temperature'] == 298.15
+    assert entry['name'] == 'spectrum.dat'
+    np.testing.assert_array_equal(entry['f'], ROWS[:, 0])
+    np.testing.assert_array_equal(entry['z'], ROWS[:, 1] + 1j * ROWS[:, 2])
+    assert readers.read_file(str(path)) is entry
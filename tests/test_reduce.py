@@ -0,0 +1,67 @@
+"""
+Circuit reduction (models.reduce_circuit): each dead element within DEAD_RTOL of the full model, kept when one of
+its parameters is free, and the full circuit fitted again when the fitted values bring an element back
+"""
+import numpy as np
+import pytest
+from models import models, engine
+from tests.params import FREQS, FULL_CELL, model_params
+
+# values of the parameters of each element (DEAD_ELEMENTS) making it an open or short circuit; the placeholders
+# and the stray of the half cells have none
+DEAD_VALUES = {
+    'stray': {'r_str': 1e-20},
+    'c_dl': {'c_dl': 1e-20},
+    'cdl_hn': {},
+    'q_w_open': {'q_w': 1e-20},
+    'q_w_short': {'q_w': 1e20},
+    'dx15': {'r_+||': 1e-20, 'r_-||': 1e-20, 'r_c_liq': 1e-20, 'r_a_liq': 1e-20},
+    'dx15_c': {},
+    'dx15_r3': {},
+    'anode': {'r_ct_li': 1e-20},
+    'anode_c': {'c_dl_li': 1e-20},
+}
+CASES = [(model, element) for model in sorted(models.MODELS) for element in models.DEAD_ELEMENTS
+         if models.circuit_kind(model) in element['circuits']]
+IDS = ['{}-{}'.format(model, element['name']) for model, element in CASES]
+
+
+def dead_params(model, element):
+    params = model_params(model)
+    params.update((name, value) for name, value in DEAD_VALUES[element['name']].items() if name in params)
+    return params
+
+
+@pytest.mark.parametrize('model, element', CASES, ids=IDS)
+def test_dead_element_within_rtol(model, element):
+    mdl = models.MODELS[model]
+    params = dead_params(model, element)
+    pars = models.parvals_to_array(params, mdl['params'])
+    with np.errstate(all='ignore'):
+        z_full = mdl['batch'](pars, FREQS)[0]
+        z_reduced = mdl['batch'](pars, FREQS, dead=(element['name'],))[0]
+    assert models.model_change(z_full, z_reduced) <= models.DEAD_RTOL
+    assert element['name'] in models.reduce_circuit(model, params, ['r_ct'], FREQS).dead
+
+
+@pytest.mark.parametrize('model, element', [case for case in CASES if case[1]['params']],
+                         ids=[case_id for case_id, case in zip(IDS, CASES) if case[1]['params']])
+def test_element_with_free_parameter_kept(model, element):
+    params = dead_params(model, element)
+    for name in element['params']:
+        assert element['name'] not in models.reduce_circuit(model, params, ['r_ct', name], FREQS).dead
+
+
+def test_full_circuit_fitted_when_element_comes_back():
+    model = 'Barsoukov-Pham-Lee_1D_Full cell'
+    # the anode Cdl is an open circuit at the initial r_ct_li, not at the fitted one
+    params = dict(FULL_CELL, c_dl_li=1e-20)
+    fitted = dict(params, r_ct_li=1e4)
+    circuit = models.reduce_circuit(model, params, ['r_ct_li'], FREQS)
+    assert 'anode_c' in circuit.dead
+    assert circuit.deviation(params, FREQS) <= models.DEAD_RTOL < circuit.deviation(fitted, FREQS)
+
+    z_data = models.MODELS[model]['func'](fitted, FREQS)
+    result = engine.fit(model, FREQS, z_data, params, ['r_ct_li'])
+    assert 'no element removed' in result.circuit
+    np.testing.assert_allclose(result.params['r_ct_li'], 1e4, rtol=1e-9)
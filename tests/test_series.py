@@ -0,0 +1,38 @@
+"""
+Series fits (engine.fit_series): a warm start that diverges is fitted again from the template
+"""
+import numpy as np
+from models import models, engine
+from tests.params import FREQS, HALF_CELL
+
+HALF_CELL_MODEL = 'Barsoukov-Pham-Lee_1D'
+FREE = ['r_ct', 'c_dl']
+# from the template, the first spectrum converges in a few evaluations, but the second one does not converge from
+# the optimum of the first one within NITERS evaluations
+FIRST = dict(HALF_CELL, r_ct=0.2 * HALF_CELL['r_ct'])
+NITERS = 30
+
+
+def test_diverged_warm_start_restarts_from_template():
+    func = models.MODELS[HALF_CELL_MODEL]['func']
+    spectra = [(FREQS, func(FIRST, FREQS)), (FREQS, func(HALF_CELL, FREQS))]
+    warm = engine.fit(HALF_CELL_MODEL, FREQS, spectra[1][1], FIRST, FREE, niters=NITERS)
+    assert not warm.success
+
+    series = engine.fit_series(HALF_CELL_MODEL, spectra, [298.15, 308.15], HALF_CELL, FREE, names=['a', 'b'],
+                               niters=NITERS)
+    assert series.starts == ['fresh', 'restart']
+    assert all(result.success for result in series.results)
+    np.testing.assert_allclose(series.values('r_ct'), [FIRST['r_ct'], HALF_CELL['r_ct']], rtol=1e-6)
+    assert series.results[1].chisqr < warm.chisqr
+
+    cols, rows = series.table()
+    assert [row[cols.index('start')] for row in rows] == ['fresh', 'restart']
+    assert '1 restarts' in repr(series)
+
+
+def test_converged_warm_start_is_kept():
+    func = models.MODELS[HALF_CELL_MODEL]['func']
+    spectra = [(FREQS, func(HALF_CELL, FREQS)), (FREQS, func(FIRST, FREQS))]
+    series = engine.fit_series(HALF_CELL_MODEL, spectra, [298.15, 308.15], HALF_CELL, FREE, niters=NITERS)
+    assert series.starts == ['fresh', 'warm']
@@ -0,0 +1,73 @@
+"""
+Spectrum store (models/store.py): appended spectra read back, selection, recovery from an interrupted append
+"""
+import os
+import numpy as np
+import pytest
+from models import store
+
+
+def make_spectra():
+    spectra = []
+    for idx, (n_points, temperature) in enumerate([(5, 298.15), (3, 308.15), (8, 318.15)]):
+        f = np.logspace(5, -2, n_points)
+        z = (idx + 1.0) * (1.0 + 10.0 / (1.0 + 1j * f))
+        spectra.append((f, z, temperature, 3.7 + 0.1 * idx, 'cycle_{:02d}.dat'.format(idx)))
+    return spectra
+
+
+def assert_spectra_equal(spectrum_store, spectra):
+    assert len(spectrum_store) == len(spectra)
+    for idx, (f, z, temperature, voltage, name) in enumerate(spectra):
+        f_stored, z_stored = spectrum_store.spectrum(idx)
+        np.testing.assert_array_equal(f_stored, f)
+        np.testing.assert_array_equal(z_stored, z)
+        assert spectrum_store.metadata(idx) == {'name': name, 'temperature': temperature, 'voltage': voltage}
+
+
+def test_extend_and_reload(tmp_path):
+    path = str(tmp_path / 'spectra.store')
+    spectra = make_spectra()
+    writer = store.SpectrumStore(path, mode='a')
+    writer.extend(spectra[:2])
+    reader = store.SpectrumStore(path)
+    assert_spectra_equal(reader, spectra[:2])
+    with pytest.raises(IOError):
+        reader.extend(spectra[2:])
+
+    writer.extend(spectra[2:])
+    assert len(reader) == 2
+    reader.reload()
+    assert_spectra_equal(reader, spectra)
+    assert_spectra_equal(store.SpectrumStore(path), spectra)
+
+
+def test_select(tmp_path):
+    spectrum_store = store.SpectrumStore(str(tmp_path / 'spectra.store'), mode='a')
+    spectrum_store.extend(make_spectra())
+    np.testing.assert_array_equal(spectrum_store.select(temperature=(300.0, 320.0)), [1, 2])
+    np.testing.assert_array_equal(spectrum_store.select(temperature=(298.15, 308.15)), [0, 1])
+    np.testing.assert_array_equal(spectrum_store.select(name='cycle_0[02]*'), [0, 2])
+    np.testing.assert_array_equal(spectrum_store.select(temperature=(300.0, 320.0), name='cycle_00*'), [])
+    np.testing.assert_array_equal(spectrum_store.select(), [0, 1, 2])
+
+
+def test_interrupted_append_is_dropped(tmp_path):
+    path = str(tmp_path / 'spectra.store')
+    spectra = make_spectra()
+    spectrum_store = store.SpectrumStore(path, mode='a')
+    spectrum_store.extend(spectra[:2])
+    # columns written, meta.json not updated
+    for file_name, dtype in store.COLUMNS.values():
+        with open(os.path.join(path, file_name), 'ab') as fp:
+            fp.write(np.arange(4, dtype=dtype).tobytes())
+    with open(os.path.join(path, 'names.txt'), 'a') as fp:
+        fp.write('\ninterrupted.dat')
+
+    assert_spectra_equal(store.SpectrumStore(path), spectra[:2])
+    spectrum_store = store.SpectrumStore(path, mode='a')
+    spectrum_store.extend(spectra[2:])
+    assert_spectra_equal(store.SpectrumStore(path), spectra)
+    n_points = sum(len(f) for f, _, _, _, _ in spectra)
+    assert os.path.getsize(os.path.join(path, 'freqs.f64')) == 8 * n_points
+    assert os.path.getsize(os.path.join(path, 'offsets.i64')) == 8 * (len(spectra) + 1)